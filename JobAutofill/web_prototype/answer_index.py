@@ -0,0 +1,226 @@
+"""Full-text answer search over a user's own profile text.
+
+Free-text questions on application forms ("Describe your experience with X")
+can only be answered from the employment responsibilities, education
+achievements and profile summary. Each of those is split into passages (one
+per bullet or line, long lines split at sentences) and kept in a per-user
+inverted index ranked with BM25.
+
+Indexes live in process memory, bounded by ANSWER_INDEX_USERS, and are tagged
+with the profile version they reflect. When the profile has moved on, the
+records named in the change log since that version are re-read and only their
+passages replaced or removed; the index is rebuilt from scratch only the first
+time, or when the log no longer reaches back that far.
+"""
+from collections import Counter, OrderedDict
+import heapq
+import math
+import re
+import threading
+
+from models import Education, Employment, get_profile_changes
+
+DEFAULT_INDEX_USERS = 256
+DEFAULT_RESULTS = 5
+MAX_RESULTS = 20
+# Lines longer than this are split into sentences
+MAX_PASSAGE_CHARS = 300
+MAX_QUERY_TERMS = 32
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# (section, model, text field, title builder) for every record field that is indexed
+RECORD_FIELDS = [
+    ('employment', Employment, 'responsibilities',
+     lambda job: ' at '.join(part for part in (job.job_title, job.company) if part)),
+    ('education', Education, 'achievements',
+     lambda school: ' at '.join(part for part in (school.degree, school.institution) if part)),
+]
+
+SUMMARY_SOURCE = ('profile', None, 'summary')
+
+STOP_WORDS = frozenset('''
+    a an and are as at be but by describe did do does experience for from had has have how i in into is it its
+    me my of on or our please so that the their them then there these they this to tell us was we were what
+    when where which who why will with you your
+'''.split())
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[+#]+|(?:\.[a-z0-9]+)+)?')
+_BULLET_RE = re.compile(r'^\s*(?:[-*•▪●]|\d+[.)])\s*')
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9])')
+
+def _stem(token):
+    # Just enough folding for "build"/"built"/"building" style variants to meet
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3 and not token.endswith('ss'):
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text):
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+def split_passages(text):
+    """Bullet points and lines of a text blob, with long lines split into sentences"""
+    passages = []
+    for line in (text or '').splitlines():
+        line = _BULLET_RE.sub('', line).strip()
+        if not line:
+            continue
+        if len(line) <= MAX_PASSAGE_CHARS:
+            passages.append(line)
+        else:
+            passages.extend(sentence for sentence in _SENTENCE_RE.split(line) if sentence)
+    return passages
+
+class UserIndex:
+    """BM25 inverted index over one user's passages, updated one source at a time"""
+
+    def __init__(self, version):
+        self.version = version
+        self.lock = threading.Lock()
+        self._next_id = 0
+        # passage id -> (source, text, length)
+        self._passages = {}
+        # (section, record_id, field) -> (title, [passage ids])
+        self._sources = {}
+        # term -> {passage id: term frequency}
+        self._postings = {}
+        self._total_length = 0
+
+    def replace_source(self, source, title, text):
+        """Index a field's text in place of whatever was indexed for it before"""
+        self.remove_source(source)
+        ids = []
+        for passage in split_passages(text):
+            terms = Counter(tokenize(passage))
+            if not terms:
+                continue
+            passage_id = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self._passages[passage_id] = (source, passage, length)
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[passage_id] = count
+            ids.append(passage_id)
+        if ids:
+            self._sources[source] = (title, ids)
+
+    def remove_source(self, source):
+        _, ids = self._sources.pop(source, (None, ()))
+        for passage_id in ids:
+            _, text, length = self._passages.pop(passage_id)
+            self._total_length -= length
+            for term in set(tokenize(text)):
+                postings = self._postings[term]
+                del postings[passage_id]
+                if not postings:
+                    del self._postings[term]
+
+    def remove_record(self, section, record_id):
+        for source in [source for source in self._sources if source[:2] == (section, record_id)]:
+            self.remove_source(source)
+
+    def search(self, query, limit):
+        """Best passages for a query, highest BM25 score first, skipping repeated text"""
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        count = len(self._passages)
+        if not terms or not count:
+            return []
+        # Length normalization is K1 * (1 - B + B * length / average length)
+        constant = K1 * (1 - B)
+        per_token = K1 * B * count / self._total_length
+        passages = self._passages
+        scores = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)) * (K1 + 1)
+            for passage_id, frequency in postings.items():
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * frequency / (
+                    frequency + constant + per_token * passages[passage_id][2])
+
+        results = []
+        seen = set()
+        for passage_id in heapq.nlargest(limit * 4, scores, key=scores.get):
+            (section, record_id, field), text, _ = passages[passage_id]
+            if text in seen:
+                continue
+            seen.add(text)
+            results.append({'text': text, 'score': round(scores[passage_id], 4), 'section': section, 'id': record_id,
+                            'field': field, 'source': self._sources[(section, record_id, field)][0]})
+            if len(results) == limit:
+                break
+        return results
+
+def _index_records(index, section, field, title, records):
+    for record in records:
+        index.replace_source((section, record.id, field), title(record), getattr(record, field))
+
+def build_index(user_id, profile):
+    """Index every indexed field of the user's profile from scratch"""
+    index = UserIndex(profile.version)
+    index.replace_source(SUMMARY_SOURCE, 'Profile summary', profile.summary)
+    for section, model, field, title in RECORD_FIELDS:
+        _index_records(index, section, field, title, model.query.filter_by(user_id=user_id).order_by(model.pk).all())
+    return index
+
+def apply_changes(index, user_id, profile):
+    """Bring an index up to the profile's version from the change log"""
+    changes = get_profile_changes(user_id, index.version)
+    if ('profile', None) in changes:
+        index.replace_source(SUMMARY_SOURCE, 'Profile summary', profile.summary)
+    for section, model, field, title in RECORD_FIELDS:
+        record_ids = [record_id for (change_section, record_id), deleted in changes.items()
+                      if change_section == section]
+        if not record_ids:
+            continue
+        records = model.query.filter(model.user_id == user_id, model.id.in_(record_ids)).all()
+        # Deleted records, and records logged as changed but gone by now, leave the index
+        found = {record.id for record in records}
+        for record_id in record_ids:
+            if record_id not in found:
+                index.remove_record(section, record_id)
+        _index_records(index, section, field, title, records)
+    index.version = profile.version
+
+class AnswerIndexes:
+    """Bounded LRU of per-user indexes"""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, user_id, profile, query, limit=DEFAULT_RESULTS):
+        """Ranked passages for the query from the user's profile as of profile.version"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+        if index is None or index.version > profile.version or index.version < profile.changes_compacted_version:
+            index = build_index(user_id, profile)
+            self._store(user_id, index)
+        with index.lock:
+            if index.version < profile.version:
+                apply_changes(index, user_id, profile)
+            return index.search(query, limit)
+
+    def _store(self, user_id, index):
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+def init_app(app):
+    indexes = AnswerIndexes(app.config.get('ANSWER_INDEX_USERS', DEFAULT_INDEX_USERS))
+    app.extensions['answer_index'] = indexes
+    return indexes
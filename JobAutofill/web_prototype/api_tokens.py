@@ -0,0 +1,183 @@
+"""Short-lived, scoped bearer tokens for the extension and iOS app.
+
+A logged-in web session mints a token with POST /api/tokens. API views opt in
+with @require_scope; on those views an "Authorization: Bearer <token>" header
+authenticates the request without opening the session cookie. Other views
+ignore bearer tokens, so a token never grants access to the HTML pages.
+
+A token is base64url(JSON claims) + "." + base64url(HMAC-SHA256 signature),
+signed with a key derived from SECRET_KEY and checked with
+hmac.compare_digest. Tokens are stateless, so they stay valid until they
+expire; keep API_TOKEN_TTL short. Verified tokens are kept in a small TTL
+cache, so a busy client's repeated calls skip decoding entirely.
+"""
+import base64
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+from flask import _request_ctx_stack, current_app, g, jsonify, request
+
+DEFAULT_TTL = 15 * 60
+MAX_TTL = 60 * 60
+VERIFIED_CACHE_SIZE = 4096
+# Verified tokens are re-checked at least this often, even if they live longer
+VERIFIED_CACHE_TTL = 60
+
+SCOPES = {'profile:read', 'profile:write', 'applications:read', 'fill_plans:read', 'fill_plans:write',
+          'fill_reports:write'}
+DEFAULT_SCOPES = ['profile:read']
+
+class TTLCache:
+    """Bounded LRU whose entries expire after ttl seconds, or at an explicit deadline"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, expires_in=None):
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class TokenError(ValueError):
+    """Raised for a malformed, forged or expired token"""
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+class TokenSigner:
+    """Issues and verifies tokens for one app, with its own cache of verified tokens"""
+
+    def __init__(self, secret_key):
+        # Derived rather than used directly, so a token can never double as a session signature
+        self._key = hmac.new(secret_key.encode('utf-8'), b'jobautofill-api-token', hashlib.sha256).digest()
+        self._verified = TTLCache(VERIFIED_CACHE_SIZE, VERIFIED_CACHE_TTL)
+
+    def _sign(self, claims_text):
+        return _b64encode(hmac.new(self._key, claims_text.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, user_id, scopes, ttl):
+        """Return (token, expiry timestamp) for the user with the given scopes"""
+        expires_at = int(time.time()) + ttl
+        claims = {'sub': user_id, 'scp': sorted(scopes), 'exp': expires_at, 'jti': secrets.token_hex(8)}
+        claims_text = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f'{claims_text}.{self._sign(claims_text)}', expires_at
+
+    def verify(self, token):
+        """Return (user_id, frozenset of scopes) for a valid token; raises TokenError otherwise"""
+        cached = self._verified.get(token)
+        if cached is not None:
+            user_id, scopes, expires_at = cached
+            if expires_at > time.time():
+                return user_id, scopes
+            raise TokenError('Token has expired')
+
+        if not token.isascii():
+            raise TokenError('Token is malformed')
+        claims_text, _, signature = token.partition('.')
+        # Compare the full signatures in constant time before looking at the claims
+        if not signature or not hmac.compare_digest(signature, self._sign(claims_text)):
+            raise TokenError('Token signature is invalid')
+        try:
+            claims = json.loads(_b64decode(claims_text))
+            user_id, scopes, expires_at = claims['sub'], frozenset(claims['scp']), claims['exp']
+        except (ValueError, KeyError, TypeError):
+            raise TokenError('Token is malformed')
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            raise TokenError('Token has expired')
+        self._verified.set(token, (user_id, scopes, expires_at), expires_in=remaining)
+        return user_id, scopes
+
+def bearer_token(authorization):
+    """The token from an Authorization header value, or None"""
+    if authorization and authorization[:7].lower() == 'bearer ':
+        return authorization[7:].strip() or None
+    return None
+
+def require_scope(scope):
+    """Let token-authenticated requests into this view if the token has the scope
+
+    Session-authenticated requests are unaffected. Put it below @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            scopes = g.get('api_token_scopes')
+            if scopes is not None and scope not in scopes:
+                return _token_error(403, 'insufficient_scope', f'Token lacks the {scope} scope')
+            return view(*args, **kwargs)
+        wrapped.api_token_scope = scope
+        return wrapped
+    return decorator
+
+def _token_error(status, code, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['WWW-Authenticate'] = f'Bearer error="{code}"'
+    return response
+
+def init_app(app, load_user):
+    """Authenticate scoped API views from bearer tokens; load_user(user_id) returns the user object"""
+    signer = app.extensions['api_tokens'] = TokenSigner(app.config['SECRET_KEY'])
+
+    @app.before_request
+    def authenticate_bearer_token():
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'api_token_scope', None) is None:
+            return None
+        token = bearer_token(request.headers.get('Authorization'))
+        if token is None:
+            return None
+        try:
+            user_id, scopes = signer.verify(token)
+        except TokenError as e:
+            return _token_error(401, 'invalid_token', str(e))
+        g.api_token_scopes = scopes
+        # Where Flask-Login keeps the request's user; setting it skips loading the session
+        _request_ctx_stack.top.user = load_user(user_id)
+        return None
+
+def issue_for_request(user_id):
+    """Mint a token from a POST /api/tokens body of {"scopes": [...], "ttl": seconds}; returns (payload, error)"""
+    data = request.get_json(silent=True) or {}
+    scopes = data.get('scopes', DEFAULT_SCOPES)
+    if not isinstance(scopes, list) or not scopes or not all(scope in SCOPES for scope in scopes):
+        return None, f'scopes must be a non-empty list drawn from {sorted(SCOPES)}'
+    max_ttl = current_app.config.get('API_TOKEN_MAX_TTL', MAX_TTL)
+    ttl = data.get('ttl', current_app.config.get('API_TOKEN_TTL', DEFAULT_TTL))
+    if not isinstance(ttl, int) or isinstance(ttl, bool) or not 0 < ttl <= max_ttl:
+        return None, f'ttl must be between 1 and {max_ttl} seconds'
+    token, expires_at = current_app.extensions['api_tokens'].issue(user_id, scopes, ttl)
+    return {'token': token, 'token_type': 'Bearer', 'expires_at': expires_at, 'scopes': sorted(scopes)}, None
@@ -1,35 +1,118 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, session, send_from_directory, jsonify
-from flask_bootstrap import Bootstrap
+from flask import Flask, current_app, render_template, redirect, url_for, flash, request, session, send_file, send_from_directory, jsonify, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import os
 from datetime import datetime
 import json
 from werkzeug.utils import secure_filename
-import jinja2
-
-# Create Flask application
-app = Flask(__name__, instance_relative_config=True)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
-app.config['UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
-
-# Ensure the instance folder exists
-try:
-    os.makedirs(app.instance_path, exist_ok=True)
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-except OSError as e:
-    print(f"Error creating directories: {e}")
-
-# Initialize extensions
-bootstrap = Bootstrap(app)
-login_manager = LoginManager(app)
+import profile_cache
+import profile_writes
+import field_matching
+import option_index
+import page_prefetch
+import fill_plans
+import fill_reports
+import document_store
+import answer_index
+import upload_sweeper
+import api_tokens
+import metrics
+import structured_logging
+import template_cache
+import wire_formats
+from models import (db, init_db, new_record_id, Profile, Employment, Education, Document, Application, StoredFile, PERSONAL_INFO_FIELDS,
+                    get_profile, get_profile_version, bump_profile_version, log_profile_changes, get_profile_changes, get_employment_history, get_employment, get_education_history, get_education,
+                    get_documents, get_document, get_document_by_filename, adjust_profile_counts, bump_section_versions,
+                    get_recent_applications, push_recent_application, refresh_recent_applications,
+                    get_parse_job, get_pending_parse_jobs, fail_stale_parse_jobs, record_application, get_application, get_application_by_url, get_application_page,
+                    APPLICATIONS_PAGE_SIZE, MAX_APPLICATIONS_PAGE_SIZE)
+
+# Views are collected with @route and registered on every app built by create_app()
+_routes = []
+
+def route(rule, **options):
+    """Record a view for create_app(); takes the same arguments as Flask.route"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+login_manager = LoginManager()
 login_manager.login_view = 'login'
 
+def create_app(config=None):
+    """Create and configure the Flask application; config overrides the environment defaults"""
+    app = Flask(__name__, instance_relative_config=True)
+    app.request_class = document_store.UploadRequest
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
+    app.config['UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+    # Let a fronting nginx/Apache send stored documents with X-Sendfile instead of streaming them through Python
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'jobautofill.db'))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Per-request stack sampling via the X-Profile header; leave off in production
+    app.config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED') == '1'
+    # When set, /metrics requires "Authorization: Bearer <token>"
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['LOG_FILE'] = os.environ.get('LOG_FILE')
+    # Our templates load Bootstrap from the CDN, so Flask-Bootstrap is only set up when asked for
+    app.config['USE_FLASK_BOOTSTRAP'] = os.environ.get('USE_FLASK_BOOTSTRAP') == '1'
+    # Size of the thread pool asgi.py runs database work and bridged Flask requests on
+    app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 32))
+    # PATCH /api/profile autosaves are written once the user pauses this long, and at most this late
+    app.config['PATCH_FLUSH_DELAY'] = float(os.environ.get('PATCH_FLUSH_DELAY', 1.0))
+    app.config['PATCH_MAX_FLUSH_DELAY'] = float(os.environ.get('PATCH_MAX_FLUSH_DELAY', 5.0))
+    # Lifetime of bearer tokens from POST /api/tokens when the client does not ask for one, and the cap
+    app.config['API_TOKEN_TTL'] = int(os.environ.get('API_TOKEN_TTL', 15 * 60))
+    app.config['API_TOKEN_MAX_TTL'] = int(os.environ.get('API_TOKEN_MAX_TTL', 60 * 60))
+    # Bytes of documents each user may store (0 for no limit)
+    app.config['UPLOAD_QUOTA_BYTES'] = int(os.environ.get('UPLOAD_QUOTA_BYTES', 100 * 1024 * 1024))
+    # Seconds between upload store sweeps (0 disables the background sweeper), and how old an orphan must be
+    app.config['UPLOAD_SWEEP_INTERVAL'] = int(os.environ.get('UPLOAD_SWEEP_INTERVAL', 60 * 60))
+    app.config['UPLOAD_SWEEP_GRACE'] = int(os.environ.get('UPLOAD_SWEEP_GRACE', 60 * 60))
+    # Threads reading job pages in the background (0 disables prefetching); private addresses are for local testing
+    app.config['PREFETCH_WORKERS'] = int(os.environ.get('PREFETCH_WORKERS', 8))
+    app.config['PREFETCH_ALLOW_PRIVATE'] = os.environ.get('PREFETCH_ALLOW_PRIVATE') == '1'
+    if config:
+        app.config.update(config)
+    
+    # Ensure the instance folder exists
+    try:
+        os.makedirs(app.instance_path, exist_ok=True)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    except OSError as e:
+        print(f"Error creating directories: {e}")
+    
+    # Initialize extensions
+    init_db(app)
+    metrics.init_app(app)
+    structured_logging.init_app(app)
+    # Before any hook that reads current_user, so token requests never load the session
+    api_tokens.init_app(app, load_user)
+    profile_writes.init_app(app, apply_profile_patch)
+    profile_cache.init_app(app)
+    fill_reports.init_app(app)
+    answer_index.init_app(app)
+    upload_sweeper.init_app(app)
+    page_prefetch.init_app(app)
+    template_cache.init_app(app)
+    wire_formats.init_app(app)
+    login_manager.init_app(app)
+    if app.config['USE_FLASK_BOOTSTRAP']:
+        from flask_bootstrap import Bootstrap
+        Bootstrap(app)
+    
+    app.add_template_filter(nl2br_filter, 'nl2br')
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
 # Custom Jinja2 filters
-@app.template_filter('nl2br')
 def nl2br_filter(s):
     if s:
-        return jinja2.utils.markupsafe.Markup(s.replace('\n', '<br>'))
+        return template_cache.nl2br(s)
     return s
 
 # Mock user for demonstration purposes
@@ -45,27 +128,20 @@ class User(UserMixin):
     def check_password(self, password):
         return self.password == password
 
+# Users are looked up on every authenticated request, so recent ones are kept for a few minutes
+_users = api_tokens.TTLCache(maxsize=1024, ttl=300)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User(user_id)
-
-# Helper functions for session data
-def init_session_data():
-    """Initialize session data if it doesn't exist"""
-    if 'personal_info' not in session:
-        session['personal_info'] = {}
-    if 'employment_history' not in session:
-        session['employment_history'] = []
-    if 'education' not in session:
-        session['education'] = []
-    if 'documents' not in session:
-        session['documents'] = {'resumes': [], 'cover_letters': []}
-    if 'recent_applications' not in session:
-        session['recent_applications'] = []
-
-def get_profile_completion():
-    """Calculate profile completion percentage and section status"""
-    init_session_data()
+    user = _users.get(user_id)
+    if user is None:
+        user = _users.set(user_id, User(user_id))
+    return user
+
+# Helper functions for profile data
+def get_profile_completion(user_id):
+    """Calculate profile completion percentage and section status from the profile's stored counters"""
+    personal_info = get_profile(user_id)
     
     sections = {
         'personal_info': {'weight': 25, 'completed': 0, 'status': 'Not started'},
@@ -75,39 +151,29 @@ def get_profile_completion():
     }
     
     # Check personal info completion
-    if session['personal_info']:
-        required_fields = ['first_name', 'last_name', 'email', 'phone']
-        filled_required = sum(1 for field in required_fields if field in session['personal_info'] and session['personal_info'][field])
-        
-        if filled_required == len(required_fields):
-            sections['personal_info']['completed'] = 25
-            sections['personal_info']['status'] = 'Complete'
-        elif filled_required > 0:
-            sections['personal_info']['completed'] = int((filled_required / len(required_fields)) * 25)
-            sections['personal_info']['status'] = 'In progress'
+    required_fields = ['first_name', 'last_name', 'email', 'phone']
+    filled_required = sum(1 for field in required_fields if getattr(personal_info, field))
+    
+    if filled_required == len(required_fields):
+        sections['personal_info']['completed'] = 25
+        sections['personal_info']['status'] = 'Complete'
+    elif filled_required > 0:
+        sections['personal_info']['completed'] = int((filled_required / len(required_fields)) * 25)
+        sections['personal_info']['status'] = 'In progress'
     
     # Check employment history completion
-    if session['employment_history']:
-        employment_count = len(session['employment_history'])
-        if employment_count >= 1:
-            sections['employment']['completed'] = 25
-            sections['employment']['status'] = 'Complete'
-        else:
-            sections['employment']['completed'] = 0
-            sections['employment']['status'] = 'Not started'
+    if personal_info.employment_count > 0:
+        sections['employment']['completed'] = 25
+        sections['employment']['status'] = 'Complete'
     
     # Check education completion
-    if session['education']:
-        if len(session['education']) >= 1:
-            sections['education']['completed'] = 25
-            sections['education']['status'] = 'Complete'
-        else:
-            sections['education']['completed'] = 15
-            sections['education']['status'] = 'In progress'
+    if personal_info.education_count > 0:
+        sections['education']['completed'] = 25
+        sections['education']['status'] = 'Complete'
     
     # Check documents completion
-    has_resume = len(session['documents']['resumes']) > 0
-    has_cover_letter = len(session['documents']['cover_letters']) > 0
+    has_resume = personal_info.resume_count > 0
+    has_cover_letter = personal_info.cover_letter_count > 0
     
     if has_resume and has_cover_letter:
         sections['documents']['completed'] = 25
@@ -121,15 +187,70 @@ def get_profile_completion():
     
     return {
         'percentage': total_completion,
-        'sections': sections
+        'sections': sections,
+        'has_resume': has_resume,
+        'has_cover_letter': has_cover_letter,
+        'recent_applications': get_recent_applications(personal_info)
     }
 
+def profile_changed(user_id, *sections, changes=()):
+    """Bump the profile and section versions and drop cached API payloads after a write
+
+    changes are (section, record_id, deleted) entries for the delta sync log;
+    personal info edits are ('profile', None, False).
+    """
+    bump_profile_version(user_id)
+    if sections:
+        bump_section_versions(user_id, *sections)
+    if changes:
+        log_profile_changes(user_id, changes)
+    profile_cache.invalidate(user_id)
+
+def cors_headers(methods='GET,OPTIONS'):
+    return [
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Credentials', 'true'),
+        ('Access-Control-Allow-Headers', 'Content-Type,Authorization'),
+        ('Access-Control-Allow-Methods', methods)
+    ]
+
+def add_cors_headers(response, methods='GET,OPTIONS'):
+    """Enable CORS for the Chrome extension"""
+    for name, value in cors_headers(methods):
+        response.headers.add(name, value)
+    return response
+
+def cached_json_response(cache_key, version, build_payload):
+    """Serve a payload from the per-version cache in the negotiated format, answering conditional GETs with 304"""
+    cached = profile_cache.get_payload(cache_key, version)
+    if cached is None:
+        cached = profile_cache.store_payload(cache_key, version, build_payload())
+    body, etag, headers = wire_formats.represent(cache_key, version, cached, request.headers.get('Accept'),
+                                                 request.headers.get('Accept-Encoding'))
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.vary = 'Accept, Accept-Encoding'
+    else:
+        response = current_app.response_class(body, headers=headers)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return add_cors_headers(response)
+
 # Routes
-@app.route('/')
+@route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return current_app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+    return current_app.response_class(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -146,58 +267,40 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
-    init_session_data()
-    profile_data = get_profile_completion()
-    
-    # Get document status
-    has_resume = len(session['documents']['resumes']) > 0
-    has_cover_letter = len(session['documents']['cover_letters']) > 0
-    
-    # Get recent applications (limit to 3)
-    recent_applications = session.get('recent_applications', [])
-    if recent_applications:
-        recent_applications = sorted(recent_applications, key=lambda x: x.get('date', ''), reverse=True)[:3]
+    user_id = current_user.get_id()
+    profile_data = get_profile_completion(user_id)
     
     return render_template(
         'dashboard.html',
         completion_percentage=profile_data['percentage'],
         completion_sections=profile_data['sections'],
-        has_resume=has_resume,
-        has_cover_letter=has_cover_letter,
-        recent_applications=recent_applications
+        has_resume=profile_data['has_resume'],
+        has_cover_letter=profile_data['has_cover_letter'],
+        recent_applications=profile_data['recent_applications'],
+        section_versions=get_profile(user_id).section_versions()
     )
 
-@app.route('/profile', methods=['GET', 'POST'])
+@route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    init_session_data()
+    personal_info = get_profile(current_user.get_id())
     
     if request.method == 'POST':
-        # Save personal info to session
-        session['personal_info'] = {
-            'first_name': request.form.get('first_name'),
-            'last_name': request.form.get('last_name'),
-            'email': request.form.get('email'),
-            'phone': request.form.get('phone'),
-            'address': request.form.get('address'),
-            'city': request.form.get('city'),
-            'state': request.form.get('state'),
-            'zip': request.form.get('zip'),
-            'linkedin': request.form.get('linkedin'),
-            'website': request.form.get('website'),
-            'summary': request.form.get('summary')
-        }
-        session.modified = True
+        # Save personal info to the database
+        for field in PERSONAL_INFO_FIELDS:
+            setattr(personal_info, field, request.form.get(field))
+        profile_changed(personal_info.user_id, changes=[('profile', None, False)])
+        db.session.commit()
         flash('Profile updated successfully!', 'success')
         
         # Check if the user clicked "Save and Continue"
@@ -206,56 +309,59 @@ def profile():
         else:
             return redirect(url_for('dashboard'))
     
-    return render_template('profile.html', personal_info=session.get('personal_info', {}))
+    return render_template('profile.html', personal_info=personal_info.to_dict())
 
-@app.route('/employment', methods=['GET', 'POST'])
+@route('/employment', methods=['GET', 'POST'])
 @login_required
 def employment():
-    init_session_data()
+    user_id = current_user.get_id()
     
     if request.method == 'POST':
         # Add new employment entry
-        new_job = {
-            'job_title': request.form.get('job_title'),
-            'company': request.form.get('company'),
-            'start_date': request.form.get('start_date'),
-            'end_date': request.form.get('end_date') if not request.form.get('current_job') else 'Present',
-            'current_job': 'current_job' in request.form,
-            'location': request.form.get('location'),
-            'responsibilities': request.form.get('responsibilities'),
-            'id': datetime.now().strftime('%Y%m%d%H%M%S')  # Simple ID for editing/deleting
-        }
+        new_job = Employment(
+            user_id=user_id,
+            job_title=request.form.get('job_title'),
+            company=request.form.get('company'),
+            start_date=request.form.get('start_date'),
+            end_date=request.form.get('end_date') if not request.form.get('current_job') else 'Present',
+            current_job='current_job' in request.form,
+            location=request.form.get('location'),
+            responsibilities=request.form.get('responsibilities'),
+            id=new_record_id()
+        )
         
-        session['employment_history'].append(new_job)
-        session.modified = True
+        db.session.add(new_job)
+        adjust_profile_counts(user_id, employment_count=1)
+        profile_changed(user_id, 'employment', changes=[('employment', new_job.id, False)])
+        db.session.commit()
         flash('Employment history updated successfully!', 'success')
         return redirect(url_for('employment'))
     
-    return render_template('employment.html', employment_history=session.get('employment_history', []))
+    # The list is only queried when its cached fragment is stale
+    return render_template(
+        'employment.html',
+        employment_history=template_cache.LazySequence(lambda: get_employment_history(user_id)),
+        section_versions=get_profile(user_id).section_versions()
+    )
 
-@app.route('/delete_employment/<job_id>')
+@route('/delete_employment/<job_id>')
 @login_required
 def delete_employment(job_id):
-    init_session_data()
-    
-    # Filter out the job with the given ID
-    session['employment_history'] = [job for job in session['employment_history'] if job.get('id') != job_id]
-    session.modified = True
+    # Delete the job with the given ID
+    user_id = current_user.get_id()
+    deleted = Employment.query.filter_by(user_id=user_id, id=job_id).delete()
+    adjust_profile_counts(user_id, employment_count=-deleted)
+    profile_changed(user_id, 'employment', changes=[('employment', job_id, True)] if deleted else ())
+    db.session.commit()
     
     flash('Work experience deleted successfully!', 'success')
     return redirect(url_for('employment'))
 
-@app.route('/edit_employment/<job_id>', methods=['GET', 'POST'])
+@route('/edit_employment/<job_id>', methods=['GET', 'POST'])
 @login_required
 def edit_employment(job_id):
-    init_session_data()
-    
     # Find the job with the given ID
-    job_to_edit = None
-    for job in session['employment_history']:
-        if job.get('id') == job_id:
-            job_to_edit = job
-            break
+    job_to_edit = get_employment(current_user.get_id(), job_id)
     
     if job_to_edit is None:
         flash('Job not found!', 'danger')
@@ -263,72 +369,73 @@ def edit_employment(job_id):
     
     if request.method == 'POST':
         # Update job entry
-        job_to_edit.update({
-            'job_title': request.form.get('job_title'),
-            'company': request.form.get('company'),
-            'start_date': request.form.get('start_date'),
-            'end_date': request.form.get('end_date') if not request.form.get('current_job') else 'Present',
-            'current_job': 'current_job' in request.form,
-            'location': request.form.get('location'),
-            'responsibilities': request.form.get('responsibilities')
-        })
+        job_to_edit.job_title = request.form.get('job_title')
+        job_to_edit.company = request.form.get('company')
+        job_to_edit.start_date = request.form.get('start_date')
+        job_to_edit.end_date = request.form.get('end_date') if not request.form.get('current_job') else 'Present'
+        job_to_edit.current_job = 'current_job' in request.form
+        job_to_edit.location = request.form.get('location')
+        job_to_edit.responsibilities = request.form.get('responsibilities')
         
-        session.modified = True
+        profile_changed(job_to_edit.user_id, 'employment', changes=[('employment', job_to_edit.id, False)])
+        db.session.commit()
         flash('Employment history updated successfully!', 'success')
         return redirect(url_for('employment'))
     
     return render_template('edit_employment.html', job=job_to_edit)
 
-@app.route('/education', methods=['GET', 'POST'])
+@route('/education', methods=['GET', 'POST'])
 @login_required
 def education():
-    init_session_data()
+    user_id = current_user.get_id()
     
     if request.method == 'POST':
         # Add new education entry
-        new_education = {
-            'degree': request.form.get('degree'),
-            'field_of_study': request.form.get('field_of_study'),
-            'institution': request.form.get('institution'),
-            'start_date': request.form.get('start_date'),
-            'end_date': request.form.get('end_date') if not request.form.get('current_education') else 'Present',
-            'current_education': 'current_education' in request.form,
-            'location': request.form.get('location'),
-            'gpa': request.form.get('gpa'),
-            'achievements': request.form.get('achievements'),
-            'id': datetime.now().strftime('%Y%m%d%H%M%S')  # Simple ID for editing/deleting
-        }
+        new_education = Education(
+            user_id=user_id,
+            degree=request.form.get('degree'),
+            field_of_study=request.form.get('field_of_study'),
+            institution=request.form.get('institution'),
+            start_date=request.form.get('start_date'),
+            end_date=request.form.get('end_date') if not request.form.get('current_education') else 'Present',
+            current_education='current_education' in request.form,
+            location=request.form.get('location'),
+            gpa=request.form.get('gpa'),
+            achievements=request.form.get('achievements'),
+            id=new_record_id()
+        )
         
-        session['education'].append(new_education)
-        session.modified = True
+        db.session.add(new_education)
+        adjust_profile_counts(user_id, education_count=1)
+        profile_changed(user_id, 'education', changes=[('education', new_education.id, False)])
+        db.session.commit()
         flash('Education history updated successfully!', 'success')
         return redirect(url_for('education'))
     
-    return render_template('education.html', education_history=session.get('education', []))
+    return render_template(
+        'education.html',
+        education_history=template_cache.LazySequence(lambda: get_education_history(user_id)),
+        section_versions=get_profile(user_id).section_versions()
+    )
 
-@app.route('/delete_education/<edu_id>')
+@route('/delete_education/<edu_id>')
 @login_required
 def delete_education(edu_id):
-    init_session_data()
-    
-    # Filter out the education entry with the given ID
-    session['education'] = [edu for edu in session['education'] if edu.get('id') != edu_id]
-    session.modified = True
+    # Delete the education entry with the given ID
+    user_id = current_user.get_id()
+    deleted = Education.query.filter_by(user_id=user_id, id=edu_id).delete()
+    adjust_profile_counts(user_id, education_count=-deleted)
+    profile_changed(user_id, 'education', changes=[('education', edu_id, True)] if deleted else ())
+    db.session.commit()
     
     flash('Education entry deleted successfully!', 'success')
     return redirect(url_for('education'))
 
-@app.route('/edit_education/<edu_id>', methods=['GET', 'POST'])
+@route('/edit_education/<edu_id>', methods=['GET', 'POST'])
 @login_required
 def edit_education(edu_id):
-    init_session_data()
-    
     # Find the education entry with the given ID
-    edu_to_edit = None
-    for edu in session['education']:
-        if edu.get('id') == edu_id:
-            edu_to_edit = edu
-            break
+    edu_to_edit = get_education(current_user.get_id(), edu_id)
     
     if edu_to_edit is None:
         flash('Education entry not found!', 'danger')
@@ -336,28 +443,34 @@ def edit_education(edu_id):
     
     if request.method == 'POST':
         # Update education entry
-        edu_to_edit.update({
-            'degree': request.form.get('degree'),
-            'field_of_study': request.form.get('field_of_study'),
-            'institution': request.form.get('institution'),
-            'start_date': request.form.get('start_date'),
-            'end_date': request.form.get('end_date') if not request.form.get('current_education') else 'Present',
-            'current_education': 'current_education' in request.form,
-            'location': request.form.get('location'),
-            'gpa': request.form.get('gpa'),
-            'achievements': request.form.get('achievements')
-        })
+        edu_to_edit.degree = request.form.get('degree')
+        edu_to_edit.field_of_study = request.form.get('field_of_study')
+        edu_to_edit.institution = request.form.get('institution')
+        edu_to_edit.start_date = request.form.get('start_date')
+        edu_to_edit.end_date = request.form.get('end_date') if not request.form.get('current_education') else 'Present'
+        edu_to_edit.current_education = 'current_education' in request.form
+        edu_to_edit.location = request.form.get('location')
+        edu_to_edit.gpa = request.form.get('gpa')
+        edu_to_edit.achievements = request.form.get('achievements')
         
-        session.modified = True
+        profile_changed(edu_to_edit.user_id, 'education', changes=[('education', edu_to_edit.id, False)])
+        db.session.commit()
         flash('Education entry updated successfully!', 'success')
         return redirect(url_for('education'))
     
     return render_template('edit_education.html', edu=edu_to_edit)
 
-@app.route('/documents', methods=['GET', 'POST'])
+# A parse still queued after this many seconds was lost (e.g. by a restart) or hung, and is shown as failed
+DEFAULT_RESUME_PARSE_TIMEOUT = 10 * 60
+
+def expire_parse_jobs(user_id):
+    if fail_stale_parse_jobs(user_id, current_app.config.get('RESUME_PARSE_TIMEOUT', DEFAULT_RESUME_PARSE_TIMEOUT)):
+        db.session.commit()
+
+@route('/documents', methods=['GET', 'POST'])
 @login_required
 def documents():
-    init_session_data()
+    user_id = current_user.get_id()
     
     if request.method == 'POST':
         # Handle resume upload
@@ -365,23 +478,41 @@ def documents():
             file = request.files['resume']
             if file and file.filename != '':
                 filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                saved_filename = f"resume_{timestamp}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-                file.save(file_path)
+                doc_id = new_record_id()
+                saved_filename = f"resume_{doc_id}_{filename}"
+                try:
+                    sha256 = document_store.store_upload(file, user_id)
+                except document_store.QuotaExceeded as e:
+                    flash(str(e), 'danger')
+                    return redirect(url_for('documents'))
                 
-                # Save document info to session
-                resume_info = {
-                    'name': request.form.get('resume_name') or filename,
-                    'filename': saved_filename,
-                    'original_filename': filename,
-                    'upload_date': datetime.now().strftime('%B %d, %Y'),
-                    'id': timestamp
-                }
+                # Save document info to the database
+                resume_info = Document(
+                    user_id=user_id,
+                    doc_type='resume',
+                    name=request.form.get('resume_name') or filename,
+                    filename=saved_filename,
+                    original_filename=filename,
+                    upload_date=datetime.now().strftime('%B %d, %Y'),
+                    sha256=sha256,
+                    id=doc_id
+                )
                 
-                session['documents']['resumes'].append(resume_info)
-                session.modified = True
-                flash('Resume uploaded successfully!', 'success')
+                db.session.add(resume_info)
+                # Deferred so workers that never see an upload skip the parser's imports
+                import resume_parser
+                adjust_profile_counts(user_id, resume_count=1)
+                bump_section_versions(user_id, 'documents')
+                parse_job = resume_parser.create_job(user_id, resume_info)
+                db.session.commit()
+                
+                # Parse the resume in the background to propose profile entries
+                if parse_job is not None:
+                    resume_parser.start_job(parse_job, document_store.blob_path(resume_info.sha256),
+                                            resume_parser.resume_extension(resume_info))
+                    flash('Resume uploaded successfully! We\'re reading it to suggest profile entries.', 'success')
+                else:
+                    flash('Resume uploaded successfully!', 'success')
                 return redirect(url_for('documents'))
         
         # Handle cover letter upload
@@ -389,134 +520,235 @@ def documents():
             file = request.files['cover_letter']
             if file and file.filename != '':
                 filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                saved_filename = f"cover_letter_{timestamp}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-                file.save(file_path)
+                doc_id = new_record_id()
+                saved_filename = f"cover_letter_{doc_id}_{filename}"
+                try:
+                    sha256 = document_store.store_upload(file, user_id)
+                except document_store.QuotaExceeded as e:
+                    flash(str(e), 'danger')
+                    return redirect(url_for('documents'))
                 
-                # Save document info to session
-                cover_letter_info = {
-                    'name': request.form.get('cover_letter_name') or filename,
-                    'filename': saved_filename,
-                    'original_filename': filename,
-                    'upload_date': datetime.now().strftime('%B %d, %Y'),
-                    'id': timestamp
-                }
+                # Save document info to the database
+                cover_letter_info = Document(
+                    user_id=user_id,
+                    doc_type='cover_letter',
+                    name=request.form.get('cover_letter_name') or filename,
+                    filename=saved_filename,
+                    original_filename=filename,
+                    upload_date=datetime.now().strftime('%B %d, %Y'),
+                    sha256=sha256,
+                    id=doc_id
+                )
                 
-                session['documents']['cover_letters'].append(cover_letter_info)
-                session.modified = True
+                db.session.add(cover_letter_info)
+                adjust_profile_counts(user_id, cover_letter_count=1)
+                bump_section_versions(user_id, 'documents')
+                db.session.commit()
                 flash('Cover letter uploaded successfully!', 'success')
                 return redirect(url_for('documents'))
     
+    expire_parse_jobs(user_id)
     return render_template(
         'documents.html',
-        resumes=session['documents']['resumes'],
-        cover_letters=session['documents']['cover_letters']
+        resumes=template_cache.LazySequence(lambda: get_documents(user_id, 'resume')),
+        cover_letters=template_cache.LazySequence(lambda: get_documents(user_id, 'cover_letter')),
+        parse_jobs=[job.to_dict() for job in get_pending_parse_jobs(user_id)],
+        section_versions=get_profile(user_id).section_versions()
     )
 
-@app.route('/delete_document/<doc_type>/<doc_id>')
-@login_required
-def delete_document(doc_type, doc_id):
-    init_session_data()
+def resolve_parse_job(job_id, accept):
+    """Accept or reject a finished parse job's proposals (queued and failed jobs can only be dismissed)"""
+    user_id = current_user.get_id()
+    job = get_parse_job(user_id, job_id)
+    if job is None or job.status not in ('queued', 'done', 'failed') or (accept and job.status != 'done'):
+        return None
     
-    if doc_type == 'resume':
-        # Find the document to delete
-        for resume in session['documents']['resumes']:
-            if resume.get('id') == doc_id:
-                # Delete the file
-                try:
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], resume['filename'])
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-                
-                # Remove from session
-                session['documents']['resumes'] = [r for r in session['documents']['resumes'] if r.get('id') != doc_id]
-                session.modified = True
-                break
-        
-        flash('Resume deleted successfully!', 'success')
+    if accept:
+        import resume_parser
+        jobs, schools = resume_parser.apply_proposals(job)
+        changes = ([('profile', None, False)] + [('employment', record.id, False) for record in jobs]
+                   + [('education', record.id, False) for record in schools])
+        profile_changed(user_id, 'employment', 'education', changes=changes)
+    else:
+        job.status = 'rejected'
+    db.session.commit()
+    return job
+
+@route('/resume_proposals/<job_id>/<action>', methods=['POST'])
+@login_required
+def resume_proposals(job_id, action):
+    if action not in ('accept', 'reject'):
+        return redirect(url_for('documents'))
     
-    elif doc_type == 'cover_letter':
+    if resolve_parse_job(job_id, action == 'accept') is None:
+        flash('Resume suggestions not found!', 'danger')
+    elif action == 'accept':
+        flash('Resume suggestions added to your profile!', 'success')
+    else:
+        flash('Resume suggestions dismissed.', 'info')
+    return redirect(url_for('documents'))
+
+@route('/delete_document/<doc_type>/<doc_id>')
+@login_required
+def delete_document(doc_type, doc_id):
+    if doc_type in ('resume', 'cover_letter'):
         # Find the document to delete
-        for cover_letter in session['documents']['cover_letters']:
-            if cover_letter.get('id') == doc_id:
-                # Delete the file
-                try:
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], cover_letter['filename'])
+        user_id = current_user.get_id()
+        document = get_document(user_id, doc_type, doc_id)
+        if document is not None:
+            # Drop the document's reference; the sweeper deletes the file once nothing uses it
+            try:
+                if document.sha256:
+                    document_store.release(document.sha256, user_id)
+                else:
+                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], document.filename)
                     if os.path.exists(file_path):
                         os.remove(file_path)
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-                
-                # Remove from session
-                session['documents']['cover_letters'] = [cl for cl in session['documents']['cover_letters'] if cl.get('id') != doc_id]
-                session.modified = True
-                break
+            except OSError:
+                # The sweeper removes whatever file is left behind
+                current_app.logger.exception('Failed to delete document file',
+                                             extra={'fields': {'doc_type': doc_type, 'doc_id': doc_id}})
+            
+            # Remove from the database
+            db.session.delete(document)
+            adjust_profile_counts(user_id, **{f'{doc_type}_count': -1})
+            bump_section_versions(user_id, 'documents')
+            db.session.commit()
         
-        flash('Cover letter deleted successfully!', 'success')
+        if doc_type == 'resume':
+            flash('Resume deleted successfully!', 'success')
+        else:
+            flash('Cover letter deleted successfully!', 'success')
     
     return redirect(url_for('documents'))
 
-@app.route('/download_document/<filename>')
+# Stored documents are addressed by content hash and never change
+DOCUMENT_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+@route('/download_document/<filename>', methods=['GET', 'HEAD'])
 @login_required
 def download_document(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    document = get_document_by_filename(current_user.get_id(), filename)
+    if document is None or not document.sha256:
+        # Files uploaded before content-addressed storage live directly in the upload folder
+        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    
+    download_name = document.original_filename or filename
+    if request.method == 'HEAD':
+        import mimetypes
+        # Answer from the database alone without opening the file
+        stored_file = StoredFile.query.get(document.sha256)
+        if stored_file is None:
+            return current_app.response_class(status=404)
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        response.set_etag(document.sha256)
+        response.make_conditional(request)
+        if response.status_code == 200:
+            response.content_length = stored_file.size
+    else:
+        # send_file uses wsgi.file_wrapper (sendfile on servers that support it) or X-Sendfile,
+        # and answers Range and If-None-Match requests
+        response = send_file(document_store.blob_path(document.sha256), as_attachment=True,
+                             download_name=download_name, conditional=True, etag=document.sha256)
+    
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = DOCUMENT_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
 
-@app.route('/autofill', methods=['GET', 'POST'])
+@route('/autofill', methods=['GET', 'POST'])
 @login_required
 def autofill():
-    init_session_data()
+    user_id = current_user.get_id()
     
     if request.args.get('job_url'):
         job_url = request.args.get('job_url')
         
-        # Add to recent applications
-        new_application = {
-            'url': job_url,
-            'date': datetime.now().strftime('%B %d, %Y'),
-            'title': f"Job Application at {job_url.split('/')[2]}",
-            'id': datetime.now().strftime('%Y%m%d%H%M%S')
-        }
+        # Add to recent applications (resubmitting a URL moves it back to the top)
+        new_application = record_application(user_id, job_url)
+        prefetch = page_prefetch.request_prefetch(new_application)
+        push_recent_application(user_id, new_application)
+        bump_section_versions(user_id, 'applications')
+        db.session.commit()
         
-        session['recent_applications'].append(new_application)
-        session.modified = True
+        # Read the job page in the background so its form is ready by the time the user gets to it
+        if prefetch:
+            page_prefetch.submit([new_application])
         
         # Redirect to the perform_autofill route which will handle the actual autofill
         return redirect(url_for('perform_autofill', job_url=job_url))
     
-    return render_template('autofill.html', recent_applications=session.get('recent_applications', []))
+    if request.method == 'POST' and request.form.get('job_urls'):
+        return add_job_urls(user_id, request.form['job_urls'])
+    
+    cursor = request.args.get('cursor')
+    applications, next_cursor = get_application_page(user_id, cursor=cursor)
+    return render_template('autofill.html', recent_applications=applications,
+                           next_cursor=next_cursor, is_first_page=not cursor)
+
+def add_job_urls(user_id, text):
+    """Record every job URL pasted into the bulk form and queue their pages for prefetching"""
+    urls, rejected = page_prefetch.parse_urls(text)
+    if len(urls) > page_prefetch.MAX_URLS:
+        flash(f'Only the first {page_prefetch.MAX_URLS} URLs were added.', 'warning')
+        urls = urls[:page_prefetch.MAX_URLS]
+    if rejected:
+        flash(f'{rejected} entries were not http(s) URLs and were skipped.', 'warning')
+    if not urls:
+        return redirect(url_for('autofill'))
+    
+    applications = [record_application(user_id, url) for url in urls]
+    queued = [application for application in applications if page_prefetch.request_prefetch(application)]
+    refresh_recent_applications(user_id)
+    bump_section_versions(user_id, 'applications')
+    db.session.commit()
+    page_prefetch.submit(queued)
+    
+    flash(f'Added {len(applications)} job applications. Their pages are being read in the background.', 'success')
+    return redirect(url_for('autofill'))
 
-@app.route('/api/user_data')
+@route('/api/user_data')
 @login_required
+@api_tokens.require_scope('profile:read')
 def user_data_api():
     """API endpoint to get user data for autofill purposes"""
-    init_session_data()
+    user_id = current_user.get_id()
     
     # Get user data
     data = {
-        'personal': session.get('personal_info', {}),
-        'employment': session.get('employment_history', []),
-        'education': session.get('education', [])
+        'personal': get_profile(user_id).to_dict(),
+        'employment': [job.to_dict() for job in get_employment_history(user_id)],
+        'education': [edu.to_dict() for edu in get_education_history(user_id)]
     }
     
     return jsonify(data)
 
-@app.route('/perform_autofill')
+@route('/perform_autofill')
 @login_required
 def perform_autofill():
-    init_session_data()
+    user_id = current_user.get_id()
     job_url = request.args.get('job_url')
     
     if not job_url:
         flash('No job URL provided', 'danger')
         return redirect(url_for('autofill'))
     
+    # The job page's form, if it has been read already
+    application = get_application_by_url(user_id, job_url)
+    if application is not None and page_prefetch.request_prefetch(application):
+        db.session.commit()
+        page_prefetch.submit([application])
+    prefetched = page_prefetch.plan_for(application) if application is not None else None
+    
     # Get user data for autofill
-    personal_info = session.get('personal_info', {})
-    employment_history = session.get('employment_history', [])
-    education_history = session.get('education', [])
+    profile = get_profile(user_id)
+    personal_info = profile.to_dict()
+    employment_history = [job.to_dict() for job in get_employment_history(user_id)]
+    education_history = [edu.to_dict() for edu in get_education_history(user_id)]
     
     # Add a flash message about the Safari extension simulation
     flash('To use the autofill feature, drag the "JobAutofill" button to your Safari bookmarks bar, then click it when you\'re on the job application page.', 'info')
@@ -532,109 +764,558 @@ def perform_autofill():
         personal_info=personal_info,
         employment_history=employment_history,
         education_history=education_history,
-        autofill_token=autofill_token
+        autofill_token=autofill_token,
+        application=application,
+        prefetched=prefetched,
+        profile_values=build_personal_info_payload(profile)
     )
 
-@app.route('/delete_application/<app_id>')
+@route('/delete_application/<app_id>')
 @login_required
 def delete_application(app_id):
-    init_session_data()
-    
-    # Filter out the application with the given ID
-    session['recent_applications'] = [app for app in session['recent_applications'] if app.get('id') != app_id]
-    session.modified = True
+    # Delete the application with the given ID
+    user_id = current_user.get_id()
+    if Application.query.filter_by(user_id=user_id, id=app_id).delete():
+        refresh_recent_applications(user_id)
+        bump_section_versions(user_id, 'applications')
+    db.session.commit()
     
     flash('Application removed from history!', 'success')
     return redirect(url_for('autofill'))
 
-@app.route('/api/profile', methods=['GET'])
+@route('/api/applications')
 @login_required
+@api_tokens.require_scope('applications:read')
+def applications_api():
+    """Page through the user's application history, newest first"""
+    return add_cors_headers(jsonify(build_applications_payload(current_user.get_id(), request.args)))
+
+def build_applications_payload(user_id, args):
+    """One page of application history for the query args cursor, limit and host"""
+    limit = args.get('limit', APPLICATIONS_PAGE_SIZE, type=int)
+    applications, next_cursor = get_application_page(
+        user_id,
+        cursor=args.get('cursor'),
+        limit=max(1, min(limit, MAX_APPLICATIONS_PAGE_SIZE)),
+        host=args.get('host')
+    )
+    return {
+        'applications': [application.to_dict() for application in applications],
+        'next_cursor': next_cursor
+    }
+
+@route('/api/applications/<app_id>/form')
+@login_required
+@api_tokens.require_scope('applications:read')
+def application_form_api(app_id):
+    """The prefetched form of an application's job page and the profile key planned for each field"""
+    application = get_application(current_user.get_id(), app_id)
+    if application is None:
+        return add_cors_headers(jsonify({'error': 'Application not found'})), 404
+    
+    response = {'id': application.id, 'url': application.url, 'title': application.title,
+                'company': application.company, 'prefetch': application.prefetch}
+    prefetched = page_prefetch.plan_for(application)
+    if prefetched is not None:
+        response.update(prefetched)
+    return add_cors_headers(jsonify(response))
+
+@route('/api/fill-report', methods=['POST'])
+@login_required
+@api_tokens.require_scope('fill_reports:write')
+def fill_report_api():
+    """Accept a batch of per-field autofill outcomes from the extension"""
+    try:
+        accepted = fill_reports.submit(current_user.get_id(), fill_reports.read_batch(request))
+    except fill_reports.ReportError as e:
+        return add_cors_headers(jsonify({'error': str(e)}), 'POST,OPTIONS'), 400
+    
+    # Shed load instead of queueing without bound; the extension retries on its next flush
+    if accepted is None:
+        response = add_cors_headers(jsonify({'error': 'Too many pending reports, try again later'}), 'POST,OPTIONS')
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return add_cors_headers(jsonify({'accepted': accepted}), 'POST,OPTIONS'), 202
+
+@route('/api/fill-stats')
+@login_required
+@api_tokens.require_scope('applications:read')
+def fill_stats_api():
+    """Rolled-up fill outcomes per ATS tenant, or per field signature for the tenant of ?host= or ?url="""
+    limit = max(1, min(request.args.get('limit', fill_reports.MAX_STATS_ROWS, type=int), fill_reports.MAX_STATS_ROWS))
+    host = request.args.get('host') or request.args.get('url')
+    if host:
+        host = fill_plans.plan_host(host)
+        return add_cors_headers(jsonify({'host': host, 'fields': fill_reports.host_stats(host, limit)}))
+    return add_cors_headers(jsonify({'hosts': fill_reports.top_hosts(limit)}))
+
+@route('/api/<any(employment, education):record_type>/import', methods=['POST'])
+@login_required
+@api_tokens.require_scope('profile:write')
+def import_records_api(record_type):
+    """Validate and add a JSON or CSV batch of jobs or schools in one transaction"""
+    import bulk_records
+    user_id = current_user.get_id()
+    try:
+        records = bulk_records.import_entries(user_id, record_type, bulk_records.parse_request(request))
+    except bulk_records.ImportValidationError as e:
+        db.session.rollback()
+        response = jsonify({'error': str(e), 'errors': e.errors})
+        response.status_code = 400
+        return add_cors_headers(response, methods='POST,OPTIONS')
+    
+    profile_changed(user_id, record_type, changes=[(record_type, record.id, False) for record in records])
+    db.session.commit()
+    response = jsonify({'imported': len(records), 'ids': [record.id for record in records]})
+    response.status_code = 201
+    return add_cors_headers(response, methods='POST,OPTIONS')
+
+@route('/api/<any(employment, education):record_type>/export')
+@login_required
+@api_tokens.require_scope('profile:read')
+def export_records_api(record_type):
+    """Stream the user's jobs or schools as JSON (default) or CSV"""
+    import bulk_records
+    user_id = current_user.get_id()
+    if request.args.get('format') == 'csv':
+        rows, mimetype, extension = bulk_records.stream_csv(user_id, record_type), 'text/csv', 'csv'
+    else:
+        rows, mimetype, extension = bulk_records.stream_json(user_id, record_type), 'application/json', 'json'
+    
+    response = current_app.response_class(stream_with_context(rows), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{record_type}.{extension}"'
+    return add_cors_headers(response)
+
+def build_profile_payload(user_id):
+    """Build the camelCase profile payload the Chrome extension expects"""
+    personal_info = get_profile(user_id)
+    employment_history = [job.to_dict() for job in get_employment_history(user_id)]
+    education_history = [edu.to_dict() for edu in get_education_history(user_id)]
+    
+    # Profile values are redacted by the log formatter on the listener thread
+    current_app.logger.debug('Built profile payload', extra={'fields': {
+        'personal_info': personal_info.to_dict(),
+        'employment': employment_history,
+        'education': education_history
+    }})
+    
+    payload = build_personal_info_payload(personal_info)
+    payload['employment'] = employment_history
+    payload['education'] = education_history
+    return payload
+
+def build_personal_info_payload(personal_info):
+    return {
+        'firstName': personal_info.first_name or '',
+        'lastName': personal_info.last_name or '',
+        'email': personal_info.email or '',
+        'phone': personal_info.phone or '',
+        'address': personal_info.address or '',
+        'city': personal_info.city or '',
+        'state': personal_info.state or '',
+        'zip': personal_info.zip or '',
+        'linkedin': personal_info.linkedin or '',
+        'website': personal_info.website or '',
+        'summary': personal_info.summary or ''
+    }
+
+# Past this many changed records a full snapshot is about as small as the delta
+MAX_DELTA_RECORDS = 500
+
+def build_profile_delta(user_id, personal_info, since):
+    """Changed records since a profile version, or None when a snapshot is smaller or required"""
+    if since is None or since < personal_info.changes_compacted_version or since > personal_info.version:
+        return None
+    delta = {'version': personal_info.version, 'full': False}
+    if since == personal_info.version:
+        return delta
+    
+    changes = get_profile_changes(user_id, since)
+    if len(changes) > MAX_DELTA_RECORDS:
+        return None
+    if ('profile', None) in changes:
+        delta['profile'] = build_personal_info_payload(personal_info)
+    for section, model in (('employment', Employment), ('education', Education)):
+        upserted = [record_id for (change_section, record_id), deleted in changes.items()
+                    if change_section == section and not deleted]
+        deleted = [record_id for (change_section, record_id), deleted in changes.items()
+                   if change_section == section and deleted]
+        if not upserted and not deleted:
+            continue
+        records = (model.query.filter(model.user_id == user_id, model.id.in_(upserted)).order_by(model.pk).all()
+                   if upserted else [])
+        # A record logged as changed but gone now was removed by a write that is still being logged
+        found = {record.id for record in records}
+        delta[section] = {
+            'upserted': [record.to_dict() for record in records],
+            'deleted': deleted + [record_id for record_id in upserted if record_id not in found]
+        }
+    return delta
+
+# Hard-coded sample data served to the extension without authentication
+SAMPLE_PROFILE_DATA = {
+    'firstName': 'Mike',
+    'lastName': 'Jones',
+    'email': 'mike.jones@example.com',
+    'phone': '555-867-5309',
+    'address': '456 Elm Street',
+    'city': 'New York',
+    'state': 'New York',
+    'zip': '10001',
+    'linkedin': 'https://linkedin.com/in/mikejones',
+    'website': 'https://mikejones.com',
+    'summary': 'Experienced software developer with 8 years of full-stack development experience.',
+    'employment': [
+        {
+            'job_title': 'Senior Developer',
+            'company': 'Tech Innovations LLC',
+            'start_date': '2020-01',
+            'end_date': 'Present',
+            'current_job': True,
+            'location': 'New York, NY',
+            'responsibilities': '- Lead developer for enterprise web applications\n- Managed team of 5 junior developers\n- Implemented CI/CD pipeline using Jenkins\n- Decreased application load time by 35%'
+        }
+    ],
+    'education': [
+        {
+            'degree': 'Master of Science',
+            'field_of_study': 'Computer Science',
+            'institution': 'Columbia University',
+            'start_date': '2017-09',
+            'end_date': '2019-05',
+            'gpa': '3.9',
+            'achievements': '- Graduated with honors\n- Research assistant in AI lab\n- Published paper on machine learning algorithms\n- President of Computer Science Club'
+        }
+    ]
+}
+
+@route('/api/profile', methods=['GET'])
+@login_required
+@api_tokens.require_scope('profile:read')
 def get_profile_api():
     """API endpoint for the Chrome extension to fetch profile data"""
-    init_session_data()
-    
-    # Debug session data
-    print(f"Session contains: {session.keys()}")
-    print(f"Personal info: {session.get('personal_info', {})}")
-    print(f"Employment: {session.get('employment_history', [])}")
-    print(f"Education: {session.get('education', [])}")
-    
-    # Get the profile data from the session
-    profile_data = {
-        'firstName': session['personal_info'].get('first_name', ''),
-        'lastName': session['personal_info'].get('last_name', ''),
-        'email': session['personal_info'].get('email', ''),
-        'phone': session['personal_info'].get('phone', ''),
-        'address': session['personal_info'].get('address', ''),
-        'city': session['personal_info'].get('city', ''),
-        'state': session['personal_info'].get('state', ''),
-        'zip': session['personal_info'].get('zip', ''),
-        'linkedin': session['personal_info'].get('linkedin', ''),
-        'website': session['personal_info'].get('website', ''),
-        'summary': session['personal_info'].get('summary', ''),
-        'employment': session.get('employment_history', []),
-        'education': session.get('education', [])
-    }
+    user_id = current_user.get_id()
+    return cached_json_response(user_id, current_profile_version(user_id), lambda: build_profile_payload(user_id))
+
+def current_profile_version(user_id):
+    version = get_profile_version(user_id)
+    if version is None:
+        version = get_profile(user_id).version
+    return version
+
+# camelCase names used by GET /api/profile for the personal info fields
+PATCH_PERSONAL_INFO_KEYS = {
+    'firstName': 'first_name', 'lastName': 'last_name', 'phoneType': 'phone_type'
+}
+
+@route('/api/profile', methods=['PATCH'])
+@login_required
+@api_tokens.require_scope('profile:write')
+def patch_profile_api():
+    """Queue field-level profile changes for autosave; ?flush=1 writes them before responding"""
+    user_id = current_user.get_id()
+    changes, errors = parse_profile_patch(user_id, request.get_json(silent=True))
+    if errors:
+        response = jsonify({'error': f'{len(errors)} problem(s) found; nothing was saved', 'errors': errors})
+        response.status_code = 400
+        return add_cors_headers(response, 'GET,PATCH,OPTIONS')
+    
+    buffer = current_app.extensions['profile_writes']
+    buffer.add(user_id, changes)
+    if request.args.get('flush') == '1':
+        if not buffer.flush_user(user_id, trigger='request'):
+            response = jsonify({'error': 'Your changes could not be saved yet and will be retried', 'saved': False})
+            response.status_code = 503
+            return add_cors_headers(response, 'GET,PATCH,OPTIONS')
+        return add_cors_headers(jsonify({'saved': True, 'version': get_profile_version(user_id)}), 'GET,PATCH,OPTIONS')
+    response = jsonify({'saved': False, 'queued': sum(len(fields) for fields in changes.values())})
+    response.status_code = 202
+    return add_cors_headers(response, 'GET,PATCH,OPTIONS')
+
+def parse_profile_patch(user_id, data):
+    """Validate a PATCH /api/profile body into ({(section, record_id): {field: value}}, errors)
+
+    The body looks like {"personal_info": {"city": "Boston"}, "employment":
+    {"<id>": {"job_title": "Engineer"}}}. Personal info keys may also use the
+    camelCase names from GET /api/profile.
+    """
+    import bulk_records
+    if not isinstance(data, dict) or not data:
+        return {}, [{'field': None, 'error': 'Expected a JSON object of changes'}]
+    changes = {}
+    errors = []
+    
+    for section, values in data.items():
+        if section not in ('personal_info', 'employment', 'education'):
+            errors.append({'field': section, 'error': 'unknown section'})
+        elif not isinstance(values, dict):
+            errors.append({'field': section, 'error': 'must be an object'})
+    
+    columns = Profile.__table__.columns
+    for key, value in (data.get('personal_info') or {}).items():
+        field = PATCH_PERSONAL_INFO_KEYS.get(key, key)
+        if field not in PERSONAL_INFO_FIELDS:
+            errors.append({'field': key, 'error': 'unknown field'})
+        elif value is not None and not isinstance(value, str):
+            errors.append({'field': key, 'error': 'must be a string'})
+        elif value and columns[field].type.length and len(value) > columns[field].type.length:
+            errors.append({'field': key, 'error': f'must be at most {columns[field].type.length} characters'})
+        else:
+            changes.setdefault(('profile', None), {})[field] = value
+    
+    for section in ('employment', 'education'):
+        records = data.get(section) or {}
+        if not isinstance(records, dict):
+            continue
+        model = bulk_records.RECORD_TYPES[section]['model']
+        known = {record_id for (record_id,) in db.session.query(model.id).filter(
+            model.user_id == user_id, model.id.in_(list(records)))} if records else set()
+        for record_id, fields in records.items():
+            if record_id not in known:
+                errors.append({'record': record_id, 'field': None, 'error': f'no {section} record with this id'})
+                continue
+            if not isinstance(fields, dict):
+                errors.append({'record': record_id, 'field': None, 'error': 'must be an object'})
+                continue
+            for field, value in fields.items():
+                try:
+                    changes.setdefault((section, record_id), {})[field] = bulk_records.clean_field(section, field, value)
+                except ValueError as e:
+                    errors.append({'record': record_id, 'field': field, 'error': str(e)})
+    return changes, errors
+
+def apply_profile_patch(user_id, changes):
+    """Write one user's coalesced PATCH /api/profile changes in a single transaction"""
+    import bulk_records
+    sections = set()
+    logged = []
+    for (section, record_id), fields in changes.items():
+        if section == 'profile':
+            record = get_profile(user_id)
+        else:
+            record = bulk_records.RECORD_TYPES[section]['model'].query.filter_by(user_id=user_id, id=record_id).first()
+            # Deleted after the patch was accepted
+            if record is None:
+                continue
+            sections.add(section)
+        for field, value in fields.items():
+            setattr(record, field, value)
+        # Same convention as the forms: current entries end at 'Present'
+        if section != 'profile' and getattr(record, bulk_records.RECORD_TYPES[section]['current_flag']):
+            record.end_date = 'Present'
+        logged.append((section, record_id, False))
     
-    # Enable CORS for the Chrome extension
-    response = jsonify(profile_data)
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
+    if logged:
+        profile_changed(user_id, *sorted(sections), changes=logged)
+        db.session.commit()
+
+@route('/api/tokens', methods=['POST'])
+@login_required
+def issue_api_token():
+    """Mint a short-lived bearer token for the extension or iOS app from the logged-in web session"""
+    payload, error = api_tokens.issue_for_request(current_user.get_id())
+    if error:
+        return jsonify({'error': error}), 400
+    response = jsonify(payload)
+    response.status_code = 201
+    # Tokens are credentials; never let a cache keep one
+    response.headers['Cache-Control'] = 'no-store'
     return response
 
-@app.route('/api/profile-public', methods=['GET'])
+@route('/api/profile/changes', methods=['GET'])
+@login_required
+@api_tokens.require_scope('profile:read')
+def profile_changes_api():
+    """Records added, modified or deleted since the extension's last fetch, or a full snapshot"""
+    user_id = current_user.get_id()
+    personal_info = get_profile(user_id)
+    delta = build_profile_delta(user_id, personal_info, request.args.get('since', type=int))
+    if delta is not None:
+        return add_cors_headers(jsonify(delta))
+    
+    # The snapshot reuses the serialized /api/profile payload for this version
+    version = personal_info.version
+    cached = profile_cache.get_payload(user_id, version)
+    if cached is None:
+        cached = profile_cache.store_payload(user_id, version, build_profile_payload(user_id))
+    body = b'{"version":%d,"full":true,"snapshot":%s}' % (version, cached[0])
+    return add_cors_headers(current_app.response_class(body, mimetype='application/json'))
+
+@route('/api/answers', methods=['GET'])
+@login_required
+@api_tokens.require_scope('profile:read')
+def answers_api():
+    """Passages from the user's own profile text that best answer a free-text form question"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return add_cors_headers(jsonify({'error': 'Expected a question in the q parameter'})), 400
+    
+    limit = max(1, min(request.args.get('limit', answer_index.DEFAULT_RESULTS, type=int), answer_index.MAX_RESULTS))
+    user_id = current_user.get_id()
+    personal_info = get_profile(user_id)
+    answers = current_app.extensions['answer_index'].search(user_id, personal_info, query, limit)
+    return add_cors_headers(jsonify({'version': personal_info.version, 'answers': answers}))
+
+@route('/api/storage/stats', methods=['GET'])
+@login_required
+@api_tokens.require_scope('profile:read')
+def storage_stats_api():
+    """The user's document storage usage and quota, and what the upload sweeper has reclaimed"""
+    return add_cors_headers(jsonify({
+        'usage_bytes': get_profile(current_user.get_id()).upload_bytes,
+        'quota_bytes': current_app.config['UPLOAD_QUOTA_BYTES'] or None,
+        'sweeps': upload_sweeper.stats()
+    }))
+
+@route('/api/profile-public', methods=['GET'])
 def get_profile_api_public():
     """Public API endpoint for the Chrome extension to fetch profile data without auth"""
-    print("Public API endpoint called")
-    init_session_data()
-    
-    # Get the profile data from the session - this won't work without authentication
-    # Instead, let's populate with hard-coded sample data
-    profile_data = {
-        'firstName': 'Mike',
-        'lastName': 'Jones',
-        'email': 'mike.jones@example.com',
-        'phone': '555-867-5309',
-        'address': '456 Elm Street',
-        'city': 'New York',
-        'state': 'New York',
-        'zip': '10001',
-        'linkedin': 'https://linkedin.com/in/mikejones',
-        'website': 'https://mikejones.com',
-        'summary': 'Experienced software developer with 8 years of full-stack development experience.',
-        'employment': [
-            {
-                'job_title': 'Senior Developer',
-                'company': 'Tech Innovations LLC',
-                'start_date': '2020-01',
-                'end_date': 'Present',
-                'current_job': True,
-                'location': 'New York, NY',
-                'responsibilities': '- Lead developer for enterprise web applications\n- Managed team of 5 junior developers\n- Implemented CI/CD pipeline using Jenkins\n- Decreased application load time by 35%'
-            }
-        ],
-        'education': [
-            {
-                'degree': 'Master of Science',
-                'field_of_study': 'Computer Science',
-                'institution': 'Columbia University',
-                'start_date': '2017-09',
-                'end_date': '2019-05',
-                'gpa': '3.9',
-                'achievements': '- Graduated with honors\n- Research assistant in AI lab\n- Published paper on machine learning algorithms\n- President of Computer Science Club'
-            }
-        ]
-    }
+    current_app.logger.debug('Public profile requested')
     
-    # Enable CORS for the Chrome extension
-    response = jsonify(profile_data)
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
-    return response
+    # Profile data can't be loaded without authentication, so serve the sample data instead
+    return cached_json_response('__public__', 0, lambda: SAMPLE_PROFILE_DATA)
+
+@route('/api/match-fields', methods=['POST', 'OPTIONS'])
+def match_fields_api():
+    """Classify a batch of form fields from extractFieldInfo into profile keys in one round trip"""
+    if request.method == 'OPTIONS':
+        return add_cors_headers(current_app.response_class(status=204), 'POST,OPTIONS')
+    
+    user_id = current_user.get_id() if current_user.is_authenticated else None
+    response = build_match_payload(request.get_json(silent=True), user_id)
+    if response is None:
+        return add_cors_headers(jsonify({'error': 'Expected a JSON body with a "fields" list'}), 'POST,OPTIONS'), 400
+    return add_cors_headers(jsonify(response), 'POST,OPTIONS')
+
+def build_match_payload(data, user_id=None):
+    """Match results for a /api/match-fields body, or None if the body is malformed"""
+    data = data if isinstance(data, dict) else {}
+    fields = data.get('fields')
+    if not isinstance(fields, list) or not all(isinstance(field, dict) for field in fields):
+        return None
+    
+    # Reuse the user's fill plan for this ATS tenant when the caller tells us the page URL
+    host = fill_plans.plan_host(data['url']) if data.get('url') else None
+    return fill_plans.match_payload(user_id, host, fields, data.get('isWorkday', False))
+
+RESOLVE_OPTIONS_USAGE = ('Expected a JSON body with a "lists" array of {"kind", "value", "options"} objects; '
+                         '"hash" from an earlier response may replace "options"')
+
+@route('/api/resolve-options', methods=['POST', 'OPTIONS'])
+def resolve_options_api():
+    """Pick the option to select in each of a form's dropdowns in one round trip"""
+    if request.method == 'OPTIONS':
+        return add_cors_headers(current_app.response_class(status=204), 'POST,OPTIONS')
+    
+    response = build_resolve_payload(request.get_json(silent=True))
+    if response is None:
+        return add_cors_headers(jsonify({'error': RESOLVE_OPTIONS_USAGE}), 'POST,OPTIONS'), 400
+    return add_cors_headers(jsonify(response), 'POST,OPTIONS')
+
+def build_resolve_payload(data):
+    """Option indices for a /api/resolve-options body, or None if the body is malformed"""
+    data = data if isinstance(data, dict) else {}
+    lists = data.get('lists')
+    if not isinstance(lists, list) or len(lists) > option_index.MAX_LISTS:
+        return None
+    
+    results = []
+    for entry in lists:
+        if not isinstance(entry, dict) or not isinstance(entry.get('value'), str):
+            return None
+        kind = entry.get('kind')
+        options = entry.get('options')
+        list_hash = entry.get('hash')
+        if kind is not None and not isinstance(kind, str):
+            return None
+        if options is not None:
+            if (not isinstance(options, list) or len(options) > option_index.MAX_OPTIONS
+                    or not all(isinstance(option, str) for option in options)):
+                return None
+        elif not isinstance(list_hash, str):
+            return None
+        results.append(option_index.resolve(kind, entry['value'], options, list_hash))
+    return {'results': results}
+
+@route('/api/fill-plan', methods=['GET'])
+@login_required
+@api_tokens.require_scope('fill_plans:read')
+def get_fill_plan_api():
+    """Fetch the user's precomputed fill plan for a job URL's ATS tenant"""
+    host = fill_plans.plan_host(request.args.get('url', ''))
+    plan = fill_plans.get_plan(current_user.get_id(), host) if host else None
+    if plan is None:
+        return add_cors_headers(jsonify({'error': 'No fill plan for this host'})), 404
+    
+    return add_cors_headers(jsonify({
+        'host': plan.host,
+        'version': plan.version,
+        'fingerprint': plan.fingerprint,
+        'plan': json.loads(plan.plan)
+    }))
+
+@route('/api/fill-plan', methods=['POST'])
+@login_required
+@api_tokens.require_scope('fill_plans:write')
+def save_fill_plan_api():
+    """Record the field to profile key mapping that worked on a job application form"""
+    data = request.get_json(silent=True) or {}
+    host = fill_plans.plan_host(data.get('url', ''))
+    fields = data.get('fields')
+    if not host or not isinstance(fields, list) or not all(isinstance(field, dict) for field in fields):
+        return jsonify({'error': 'Expected a JSON body with a "url" and a "fields" list'}), 400
+    
+    # Fields may carry the key that was filled; otherwise use the matching engine's answer
+    keys = [field['key'] if 'key' in field else None for field in fields]
+    if not any('key' in field for field in fields):
+        keys = field_matching.match_fields(fields, data.get('isWorkday', False))
+    unknown = sorted({str(key) for key in keys
+                      if key is not None and (not isinstance(key, str) or key not in fill_plans.PROFILE_KEYS)})
+    if unknown:
+        return jsonify({'error': f'Unknown profile keys: {", ".join(unknown)}'}), 400
+    
+    plan = fill_plans.save_plan(current_user.get_id(), host, fields, keys)
+    return jsonify({'host': plan.host, 'version': plan.version, 'fingerprint': plan.fingerprint})
+
+@route('/api/fill-plan', methods=['DELETE'])
+@login_required
+@api_tokens.require_scope('fill_plans:write')
+def delete_fill_plan_api():
+    """Drop the user's stale fill plan, e.g. after a tenant redesigns its form"""
+    host = fill_plans.plan_host(request.args.get('url', ''))
+    if not host or not fill_plans.drop_plan(current_user.get_id(), host):
+        return jsonify({'error': 'No fill plan for this host'}), 404
+    return jsonify({'host': host, 'deleted': True})
+
+@route('/api/parse-jobs/<job_id>', methods=['GET'])
+@login_required
+def parse_job_api(job_id):
+    """Status and proposals of a background resume parse"""
+    expire_parse_jobs(current_user.get_id())
+    job = get_parse_job(current_user.get_id(), job_id)
+    if job is None:
+        return jsonify({'error': 'Parse job not found'}), 404
+    return jsonify(job.to_dict())
+
+@route('/api/parse-jobs/<job_id>/<action>', methods=['POST'])
+@login_required
+def resolve_parse_job_api(job_id, action):
+    """Accept or reject the proposals of a finished resume parse"""
+    if action not in ('accept', 'reject'):
+        return jsonify({'error': 'Action must be accept or reject'}), 404
+    
+    job = resolve_parse_job(job_id, action == 'accept')
+    if job is None:
+        return jsonify({'error': 'No pending parse job with this ID'}), 404
+    return jsonify(job.to_dict())
+
+def __getattr__(name):
+    # Importing this module does not build an app; `from app import app` creates one on first use
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
@@ -0,0 +1,345 @@
+"""ASGI entry point for high-concurrency extension traffic.
+
+    uvicorn asgi:application --workers 4
+
+The extension's hot endpoints, /api/profile, /api/profile-public,
+/api/match-fields, /api/resolve-options and /api/applications, are answered
+by coroutines, so an idle keep-alive connection costs a socket rather than a
+worker thread. Database queries, field matching and payload serialization run
+on a bounded thread pool (ASGI_THREADS). Every other route, including the HTML
+pages and document uploads, is handed to the Flask app through a WSGI bridge
+on the same pool, so the two serving modes behave identically.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sys
+from tempfile import SpooledTemporaryFile
+import time
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie, parse_etags, quote_etag
+from werkzeug.urls import url_decode
+
+import api_tokens
+import app as app_module
+import metrics
+import profile_cache
+import wire_formats
+
+DEFAULT_THREADS = 32
+# Request bodies larger than this are spooled to disk before reaching Flask
+SPOOL_MAX_SIZE = 1024 * 1024
+# Bridged responses are sent in pieces of at least this size, e.g. for send_file
+BRIDGE_CHUNK_SIZE = 64 * 1024
+
+class AsgiApp:
+    """ASGI application serving the API fast paths natively and everything else through Flask"""
+
+    def __init__(self, flask_app, max_threads=None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads or flask_app.config.get('ASGI_THREADS', DEFAULT_THREADS),
+                                           thread_name_prefix='asgi')
+        self.routes = {
+            '/api/profile': ('get_profile_api', {'GET': self.profile}),
+            '/api/profile-public': ('get_profile_api_public', {'GET': self.profile_public}),
+            '/api/match-fields': ('match_fields_api', {'POST': self.match_fields, 'OPTIONS': self.post_options}),
+            '/api/resolve-options': ('resolve_options_api', {'POST': self.resolve_options, 'OPTIONS': self.post_options}),
+            '/api/applications': ('applications_api', {'GET': self.applications}),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            endpoint, handlers = self.routes.get(scope['path'], (None, {}))
+            handler = handlers.get(scope['method'])
+            if handler is not None:
+                start = time.perf_counter()
+                status = await handler(scope, receive, send)
+                if status is not None:
+                    metrics.REQUEST_LATENCY.observe((endpoint, scope['method'], str(status)), time.perf_counter() - start)
+                    return
+            await self.call_wsgi(scope, receive, send)
+        else:
+            raise ValueError(f'Unsupported ASGI scope type {scope["type"]!r}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, func, *args):
+        """Run blocking work on the thread pool inside a Flask app context"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call_in_context, func, args)
+
+    def _call_in_context(self, func, args):
+        with self.flask_app.app_context():
+            return func(*args)
+
+    def authenticate(self, scope, required_scope):
+        """The user for a bearer token with required_scope, or else from the session cookie
+
+        Returns None for bad or under-scoped tokens too, leaving Flask to send the 401 or 403.
+        """
+        token = api_tokens.bearer_token(_header(scope, b'authorization'))
+        if token is None:
+            return self.session_user_id(scope)
+        try:
+            user_id, scopes = self.flask_app.extensions['api_tokens'].verify(token)
+        except api_tokens.TokenError:
+            return None
+        return user_id if required_scope in scopes else None
+
+    def session_user_id(self, scope):
+        """The logged-in user from the Flask session cookie, or None
+
+        Mirrors Flask-Login's default "basic" session protection, which never
+        logs a user out. With "strong" protection the check needs the full
+        request, so those requests are left to Flask.
+        """
+        if app_module.login_manager.session_protection == 'strong':
+            return None
+        cookie = _header(scope, b'cookie')
+        value = parse_cookie(cookie).get(self.flask_app.session_cookie_name) if cookie else None
+        if not value:
+            return None
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            data = serializer.loads(value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        return data.get('_user_id')
+
+    async def profile(self, scope, receive, send):
+        user_id = self.authenticate(scope, 'profile:read')
+        if user_id is None:
+            # Flask answers with its login redirect
+            return None
+        # Autosaved changes still in the write-behind buffer are written first, as Flask's hook does
+        buffer = self.flask_app.extensions['profile_writes']
+        if buffer.has_pending(user_id):
+            await self.run(buffer.flush_user, user_id)
+        version = await self.run(app_module.current_profile_version, user_id)
+        cached = profile_cache.get_payload(user_id, version)
+        if cached is None:
+            cached = await self.run(
+                lambda: profile_cache.store_payload(user_id, version, app_module.build_profile_payload(user_id)))
+        return await self.send_cached_json(scope, send, user_id, version, cached)
+
+    async def profile_public(self, scope, receive, send):
+        cached = profile_cache.get_payload('__public__', 0)
+        if cached is None:
+            cached = profile_cache.store_payload('__public__', 0, app_module.SAMPLE_PROFILE_DATA)
+        return await self.send_cached_json(scope, send, '__public__', 0, cached)
+
+    async def match_fields(self, scope, receive, send):
+        # Fill plans are per user; a session only Flask can check is left to it
+        if app_module.login_manager.session_protection == 'strong' and _header(scope, b'cookie'):
+            return None
+        user_id = self.session_user_id(scope)
+        return await self.post_json(scope, receive, send, lambda data: app_module.build_match_payload(data, user_id),
+                                    'Expected a JSON body with a "fields" list')
+
+    async def resolve_options(self, scope, receive, send):
+        return await self.post_json(scope, receive, send, app_module.build_resolve_payload,
+                                    app_module.RESOLVE_OPTIONS_USAGE)
+
+    async def post_json(self, scope, receive, send, build, usage):
+        """Answer a public JSON POST whose payload build(data) computes, or None when malformed"""
+        body = await _read_body(receive, self.flask_app.config.get('MAX_CONTENT_LENGTH'))
+        if body is None:
+            return await self.send_json(send, 413, {'error': 'Request body too large'}, 'POST,OPTIONS')
+        data = None
+        # Same rules as request.get_json(silent=True)
+        if _is_json(_header(scope, b'content-type')):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                pass
+        response = await self.run(build, data)
+        if response is None:
+            return await self.send_json(send, 400, {'error': usage}, 'POST,OPTIONS')
+        return await self.send_json(send, 200, response, 'POST,OPTIONS')
+
+    async def post_options(self, scope, receive, send):
+        await _send_response(send, 204, app_module.cors_headers('POST,OPTIONS'))
+        return 204
+
+    async def applications(self, scope, receive, send):
+        user_id = self.authenticate(scope, 'applications:read')
+        if user_id is None:
+            return None
+        args = url_decode(scope['query_string'])
+        payload = await self.run(app_module.build_applications_payload, user_id, args)
+        return await self.send_json(send, 200, payload)
+
+    async def send_json(self, send, status, payload, methods='GET,OPTIONS'):
+        body = profile_cache.serialize_payload(payload)
+        headers = [('Content-Type', 'application/json')] + app_module.cors_headers(methods)
+        await _send_response(send, status, headers, body)
+        return status
+
+    async def send_cached_json(self, scope, send, cache_key, version, cached):
+        """Send a payload from the profile cache the way cached_json_response does"""
+        accept, accept_encoding = _header(scope, b'accept'), _header(scope, b'accept-encoding')
+        variant = wire_formats.negotiate(accept, accept_encoding)
+        if variant == wire_formats.IDENTITY or profile_cache.has_variant(cache_key, version, variant):
+            body, etag, variant_headers = wire_formats.represent(cache_key, version, cached, accept, accept_encoding)
+        else:
+            # Compressing a large profile would stall the event loop, so new variants are built on the pool
+            body, etag, variant_headers = await self.run(wire_formats.represent, cache_key, version, cached,
+                                                         accept, accept_encoding)
+        headers = [('ETag', quote_etag(etag)), ('Cache-Control', 'private, no-cache')]
+        if parse_etags(_header(scope, b'if-none-match')).contains(etag):
+            status, body = 304, b''
+            headers.append(('Vary', 'Accept, Accept-Encoding'))
+        else:
+            status = 200
+            headers.extend(variant_headers)
+        await _send_response(send, status, headers + app_module.cors_headers(), body)
+        return status
+
+    async def call_wsgi(self, scope, receive, send):
+        """Run the Flask app for this request on the thread pool and stream its response"""
+        body = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        environ = _build_environ(scope, body)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        def start():
+            iterable = self.flask_app(environ, start_response)
+            return iterable, iter(iterable)
+
+        iterable = None
+        try:
+            iterable, iterator = await loop.run_in_executor(self.executor, start)
+            chunk, done = await loop.run_in_executor(self.executor, _next_chunk, iterator)
+            await send({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response['headers']],
+            })
+            while not done:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk, done = await loop.run_in_executor(self.executor, _next_chunk, iterator)
+            await send({'type': 'http.response.body', 'body': chunk})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.executor, iterable.close)
+            body.close()
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def _is_json(content_type):
+    if not content_type:
+        return False
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    return mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+async def _read_body(receive, limit):
+    """The full request body, or None if it is larger than limit"""
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+async def _send_response(send, status, headers, body=b''):
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    # Without a length the server falls back to chunked encoding
+    if status != 304:
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def _next_chunk(iterator):
+    """Read at least BRIDGE_CHUNK_SIZE bytes from a WSGI response; returns (bytes, exhausted)"""
+    chunks = []
+    size = 0
+    for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= BRIDGE_CHUNK_SIZE:
+            return b''.join(chunks), False
+    return b''.join(chunks), True
+
+def _build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    # The body is fully buffered, so chunked uploads get a length too
+    if 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(body.seek(0, 2))
+        body.seek(0)
+    return environ
+
+def create_asgi_app(config=None):
+    """Build the Flask app with create_app(config) and wrap it for ASGI servers"""
+    return AsgiApp(app_module.create_app(config))
+
+def __getattr__(name):
+    # Like app.app, the ASGI application is only built when a server asks for it
+    if name == 'application':
+        global application
+        application = create_asgi_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,204 @@
+"""Compare the ASGI entry point against the threaded WSGI server under many keep-alive connections.
+
+Both servers run as subprocesses over the same seeded database: uvicorn
+serving asgi:application, and Werkzeug's threaded server speaking HTTP/1.1
+(one thread per connection). An asyncio load generator opens the given
+number of keep-alive connections and sends a mix of the extension's API
+calls over each. Reports throughput, latency percentiles and errors
+(status >= 400, dropped connections and requests over --timeout) per
+connection count.
+
+Requires uvicorn. Run from the web_prototype directory:
+    python benchmarks/bench_asgi.py [--connections 50,500,2000] [--duration 10] [--jobs 50] [--timeout 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+WEB_PROTOTYPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WSGI_SERVER_SCRIPT = '''
+import logging, sys
+from werkzeug.serving import WSGIRequestHandler, make_server
+import app as app_module
+
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+make_server('127.0.0.1', int(sys.argv[1]), app_module.create_app(), threaded=True,
+            request_handler=KeepAliveHandler).serve_forever()
+'''
+
+MATCH_BODY = json.dumps({
+    'url': 'https://acme.wd5.myworkdayjobs.com/en-US/careers/job/123',
+    'isWorkday': True,
+    'fields': [{'id': name, 'name': name, 'label': label} for name, label in [
+        ('firstName', 'First Name'), ('lastName', 'Last Name'), ('email', 'Email Address'),
+        ('phone', 'Phone Number'), ('address', 'Street Address'), ('city', 'City'),
+        ('state', 'State'), ('zip', 'Postal Code'), ('linkedin', 'LinkedIn Profile'),
+        ('website', 'Personal Website'),
+    ]],
+}).encode()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(kind, port, env):
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                   '--log-level', 'warning', '--no-access-log', '--backlog', '4096']
+    else:
+        command = [sys.executable, '-c', WSGI_SERVER_SCRIPT, str(port)]
+    process = subprocess.Popen(command, cwd=WEB_PROTOTYPE_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/profile-public', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+def seed(base_url, jobs):
+    """Create a profile with some jobs and applications; returns the session cookie header"""
+    session = requests.Session()
+    session.post(base_url + '/login', data={'username': 'user', 'password': 'password'})
+    session.post(base_url + '/profile', data={'first_name': 'Bench', 'last_name': 'User',
+                                              'email': 'bench@example.com', 'phone': '555-0100'})
+    session.post(base_url + '/api/employment/import', json=[
+        {'job_title': f'Engineer {i}', 'company': f'Company {i}', 'start_date': '2015-01',
+         'responsibilities': '- Built and operated high-traffic services\n' * 20} for i in range(jobs)])
+    for i in range(30):
+        session.get(base_url + f'/autofill?job_url=https://jobs{i}.example.com/posting/{i}')
+    return '; '.join(f'{name}={value}' for name, value in session.cookies.items())
+
+def build_requests(cookie):
+    common = f'Host: 127.0.0.1\r\nCookie: {cookie}\r\n'
+    return [
+        f'GET /api/profile HTTP/1.1\r\n{common}\r\n'.encode(),
+        f'GET /api/profile-public HTTP/1.1\r\n{common}\r\n'.encode(),
+        f'GET /api/applications?limit=10 HTTP/1.1\r\n{common}\r\n'.encode(),
+        (f'POST /api/match-fields HTTP/1.1\r\n{common}Content-Type: application/json\r\n'
+         f'Content-Length: {len(MATCH_BODY)}\r\n\r\n').encode() + MATCH_BODY,
+    ]
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = close = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = value == 'chunked'
+        elif name == 'connection':
+            close = value == 'close'
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return status, close
+
+async def connection_worker(port, request_mix, offset, stop_at, timeout, latencies, errors):
+    reader = writer = None
+    index = offset
+    while time.perf_counter() < stop_at:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            start = time.perf_counter()
+            writer.write(request_mix[index % len(request_mix)])
+            status, close = await asyncio.wait_for(read_response(reader), timeout)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+            if close:
+                writer.close()
+                writer = None
+        except asyncio.TimeoutError:
+            errors.append('timeout')
+            writer.close()
+            writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            errors.append('connection')
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+        index += 1
+    if writer is not None:
+        writer.close()
+
+async def run_load(port, request_mix, connections, duration, timeout):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection_worker(port, request_mix, i, start + duration, timeout, latencies, errors)
+                           for i in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', default='50,500,2000')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a request counts as failed')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_asgi.db'),
+               LOG_LEVEL='WARNING')
+    ports = {'wsgi': free_port(), 'asgi': free_port()}
+    processes = {}
+    try:
+        processes['wsgi'] = start_server('wsgi', ports['wsgi'], env)
+        request_mix = build_requests(seed(f'http://127.0.0.1:{ports["wsgi"]}', args.jobs))
+        processes['asgi'] = start_server('asgi', ports['asgi'], env)
+
+        print(f'{"server":<6} {"conns":>6} {"requests":>9} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} '
+              f'{"p99 ms":>8} {"errors":>7}')
+        for connections in [int(value) for value in args.connections.split(',')]:
+            for kind in ('wsgi', 'asgi'):
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(ports[kind], request_mix, connections, args.duration, args.timeout))
+                if not latencies:
+                    print(f'{kind:<6} {connections:>6} {"no successful requests":>9} ({len(errors)} errors)')
+                    continue
+                ms = [latency * 1000 for latency in latencies]
+                print(f'{kind:<6} {connections:>6} {len(ms):>9} {len(ms) / elapsed:>8.0f} '
+                      f'{statistics.median(ms):>8.1f} {percentile(ms, 95):>8.1f} {percentile(ms, 99):>8.1f} '
+                      f'{len(errors):>7}')
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark /dashboard latency as a user's application history grows.
+
+Completion state and the recent applications list are kept on the profile row,
+so the time per request should stay flat from an empty history to tens of
+thousands of applications.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_dashboard.py [--requests 500] [--sizes 0,1000,10000,50000]
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from app import app  # noqa: E402
+from models import db, Application, refresh_recent_applications  # noqa: E402
+
+def login(client):
+    client.post('/login', data={'username': 'user', 'password': 'password'})
+
+def seed_profile(client):
+    client.post('/profile', data={'first_name': 'Bench', 'last_name': 'User', 'email': 'bench@example.com', 'phone': '555-0100'})
+    client.post('/employment', data={'job_title': 'Engineer', 'company': 'Company', 'start_date': '2020-01'})
+    client.post('/education', data={'degree': 'BS', 'institution': 'State University', 'start_date': '2014-09'})
+
+def grow_history(total, start):
+    """Bulk insert applications up to total, then rebuild the recent list once"""
+    base = datetime.now()
+    with app.app_context():
+        db.session.bulk_insert_mappings(Application, [{
+            'user_id': 'user',
+            'id': f'bench{i}',
+            'url': f'https://jobs{i % 50}.example.com/posting/{i}',
+            'title': f'Job Application at jobs{i % 50}.example.com',
+            'date': base.strftime('%B %d, %Y'),
+            'created_at': base + timedelta(seconds=i)
+        } for i in range(start, total)])
+        refresh_recent_applications('user')
+        db.session.commit()
+
+def run(client, count):
+    client.get('/dashboard')
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get('/dashboard')
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--sizes', default='0,1000,10000,50000')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    login(client)
+    seed_profile(client)
+
+    print(f'{"applications":>12}  {"p50 ms":>8}  {"p95 ms":>8}')
+    seeded = 0
+    for size in sorted(int(size) for size in args.sizes.split(',')):
+        grow_history(size, seeded)
+        seeded = size
+        p50, p95 = run(client, args.requests)
+        print(f'{size:>12}  {p50 * 1000:>8.2f}  {p95 * 1000:>8.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Load test concurrent document downloads over a local threaded WSGI server.
+
+Uploads a few multi-megabyte PDFs, then downloads them concurrently and reports
+throughput and latency for full downloads, Range requests, conditional GETs
+(304) and HEAD requests.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_downloads.py [--size-mb 5] [--files 3] [--concurrency 16] [--requests 200]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from app import app  # noqa: E402
+
+def start_server():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def logged_in_session(base_url):
+    session = requests.Session()
+    session.post(f'{base_url}/login', data={'username': 'user', 'password': 'password'})
+    return session
+
+def upload_documents(session, base_url, count, size):
+    for i in range(count):
+        body = b'%PDF-1.4\n' + os.urandom(size)
+        session.post(f'{base_url}/documents', files={'resume': (f'resume_{i}.pdf', body, 'application/pdf')},
+                     data={'resume_name': f'Resume {i}'})
+    page = session.get(f'{base_url}/documents').text
+    return sorted({part.split('"', 1)[0] for part in page.split('/download_document/')[1:]})
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_case(base_url, cookies, filenames, concurrency, count, method='GET', headers_for=None):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.cookies.update(cookies)
+        filename = filenames[i % len(filenames)]
+        headers = headers_for(filename) if headers_for else {}
+        start = time.perf_counter()
+        response = local.session.request(method, f'{base_url}/download_document/{filename}', headers=headers)
+        body = response.content
+        return time.perf_counter() - start, len(body), response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [result[0] * 1000 for result in results]
+    total_bytes = sum(result[1] for result in results)
+    statuses = sorted({result[2] for result in results})
+    return {
+        'rps': count / elapsed,
+        'mb_per_s': total_bytes / elapsed / (1024 * 1024),
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'statuses': statuses,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=5)
+    parser.add_argument('--files', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+    server, base_url = start_server()
+    try:
+        session = logged_in_session(base_url)
+        filenames = upload_documents(session, base_url, args.files, int(args.size_mb * 1024 * 1024))
+        etags = {name: session.head(f'{base_url}/download_document/{name}').headers['ETag'] for name in filenames}
+        cookies = session.cookies.get_dict()
+
+        cases = {
+            'full GET': {},
+            'Range 64KB': {'headers_for': lambda name: {'Range': 'bytes=0-65535'}},
+            'If-None-Match (304)': {'headers_for': lambda name: {'If-None-Match': etags[name]}},
+            'HEAD': {'method': 'HEAD'},
+        }
+        print(f"{args.files} x {args.size_mb}MB PDFs, {args.requests} requests, concurrency {args.concurrency}")
+        for name, options in cases.items():
+            result = run_case(base_url, cookies, filenames, args.concurrency, args.requests, **options)
+            print(f"  {name:<20} {result['rps']:8.1f} req/s {result['mb_per_s']:8.1f} MB/s  "
+                  f"p50 {result['p50']:7.1f}ms  p95 {result['p95']:7.1f}ms  p99 {result['p99']:7.1f}ms  "
+                  f"status {result['statuses']}")
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
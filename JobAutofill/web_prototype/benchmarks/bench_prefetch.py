@@ -0,0 +1,111 @@
+"""Prefetch a batch of pasted job URLs from a local stand-in job site.
+
+Serves the chrome-extension directory (test-form.html and friends) over a
+threaded HTTP server that adds a fixed latency to every response, pastes
+--urls distinct links to test-form.html into the bulk URL form, and waits for
+the prefetch workers to read them all. Reports wall time against reading the
+pages one after another, the most requests the stand-in saw at once, and the
+fields found per page; exits non-zero if any page was not read.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_prefetch.py [--urls 50] [--latency-ms 200] [--workers 8] [--per-host 4]
+"""
+import argparse
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import tempfile
+import threading
+import time
+
+WEB_PROTOTYPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(WEB_PROTOTYPE_DIR)), 'chrome-extension')
+
+sys.path.insert(0, WEB_PROTOTYPE_DIR)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import app as app_module  # noqa: E402
+from models import Application  # noqa: E402
+
+class StandInHandler(SimpleHTTPRequestHandler):
+    """Static file handler that sleeps before answering and counts requests in flight"""
+    latency = 0.0
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this keep-alive responses stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(cls.latency)
+            super().do_GET()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stand_in(latency):
+    StandInHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(StandInHandler, directory=FIXTURE_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-host', type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url = start_stand_in(args.latency_ms / 1000)
+    app = app_module.create_app({
+        'UPLOAD_FOLDER': tempfile.mkdtemp(),
+        'PREFETCH_ALLOW_PRIVATE': True,
+        'PREFETCH_WORKERS': args.workers,
+        'PREFETCH_PER_HOST': args.per_host,
+        'UPLOAD_SWEEP_INTERVAL': 0,
+    })
+    try:
+        client = app.test_client()
+        client.post('/login', data={'username': 'user', 'password': 'password'})
+        urls = [f'{base_url}/test-form.html?job={i}' for i in range(args.urls)]
+
+        start = time.perf_counter()
+        client.post('/autofill', data={'job_urls': '\n'.join(urls)})
+        app.extensions['page_prefetch'].join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            applications = Application.query.filter(Application.url.in_(urls)).all()
+            statuses = sorted({application.prefetch_status for application in applications})
+            field_counts = sorted({application.form_field_count for application in applications})
+            sample = applications[0] if applications else None
+            sample_plan = app_module.page_prefetch.plan_for(sample) if sample is not None else None
+
+        serial = args.urls * args.latency_ms / 1000
+        print(f'{args.urls} pages, {args.latency_ms:g}ms latency, {args.workers} workers, {args.per_host} per host')
+        print(f'  wall time       {elapsed * 1000:8.1f} ms  ({args.urls / elapsed:.1f} pages/s, '
+              f'{serial / elapsed:.1f}x reading them one by one)')
+        print(f'  max in flight   {StandInHandler.max_in_flight:8d}')
+        print(f'  statuses        {statuses}')
+        print(f'  fields per page {field_counts}')
+        if sample_plan is not None:
+            matched = sum(1 for field in sample_plan['fields'] if field['key'])
+            print(f'  sample page     "{sample.title}": {matched} of {len(sample_plan["fields"])} fields matched')
+        if statuses != ['done'] or len(applications) != args.urls:
+            sys.exit(1)
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark the cached /api/profile endpoints: cache hit (304 and 200) versus cache miss.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_profile_api.py [--requests 2000] [--jobs 25]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import profile_cache  # noqa: E402
+from app import app  # noqa: E402
+
+def login(client):
+    client.post('/login', data={'username': 'user', 'password': 'password'})
+
+def seed_profile(client, jobs):
+    client.post('/profile', data={'first_name': 'Bench', 'last_name': 'User', 'email': 'bench@example.com', 'phone': '555-0100'})
+    for i in range(jobs):
+        client.post('/employment', data={
+            'job_title': f'Engineer {i}',
+            'company': f'Company {i}',
+            'start_date': '2020-01',
+            'responsibilities': '- Built and maintained services\n' * 20
+        })
+
+def run(client, path, count, headers=None, before_each=None):
+    start = time.perf_counter()
+    for _ in range(count):
+        if before_each:
+            before_each()
+        client.get(path, headers=headers or {})
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--jobs', type=int, default=25)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    login(client)
+    seed_profile(client, args.jobs)
+
+    # Debug output on the miss path would otherwise flood the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        etag = client.get('/api/profile').headers['ETag']
+        results = {
+            'miss (rebuild + encode)': run(client, '/api/profile', args.requests,
+                                           before_each=lambda: profile_cache.invalidate('user')),
+            'hit (200, cached bytes)': run(client, '/api/profile', args.requests),
+            'hit (304, If-None-Match)': run(client, '/api/profile', args.requests, headers={'If-None-Match': etag}),
+            'public hit (304)': run(client, '/api/profile-public', args.requests,
+                                    headers={'If-None-Match': client.get('/api/profile-public').headers['ETag']}),
+        }
+
+    print(f"/api/profile with {args.jobs} jobs, {args.requests} requests per case")
+    for name, rps in results.items():
+        print(f"  {name:<28} {rps:10.1f} req/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Latency and throughput benchmark for every page and API endpoint, with a regression baseline.
+
+Each profile size gets a fresh database seeded through the bulk import API (long
+responsibilities text on every job), then every route is driven in-process with
+the Flask test client and/or over a local threaded WSGI server at each
+concurrency level. Results are compared against a stored baseline and the run
+exits non-zero if any route got slower.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_suite.py [--sizes 1,50,500] [--concurrency 1,8] [--requests 200]
+                                     [--mode both] [--baseline benchmarks/baseline.json]
+                                     [--update-baseline] [--tolerance 0.25]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import profile_cache  # noqa: E402
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+IMPORT_BATCH_SIZE = 500
+RESPONSIBILITIES = '- Designed, built and operated high-traffic services and data pipelines\n' * 40
+
+ROUTES = ['/dashboard', '/profile', '/employment', '/education', '/documents', '/autofill',
+          '/api/profile', '/api/profile-public']
+
+def reset_database():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    profile_cache.clear()
+
+def seed_profile(client, jobs):
+    """Fill in a profile with the given number of jobs and return the document download path"""
+    client.post('/profile', data={'first_name': 'Bench', 'last_name': 'User', 'email': 'bench@example.com',
+                                  'phone': '555-0100', 'summary': 'Experienced engineer. ' * 50})
+    entries = [{'job_title': f'Engineer {i}', 'company': f'Company {i}', 'start_date': '2015-01',
+                'end_date': '2016-01', 'location': 'Remote', 'responsibilities': RESPONSIBILITIES}
+               for i in range(jobs)]
+    for start in range(0, len(entries), IMPORT_BATCH_SIZE):
+        client.post('/api/employment/import', json=entries[start:start + IMPORT_BATCH_SIZE])
+    client.post('/api/education/import', json=[{'degree': 'BS', 'institution': 'State University',
+                                                'start_date': '2010-09', 'end_date': '2014-05'}])
+    client.post('/documents', data={'cover_letter': (io.BytesIO(b'%PDF-1.4\n' + os.urandom(256 * 1024)), 'letter.pdf')},
+                content_type='multipart/form-data')
+    for i in range(20):
+        client.get(f'/autofill?job_url=https://jobs{i}.example.com/posting/{i}')
+    page = client.get('/documents').get_data(as_text=True)
+    return '/download_document/' + page.split('/download_document/')[1].split('"', 1)[0]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(latencies, elapsed):
+    latencies = [latency * 1000 for latency in latencies]
+    return {
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50': round(statistics.median(latencies), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+    }
+
+def run_concurrently(make_requester, path, concurrency, count):
+    """Issue count requests for path from concurrency threads, each with its own logged-in client"""
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, 'request'):
+            local.request = make_requester()
+        start = time.perf_counter()
+        local.request(path)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(count)))
+    return summarize(latencies, time.perf_counter() - start)
+
+def in_process_requester():
+    client = app.test_client()
+    client.post('/login', data={'username': 'user', 'password': 'password'})
+    return lambda path: client.get(path).get_data()
+
+def server_requester(base_url, cookies):
+    def make():
+        session = requests.Session()
+        session.cookies.update(cookies)
+        return lambda path: session.get(base_url + path).content
+    return make
+
+def start_server():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+def run_suite(args):
+    results = {}
+    modes = ['inprocess', 'server'] if args.mode == 'both' else [args.mode]
+    server, base_url = start_server() if 'server' in modes else (None, None)
+    try:
+        for size in args.sizes:
+            reset_database()
+            seed_client = app.test_client()
+            seed_client.post('/login', data={'username': 'user', 'password': 'password'})
+            routes = ROUTES + [seed_profile(seed_client, size)]
+
+            for mode in modes:
+                if mode == 'server':
+                    session = requests.Session()
+                    session.post(f'{base_url}/login', data={'username': 'user', 'password': 'password'})
+                    make_requester = server_requester(base_url, session.cookies.get_dict())
+                else:
+                    make_requester = in_process_requester
+                for concurrency in args.concurrency:
+                    for path in routes:
+                        route = '/download_document' if path.startswith('/download_document/') else path
+                        run_concurrently(make_requester, path, concurrency, min(10, args.requests))  # warm up
+                        results[f'{mode}/jobs={size}/c={concurrency} {route}'] = run_concurrently(
+                            make_requester, path, concurrency, args.requests)
+            results[f'peak_rss_mb/jobs={size}'] = peak_rss_mb()
+    finally:
+        if server is not None:
+            server.shutdown()
+    return results
+
+def print_results(results):
+    print(f'{"case":<58} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for key, result in results.items():
+        if key.startswith('peak_rss_mb/'):
+            print(f'{key:<58} {result} MB')
+        else:
+            print(f'{key:<58} {result["rps"]:>9.1f} {result["p50"]:>8.2f} {result["p95"]:>8.2f} {result["p99"]:>8.2f}')
+
+def find_regressions(results, baseline, tolerance, slack_ms):
+    """Cases whose p95 latency or throughput got worse than the baseline allows"""
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None or key.startswith('peak_rss_mb/'):
+            continue
+        if result['p95'] > expected['p95'] * (1 + tolerance) + slack_ms:
+            regressions.append(f'{key}: p95 {result["p95"]:.2f}ms vs baseline {expected["p95"]:.2f}ms')
+        if result['rps'] < expected['rps'] * (1 - tolerance):
+            regressions.append(f'{key}: {result["rps"]:.1f} req/s vs baseline {expected["rps"]:.1f} req/s')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,50,500', help='comma-separated job counts')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and level')
+    parser.add_argument('--mode', choices=['inprocess', 'server', 'both'], default='both')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='write these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional slowdown')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='extra p95 allowance for very fast routes')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+    args.concurrency = [int(level) for level in args.concurrency.split(',')]
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+
+    results = run_suite(args)
+    print_results(results)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --update-baseline to create one')
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = find_regressions(results, json.load(f), args.tolerance, args.slack_ms)
+    if regressions:
+        print(f'{len(regressions)} regression(s) against {args.baseline}:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    print(f'No regressions against {args.baseline}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
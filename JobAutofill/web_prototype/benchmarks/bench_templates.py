@@ -0,0 +1,87 @@
+"""Before/after numbers for fragment caching and the Jinja bytecode cache.
+
+Renders the dashboard and list pages for a large profile with the fragment
+cache disabled (before) and enabled (after), then times compiling every
+template from source against loading it from the bytecode cache, which is
+what a freshly started worker pays.
+
+Run from the web_prototype directory:
+    python benchmarks/bench_templates.py [--requests 300] [--jobs 100]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from jinja2 import FileSystemBytecodeCache  # noqa: E402
+
+from app import app  # noqa: E402
+
+PAGES = ['/dashboard', '/employment', '/education', '/documents']
+RESPONSIBILITIES = '- Designed, built and operated high-traffic services and data pipelines\n' * 40
+
+def seed_profile(client, jobs):
+    client.post('/profile', data={'first_name': 'Bench', 'last_name': 'User', 'email': 'bench@example.com', 'phone': '555-0100'})
+    client.post('/api/employment/import', json=[{'job_title': f'Engineer {i}', 'company': f'Company {i}',
+                                                 'start_date': '2015-01', 'responsibilities': RESPONSIBILITIES}
+                                                for i in range(jobs)])
+    client.post('/api/education/import', json=[{'degree': 'BS', 'institution': f'University {i}',
+                                                'achievements': 'Dean\'s list\n' * 10} for i in range(10)])
+    for i in range(10):
+        client.post('/documents', data={'resume': (io.BytesIO(os.urandom(1024)), f'resume_{i}.pdf')},
+                    content_type='multipart/form-data')
+        client.get(f'/autofill?job_url=https://jobs{i}.example.com/posting/{i}')
+
+def time_page(client, path, count):
+    client.get(path)
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get(path)
+    return (time.perf_counter() - start) / count * 1000
+
+def time_template_loading(bytecode_cache, rounds):
+    # cache_size=0 makes every get_template go through the loader, as in a new process
+    environment = app.jinja_env.overlay(cache_size=0, bytecode_cache=bytecode_cache)
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        environment.get_template(name)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name in names:
+            environment.get_template(name)
+    return (time.perf_counter() - start) / rounds * 1000, len(names)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--jobs', type=int, default=100)
+    args = parser.parse_args()
+
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+    client = app.test_client()
+    client.post('/login', data={'username': 'user', 'password': 'password'})
+    seed_profile(client, args.jobs)
+
+    print(f'Page render, {args.jobs} jobs ({args.requests} requests each)')
+    print(f'  {"page":<14} {"before ms":>10} {"after ms":>10} {"speedup":>8}')
+    for path in PAGES:
+        app.jinja_env.fragment_cache_enabled = False
+        before = time_page(client, path, args.requests)
+        app.jinja_env.fragment_cache_enabled = True
+        after = time_page(client, path, args.requests)
+        print(f'  {path:<14} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x')
+
+    rounds = 20
+    compile_ms, count = time_template_loading(None, rounds)
+    bytecode_ms, _ = time_template_loading(FileSystemBytecodeCache(tempfile.mkdtemp()), rounds)
+    print(f'Loading all {count} templates in a fresh environment')
+    print(f'  compile from source   {compile_ms:8.2f} ms')
+    print(f'  load from bytecode    {bytecode_ms:8.2f} ms ({compile_ms / bytecode_ms:.1f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Cold-start budget check: time a fresh worker from interpreter start to its first response.
+
+Each run starts a new interpreter that imports app, calls create_app() and
+serves one page, which is what a newly spawned worker pays. The median of
+several runs is compared against the budget and the script exits non-zero if
+it is exceeded.
+
+Run from the web_prototype directory:
+    python benchmarks/check_cold_start.py [--runs 7] [--budget-ms 900] [--import-budget-ms 600]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WEB_PROTOTYPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; everything is timed from just after interpreter startup
+CHILD_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - start) * 1000,
+}))
+'''
+
+def measure_once(database_dir):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(database_dir, 'cold_start.db'))
+    output = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=WEB_PROTOTYPE_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=900, help='median import + create_app + first request')
+    parser.add_argument('--import-budget-ms', type=float, default=600, help='median time to import app')
+    args = parser.parse_args()
+
+    database_dir = tempfile.mkdtemp()
+    # The first run creates the schema and warms the bytecode cache, like a deploy's first worker
+    measure_once(database_dir)
+    runs = [measure_once(database_dir) for _ in range(args.runs)]
+
+    medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key, value in medians.items():
+        print(f'{key:<18} {value:8.1f} ms')
+
+    failures = []
+    if medians['import_ms'] > args.import_budget_ms:
+        failures.append(f'import took {medians["import_ms"]:.1f}ms (budget {args.import_budget_ms:.0f}ms)')
+    if medians['total_ms'] > args.budget_ms:
+        failures.append(f'cold start took {medians["total_ms"]:.1f}ms (budget {args.budget_ms:.0f}ms)')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if not failures:
+        print('Cold start within budget')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Bulk import and streaming export of employment and education records.
+
+Imports take a JSON array (or {"entries": [...]}) or a CSV file with a header
+row. Every entry is validated before anything is written, and the whole batch
+is inserted in the caller's transaction. Exports stream rows from the database
+in either format without building the full list in memory.
+"""
+import csv
+import io
+import json
+import re
+
+from models import db, Employment, Education, new_record_id, adjust_profile_counts
+
+MAX_IMPORT_ENTRIES = 500
+EXPORT_BATCH_SIZE = 100
+
+RECORD_TYPES = {
+    'employment': {
+        'model': Employment,
+        'fields': ['job_title', 'company', 'start_date', 'end_date', 'current_job', 'location', 'responsibilities'],
+        'required': ['job_title', 'company'],
+        'current_flag': 'current_job',
+        'count_column': 'employment_count',
+    },
+    'education': {
+        'model': Education,
+        'fields': ['degree', 'field_of_study', 'institution', 'start_date', 'end_date', 'current_education',
+                   'location', 'gpa', 'achievements'],
+        'required': ['degree', 'institution'],
+        'current_flag': 'current_education',
+        'count_column': 'education_count',
+    },
+}
+
+# Month inputs post YYYY-MM; other tools often export a year or a full date
+_DATE = re.compile(r'^\d{4}(-\d{2}(-\d{2})?)?$')
+_TRUE_VALUES = {'true', '1', 'yes', 'y', 'on'}
+_FALSE_VALUES = {'false', '0', 'no', 'n', 'off', ''}
+
+class ImportValidationError(ValueError):
+    """Raised when an import batch is malformed; errors lists each bad row and field"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+def parse_request(request):
+    """Read import entries from an uploaded file or the request body"""
+    upload = request.files.get('file')
+    if upload is not None and upload.filename:
+        is_csv = upload.filename.lower().endswith('.csv')
+        return parse_entries(upload.read(), 'text/csv' if is_csv else 'application/json')
+    return parse_entries(request.get_data(), request.mimetype)
+
+def parse_entries(data, mimetype):
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportValidationError('Import must be UTF-8 encoded')
+
+    if mimetype in ('text/csv', 'application/csv'):
+        entries = list(csv.DictReader(io.StringIO(text)))
+    else:
+        try:
+            entries = json.loads(text)
+        except ValueError:
+            raise ImportValidationError('Import body is not valid JSON')
+        if isinstance(entries, dict):
+            entries = entries.get('entries')
+
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise ImportValidationError('Import must be a list of objects or a CSV file with a header row')
+    if not entries:
+        raise ImportValidationError('Import contains no entries')
+    if len(entries) > MAX_IMPORT_ENTRIES:
+        raise ImportValidationError(f'Import is limited to {MAX_IMPORT_ENTRIES} entries at a time')
+    return entries
+
+def _parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    value = str(value).strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError('must be true or false')
+
+def clean_field(record_type, field, value):
+    """Normalize one field of an employment or education record; raises ValueError if it is invalid"""
+    spec = RECORD_TYPES[record_type]
+    if field not in spec['fields']:
+        raise ValueError('unknown field')
+    if field == spec['current_flag']:
+        return _parse_flag(value)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError('must be a string')
+
+    value = str(value).strip()
+    length = spec['model'].__table__.columns[field].type.length
+    if length and len(value) > length:
+        raise ValueError(f'must be at most {length} characters')
+    if field in ('start_date', 'end_date') and not _DATE.match(value) and not (field == 'end_date' and value == 'Present'):
+        raise ValueError('must be a date like 2020-01')
+    return value
+
+def _clean_entry(record_type, spec, entry):
+    """Return (clean entry, [(field, error)])"""
+    clean = {}
+    errors = []
+
+    for field in entry:
+        if field not in spec['fields'] and field != 'id':
+            errors.append((field, 'unknown field'))
+
+    for field in spec['fields']:
+        try:
+            clean[field] = clean_field(record_type, field, entry.get(field))
+        except ValueError as e:
+            # Keep the raw value so a bad required field is not also reported as missing
+            clean[field] = entry.get(field)
+            errors.append((field, str(e)))
+
+    for field in spec['required']:
+        if not clean.get(field):
+            errors.append((field, 'is required'))
+
+    # Same convention as the forms: current entries end at 'Present'
+    if clean.get(spec['current_flag']):
+        clean['end_date'] = 'Present'
+    return clean, errors
+
+def validate_entries(record_type, entries):
+    """Validate a whole batch, raising ImportValidationError listing every problem"""
+    spec = RECORD_TYPES[record_type]
+    cleaned = []
+    errors = []
+    for row, entry in enumerate(entries):
+        clean, entry_errors = _clean_entry(record_type, spec, entry)
+        cleaned.append(clean)
+        errors.extend({'row': row, 'field': field, 'error': error} for field, error in entry_errors)
+    if errors:
+        raise ImportValidationError(f'{len(errors)} problem(s) found; nothing was imported', errors)
+    return cleaned
+
+def import_entries(user_id, record_type, entries):
+    """Validate and add a batch of records; committed with the caller's transaction"""
+    spec = RECORD_TYPES[record_type]
+    records = [spec['model'](user_id=user_id, id=new_record_id(), **entry)
+               for entry in validate_entries(record_type, entries)]
+    db.session.add_all(records)
+    adjust_profile_counts(user_id, **{spec['count_column']: len(records)})
+    return records
+
+def _export_query(user_id, record_type):
+    model = RECORD_TYPES[record_type]['model']
+    return model.query.filter_by(user_id=user_id).order_by(model.pk).yield_per(EXPORT_BATCH_SIZE)
+
+def stream_json(user_id, record_type):
+    """Yield the user's records as a JSON array, one record at a time"""
+    yield '['
+    for index, record in enumerate(_export_query(user_id, record_type)):
+        yield (',' if index else '') + json.dumps(record.to_dict())
+    yield ']'
+
+def stream_csv(user_id, record_type):
+    """Yield the user's records as CSV rows with the same columns the import accepts"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['id'] + RECORD_TYPES[record_type]['fields'])
+    writer.writeheader()
+    for record in _export_query(user_id, record_type):
+        writer.writerow(record.to_dict())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
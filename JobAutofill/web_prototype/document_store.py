@@ -0,0 +1,160 @@
+"""Content-addressed storage for uploaded documents.
+
+Uploads are streamed to a temporary file in chunks while their SHA-256 is
+computed, then moved to a sharded path derived from the hash
+(uploads/ab/cd/abcd...). Identical files are stored once and reference
+counted with atomic UPDATEs. A row is dropped when its last document is
+deleted, and upload_sweeper unlinks the file once it has been unreferenced
+for the grace period, so a concurrent upload of the same content can never
+be left pointing at a deleted blob.
+
+Each distinct file a user stores counts once against UPLOAD_QUOTA_BYTES, however
+many of their documents use it. The usage counter on the profile is reserved
+atomically before a new file is stored and given back when the user's last
+document using it is deleted; upload_sweeper corrects any drift.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Document, Profile, StoredFile, get_profile
+
+CHUNK_SIZE = 64 * 1024
+
+class QuotaExceeded(ValueError):
+    """Raised when an upload would take a user past their storage quota"""
+
+def _upload_folder():
+    return current_app.config['UPLOAD_FOLDER']
+
+def _temp_folder():
+    folder = os.path.join(_upload_folder(), 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def blob_path(sha256):
+    """Sharded on-disk location of a stored file"""
+    return os.path.join(_upload_folder(), sha256[:2], sha256[2:4], sha256)
+
+class HashingTempFile:
+    """Writable temp file that hashes everything written to it"""
+
+    def __init__(self, folder):
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix='upload-', delete=False)
+        self._hash = hashlib.sha256()
+        self.path = self._file.name
+        self.size = 0
+        self.stored = False
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+        # Uploads that were never stored (e.g. failed requests) leave no temp file behind
+        if not self.stored and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Request class that streams file uploads straight into the document store"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingTempFile(_temp_folder())
+
+def _hashing_copy(stream):
+    # Fallback for streams that did not come through UploadRequest
+    target = HashingTempFile(_temp_folder())
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        target.write(chunk)
+    return target
+
+def reserve_quota(user_id, size):
+    """Add size to the user's usage if it stays within quota; returns False otherwise
+
+    A single conditional UPDATE, so concurrent uploads cannot overshoot the
+    quota together. Committed with the caller's transaction.
+    """
+    get_profile(user_id)
+    query = Profile.query.filter_by(user_id=user_id)
+    quota = current_app.config.get('UPLOAD_QUOTA_BYTES')
+    if quota:
+        query = query.filter(Profile.upload_bytes + size <= quota)
+    return query.update({Profile.upload_bytes: Profile.upload_bytes + size}, synchronize_session=False) == 1
+
+def _user_has_file(user_id, sha256):
+    return db.session.query(Document.query.filter_by(user_id=user_id, sha256=sha256).exists()).scalar()
+
+def store_upload(file_storage, user_id=None):
+    """Store an uploaded file by content hash, returning its SHA-256
+
+    With a user_id the file's size is charged to that user's quota first,
+    unless one of their documents already uses the same file; raises
+    QuotaExceeded (and discards the upload) if it does not fit.
+    The caller commits the session.
+    """
+    upload = file_storage.stream
+    if not isinstance(upload, HashingTempFile):
+        upload = _hashing_copy(upload)
+    upload.flush()
+    sha256 = upload.hexdigest()
+    
+    charged = user_id is not None and not _user_has_file(user_id, sha256)
+    if charged and not reserve_quota(user_id, upload.size):
+        upload.close()
+        quota_mb = current_app.config['UPLOAD_QUOTA_BYTES'] / (1024 * 1024)
+        raise QuotaExceeded(f'This upload would take you past your {quota_mb:g} MB storage limit. '
+                            'Delete some documents and try again.')
+    
+    # Always moved into place, even over an identical blob: the file then exists whatever a concurrent
+    # release or sweep did, and its fresh mtime keeps the sweeper off it until this upload commits
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(upload.path, path)
+    upload.stored = True
+    upload.close()
+    
+    if not _add_reference(sha256):
+        try:
+            with db.session.begin_nested():
+                db.session.add(StoredFile(sha256=sha256, size=upload.size, ref_count=1))
+        except IntegrityError:
+            # Another upload of the same content inserted the row first
+            _add_reference(sha256)
+    return sha256
+
+def _add_reference(sha256):
+    return StoredFile.query.filter_by(sha256=sha256).update(
+        {StoredFile.ref_count: StoredFile.ref_count + 1}, synchronize_session=False) == 1
+
+def release(sha256, user_id=None):
+    """Drop one reference to a stored file, dropping its row when no documents use it
+
+    Call it before deleting the document that used the file. With a user_id
+    the file's size is given back to that user's quota if this was their last
+    document using it. The blob itself is left for upload_sweeper. The caller
+    commits the session.
+    """
+    size = db.session.query(StoredFile.size).filter_by(sha256=sha256).scalar()
+    if size is None:
+        return
+    if user_id is not None and Document.query.filter_by(user_id=user_id, sha256=sha256).count() <= 1:
+        remaining = db.case((Profile.upload_bytes > size, Profile.upload_bytes - size), else_=0)
+        Profile.query.filter_by(user_id=user_id).update({Profile.upload_bytes: remaining}, synchronize_session=False)
+    StoredFile.query.filter_by(sha256=sha256).update(
+        {StoredFile.ref_count: StoredFile.ref_count - 1}, synchronize_session=False)
+    StoredFile.query.filter(StoredFile.sha256 == sha256, StoredFile.ref_count <= 0).delete(
+        synchronize_session=False)
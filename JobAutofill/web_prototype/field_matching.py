@@ -0,0 +1,296 @@
+"""Server-side form field classification for the Chrome extension.
+
+The pattern tables mirror findMatchingProfileValue in chrome-extension/js/content.js.
+They are compiled once at import into a single Aho-Corasick automaton, so each
+field identifier is scanned once regardless of how many patterns there are, and
+results are memoized per normalized field signature.
+"""
+from collections import deque
+from functools import lru_cache
+import re
+
+# Field descriptor attributes produced by extractFieldInfo, in signature order
+FIELD_ATTRIBUTES = ['id', 'name', 'label', 'placeholder', 'ariaLabel', 'automationId']
+
+SIGNATURE_CACHE_SIZE = 4096
+
+# Rules are checked in priority order; the first match wins.
+#   key:              profile key (None means the field must be left empty)
+#   patterns:         matched against identifiers with word-boundary rules
+#   contains:         tuples of substrings that must all occur in one identifier
+#   exclude:          patterns that veto the rule when matched with boundaries
+#   exclude_contains: substrings that veto the rule when present anywhere
+#   workday_only:     only applied when the form is in Workday mode
+MATCH_RULES = [
+    {
+        'key': 'phoneType',
+        'patterns': ['phonetype', 'phone type', 'phone-type', 'phone_type', 'phonedevicetype',
+                     'device type', 'phone--type', 'phonenumber--phonetype'],
+        'contains': [('phone', 'type'), ('phone', 'device')],
+        'exclude': ['extension', 'ext'],
+    },
+    {
+        'key': None,  # Phone extensions must not get the phone number
+        'patterns': ['phone ext', 'phone extension', 'phoneext', 'phoneextension', 'phone-ext',
+                     'extension', 'ext', 'phone 2', 'secondary phone'],
+    },
+    {'key': 'address', 'contains': [('address--addressline1',), ('address--line1',)], 'workday_only': True},
+    {'key': 'city', 'contains': [('address--city',)], 'workday_only': True},
+    {'key': 'state', 'contains': [('address--state',), ('address--region',)], 'workday_only': True},
+    {'key': 'zip', 'contains': [('address--postalcode',), ('address--zipcode',)], 'workday_only': True},
+    {
+        'key': 'firstName',
+        'patterns': ['first name', 'firstname', 'first-name', 'given name', 'given-name', 'fname',
+                     'legalname--firstname', 'name--first', 'first_name', 'givenname', 'workday.firstname'],
+    },
+    {
+        'key': 'middleName',
+        'patterns': ['middle name', 'middlename', 'middle-name', 'middle initial', 'mi', 'mname',
+                     'legalname--middlename', 'name--middle', 'middle_name', 'middleinitial'],
+    },
+    {
+        'key': 'lastName',
+        'patterns': ['last name', 'lastname', 'last-name', 'family name', 'family-name', 'lname', 'surname',
+                     'legalname--lastname', 'name--last', 'last_name', 'familyname', 'workday.lastname'],
+    },
+    {
+        'key': 'suffix',
+        'patterns': ['suffix', 'name suffix', 'name--suffix', 'legalname--suffix', 'title suffix',
+                     'name title', 'honorific', 'generation', 'generational suffix'],
+    },
+    {
+        'key': 'fullName',
+        'patterns': ['full name', 'fullname', 'full-name', 'name', 'complete name', 'full legal name'],
+        'exclude': ['first', 'last', 'user'],
+    },
+    {
+        'key': 'email',
+        'patterns': ['email', 'e-mail', 'emailaddress', 'email address', 'email-address',
+                     'contact--email', 'workday.email', 'mail', 'e mail', 'primary email'],
+    },
+    {
+        'key': 'phone',
+        'patterns': ['phone', 'telephone', 'phone number', 'phonenumber', 'phone-number', 'mobile', 'cell',
+                     'contact--phone', 'workphone', 'mobile-phone', 'cell-phone', 'mobile number',
+                     'primary phone', 'daytime phone', 'evening phone', 'home phone'],
+        'exclude': ['ext', 'extension', 'phone2', 'phone 2', 'secondary'],
+    },
+    {
+        'key': 'address',
+        'patterns': ['address', 'street', 'street address', 'address line 1', 'addressline1',
+                     'streetaddress', 'address1', 'address--line1', 'location--address', 'mailing address',
+                     'street-address', 'address_line_1', 'addressstreet', 'residentialaddress'],
+        'exclude': ['email', 'mail', 'city', 'state', 'zip', 'postal', 'country'],
+        'exclude_contains': ['city', 'state', 'zip', 'postal', 'country'],
+    },
+    {
+        'key': 'city',
+        'patterns': ['city', 'town', 'municipality', 'city name', 'cityname', 'address--city'],
+        'contains': [('city',)],
+        'exclude': ['address line', 'addressline', 'street'],
+    },
+    {
+        'key': 'state',
+        'patterns': ['state', 'province', 'region', 'state/province', 'state name', 'administrative area',
+                     'address--state', 'address--region'],
+        'contains': [('state',), ('region',)],
+        'exclude': ['address line', 'addressline', 'street'],
+    },
+    {
+        'key': 'zip',
+        'patterns': ['zip', 'zipcode', 'zip code', 'zip-code', 'postal', 'postalcode', 'postal code',
+                     'postal-code', 'address--postalcode', 'address--zipcode'],
+        'contains': [('zip',), ('postal',)],
+        'exclude': ['address line', 'addressline', 'street'],
+    },
+    {
+        'key': 'country',
+        'patterns': ['country', 'nation', 'country name', 'countryname', 'address--country'],
+    },
+    {
+        'key': 'linkedin',
+        'patterns': ['linkedin', 'linked-in', 'linkedinurl', 'linkedin url', 'linkedin-url',
+                     'socialmedia--linkedin', 'social-linkedin', 'linkedin profile'],
+    },
+    {
+        'key': 'website',
+        'patterns': ['website', 'web site', 'personal website', 'portfolio', 'web-site',
+                     'personalsite', 'personal-site', 'portfoliourl', 'portfolio url'],
+    },
+    {
+        'key': 'employment.company',
+        'patterns': ['company', 'employer', 'organization', 'company name', 'employer name',
+                     'workplace', 'business', 'firm', 'employer information', 'current employer'],
+    },
+    {
+        'key': 'employment.job_title',
+        'patterns': ['job title', 'jobtitle', 'position', 'title', 'role', 'job-title',
+                     'occupation', 'job_title', 'job role', 'job position', 'current position',
+                     'current role', 'current title', 'profession'],
+    },
+    {
+        'key': 'employment.responsibilities',
+        'patterns': ['description', 'responsibilities', 'job description', 'duties',
+                     'work description', 'role description', 'job details'],
+    },
+    {
+        'key': 'education.institution',
+        'patterns': ['school', 'university', 'college', 'institution', 'school name',
+                     'university name', 'educational institution', 'alma mater',
+                     'education institution', 'academic institution'],
+    },
+    {
+        'key': 'education.degree',
+        'patterns': ['degree', 'qualification', 'academic degree', 'diploma', 'certificate',
+                     'degree name', 'degree-earned', 'degree_name', 'degree earned',
+                     'education level', 'level of education'],
+    },
+    {
+        'key': 'education.field_of_study',
+        'patterns': ['field of study', 'field-of-study', 'major', 'concentration', 'study field',
+                     'specialization', 'subject', 'discipline', 'field_of_study', 'area of study',
+                     'program', 'course', 'academic focus'],
+    },
+    {
+        'key': 'education.gpa',
+        'patterns': ['gpa', 'grade point average', 'grade-point-average', 'grade_point_average',
+                     'academic average', 'grade average'],
+    },
+]
+
+_WHITESPACE = re.compile(r'\s+')
+_SEPARATORS = frozenset(' \t\n\r\f\v-_')
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+class PatternIndex:
+    """Aho-Corasick automaton over every pattern and substring used by the rules"""
+
+    def __init__(self, terms):
+        self.terms = sorted(set(terms))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for term_id, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(term_id)
+
+        # Breadth-first pass to build failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, text):
+        """Return (terms occurring anywhere, terms occurring on a word boundary) in text"""
+        present = set()
+        bounded = set()
+        length = len(text)
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for term_id in self._output[state]:
+                term = self.terms[term_id]
+                present.add(term)
+                if term not in bounded and self._on_boundary(text, length, end - len(term), end):
+                    bounded.add(term)
+        return present, bounded
+
+    @staticmethod
+    def _on_boundary(text, length, start, end):
+        # Same acceptance rules as matchesPattern in content.js
+        if start == 0 or end == length:
+            return True
+        before = text[start - 1]
+        after = text[end]
+        if before in _SEPARATORS or after in _SEPARATORS:
+            return True
+        if not _is_word_char(before) and not _is_word_char(after):
+            return True
+        if end - start > 5:
+            return (_is_word_char(before) != _is_word_char(text[start])
+                    and _is_word_char(after) != _is_word_char(text[end - 1]))
+        return False
+
+def _compile_rules(rules):
+    terms = []
+    for rule in rules:
+        terms.extend(rule.get('patterns', []))
+        terms.extend(rule.get('exclude', []))
+        terms.extend(rule.get('exclude_contains', []))
+        for group in rule.get('contains', []):
+            terms.extend(group)
+    return PatternIndex(terms)
+
+# Compiled once at startup
+_INDEX = _compile_rules(MATCH_RULES)
+
+def normalize_identifier(value):
+    if not value:
+        return ''
+    return _WHITESPACE.sub(' ', str(value).strip().lower())
+
+def field_signature(field):
+    """Normalized, hashable signature of a field descriptor"""
+    return tuple(normalize_identifier(field.get(attribute)) for attribute in FIELD_ATTRIBUTES)
+
+def _rule_matches(rule, bounded, per_identifier_present, present):
+    if rule.get('exclude_contains') and any(term in present for term in rule['exclude_contains']):
+        return False
+    if any(term in bounded for term in rule.get('exclude', [])):
+        return False
+    if any(term in bounded for term in rule.get('patterns', [])):
+        return True
+    for group in rule.get('contains', []):
+        if any(all(term in identifier_terms for term in group) for identifier_terms in per_identifier_present):
+            return True
+    return False
+
+@lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def match_signature(signature, is_workday=False):
+    """Classify a normalized field signature, returning a profile key or None"""
+    present = set()
+    bounded = set()
+    per_identifier_present = []
+    for identifier in set(signature):
+        if not identifier:
+            continue
+        identifier_present, identifier_bounded = _INDEX.scan(identifier)
+        present |= identifier_present
+        bounded |= identifier_bounded
+        per_identifier_present.append(identifier_present)
+
+    for rule in MATCH_RULES:
+        if rule.get('workday_only') and not is_workday:
+            continue
+        if _rule_matches(rule, bounded, per_identifier_present, present):
+            return rule['key']
+    return None
+
+def match_fields(fields, is_workday=False):
+    """Classify a batch of field descriptors, returning one profile key (or None) per field"""
+    return [match_signature(field_signature(field), bool(is_workday)) for field in fields]
+
+def cache_info():
+    return match_signature.cache_info()
@@ -0,0 +1,197 @@
+"""Per-user, per-host fill plans learned from past applications.
+
+A fill plan is the field signature -> profile key mapping that worked for a
+user on one ATS tenant's form. Repeat visits to the same tenant reuse it
+instead of classifying every field again. Plans belong to the user who saved
+them, so one account can never change how another's forms are filled, and
+only keys the matching engine knows are accepted. Plans are stored in the
+database, bounded by MAX_FILL_PLANS with least-recently-used eviction, and
+versioned so they can be dropped when the matching rules or the tenant's form
+change.
+
+Using a plan never writes on the request path: hits are counted in memory and
+added to the rows with SQL-side increments at most every
+FILL_PLAN_HIT_FLUSH_INTERVAL seconds.
+"""
+from collections import Counter
+from datetime import datetime
+import hashlib
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, FillPlan
+import field_matching
+
+# Bump when field signatures or profile keys change meaning; older plans are discarded
+PLAN_SCHEMA_VERSION = 1
+
+DEFAULT_MAX_FILL_PLANS = 1000
+DEFAULT_HIT_FLUSH_INTERVAL = 60
+
+# Profile keys a plan may map a field to
+PROFILE_KEYS = frozenset(rule['key'] for rule in field_matching.MATCH_RULES if rule['key'])
+
+# Hosts shared by many companies, where the tenant is the first path segment
+MULTI_TENANT_HOSTS = {
+    'boards.greenhouse.io',
+    'job-boards.greenhouse.io',
+    'jobs.lever.co',
+    'jobs.ashbyhq.com',
+    'apply.workable.com',
+}
+
+def plan_host(url):
+    """Key identifying the ATS tenant for a job URL, e.g. 'acme.wd5.myworkdayjobs.com' or 'jobs.lever.co/acme'"""
+    parts = urlsplit(url if '//' in url else f'//{url}')
+    host = (parts.hostname or '').lower()
+    if host in MULTI_TENANT_HOSTS:
+        tenant = parts.path.strip('/').split('/', 1)[0].lower()
+        if tenant:
+            return f'{host}/{tenant}'
+    return host
+
+def signature_key(signature):
+    return '\x1f'.join(signature)
+
+def form_fingerprint(signature_keys):
+    """Order-independent hash of the set of fields on a form"""
+    digest = hashlib.sha1()
+    for key in sorted(set(signature_keys)):
+        digest.update(key.encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+def _max_plans():
+    return current_app.config.get('MAX_FILL_PLANS', DEFAULT_MAX_FILL_PLANS)
+
+def get_plan(user_id, host):
+    """Return the user's current FillPlan for a host, or None if missing or built by an older schema
+
+    Read-only: a plan from an older schema is replaced by the next save_plan, or evicted.
+    """
+    plan = FillPlan.query.filter_by(user_id=user_id, host=host).first()
+    if plan is not None and plan.schema_version != PLAN_SCHEMA_VERSION:
+        return None
+    return plan
+
+class PlanHits:
+    """Plan hits counted per (user, host) since they were last written"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._written_at = time.monotonic()
+
+    def add(self, user_id, host):
+        interval = current_app.config.get('FILL_PLAN_HIT_FLUSH_INTERVAL', DEFAULT_HIT_FLUSH_INTERVAL)
+        with self._lock:
+            self._counts[(user_id, host)] += 1
+            if time.monotonic() - self._written_at < interval:
+                return
+            counts, self._counts = self._counts, Counter()
+            self._written_at = time.monotonic()
+        write_hits(counts)
+
+def write_hits(counts):
+    """Add counted hits to their plans and mark them used"""
+    now = datetime.now()
+    try:
+        for (user_id, host), count in counts.items():
+            FillPlan.query.filter_by(user_id=user_id, host=host).update(
+                {FillPlan.hits: FillPlan.hits + count, FillPlan.last_used: now}, synchronize_session=False)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception('Failed to record fill plan hits', extra={'fields': {'hosts': len(counts)}})
+
+_hits = PlanHits()
+
+def touch_plan(plan):
+    _hits.add(plan.user_id, plan.host)
+
+def save_plan(user_id, host, fields, keys):
+    """Store the mapping that worked for the user on a host's form, replacing their previous plan
+
+    Every key must be None or one of PROFILE_KEYS.
+    """
+    mapping = {
+        signature_key(field_matching.field_signature(field)): key
+        for field, key in zip(fields, keys)
+    }
+    fingerprint = form_fingerprint(mapping)
+    encoded = json.dumps(mapping, separators=(',', ':'))
+    
+    plan = FillPlan.query.filter_by(user_id=user_id, host=host).first()
+    if plan is None:
+        plan = FillPlan(user_id=user_id, host=host, version=1, hits=0, schema_version=PLAN_SCHEMA_VERSION,
+                        fingerprint=fingerprint, plan=encoded, last_used=datetime.now())
+        try:
+            with db.session.begin_nested():
+                db.session.add(plan)
+        except IntegrityError:
+            # Another of the user's requests saved the first plan for this host; update that one instead
+            plan = FillPlan.query.filter_by(user_id=user_id, host=host).one()
+    if plan.fingerprint != fingerprint or plan.schema_version != PLAN_SCHEMA_VERSION:
+        # The tenant's form changed, so this is a new plan version
+        plan.version += 1
+    plan.schema_version = PLAN_SCHEMA_VERSION
+    plan.fingerprint = fingerprint
+    plan.plan = encoded
+    plan.last_used = datetime.now()
+    db.session.flush()
+    
+    _evict_least_recently_used(_max_plans())
+    db.session.commit()
+    return plan
+
+def drop_plan(user_id, host):
+    deleted = FillPlan.query.filter_by(user_id=user_id, host=host).delete()
+    db.session.commit()
+    return deleted > 0
+
+def _evict_least_recently_used(max_plans):
+    excess = FillPlan.query.count() - max_plans
+    if excess > 0:
+        stale = [pk for (pk,) in db.session.query(FillPlan.pk).order_by(FillPlan.last_used).limit(excess)]
+        FillPlan.query.filter(FillPlan.pk.in_(stale)).delete(synchronize_session=False)
+
+def match_with_plan(user_id, host, fields, is_workday=False, record_hit=True):
+    """Classify fields using the user's plan for the host where possible, falling back to the matching engine
+
+    Returns (keys, plan) where plan is the FillPlan used, or None; anonymous
+    callers (user_id None) always get the engine's answer. With record_hit
+    False nothing is counted or written, so it is safe inside a caller's transaction.
+    """
+    plan = get_plan(user_id, host) if user_id and host else None
+    if plan is None:
+        return field_matching.match_fields(fields, is_workday), None
+    
+    mapping = json.loads(plan.plan)
+    keys = []
+    for field in fields:
+        signature = field_matching.field_signature(field)
+        key_in_plan = signature_key(signature)
+        if key_in_plan in mapping:
+            keys.append(mapping[key_in_plan])
+        else:
+            keys.append(field_matching.match_signature(signature, bool(is_workday)))
+    if record_hit:
+        touch_plan(plan)
+    return keys, plan
+
+def field_identifier(field):
+    """The attribute a client uses to find a field again: id, then name, automation id or label"""
+    return field.get('id') or field.get('name') or field.get('automationId') or field.get('label') or ''
+
+def match_payload(user_id, host, fields, is_workday=False, record_hit=True):
+    """/api/match-fields response for a form's field descriptors"""
+    keys, plan = match_with_plan(user_id, host, fields, is_workday, record_hit)
+    response = {'matches': [{'field': field_identifier(field), 'key': key} for field, key in zip(fields, keys)]}
+    if plan is not None:
+        response['plan'] = {'host': plan.host, 'version': plan.version}
+    return response
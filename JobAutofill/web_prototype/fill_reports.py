@@ -0,0 +1,426 @@
+"""Fill-outcome telemetry from the extension's autofillForm.
+
+POST /api/fill-report takes a batch of per-field outcomes, optionally gzipped,
+so the extension can flush them with navigator.sendBeacon or a keepalive
+fetch. The request thread only decodes and validates the batch and puts its
+rows on a bounded queue; when the queue is full the batch is dropped with a
+503 rather than slowing the request down.
+
+A writer thread appends the rows to a columnar log under FILL_REPORT_DIR:
+one segment per day and process, made of zlib-compressed blocks with one
+array per column and the strings in each block dictionary-encoded. It also
+folds the rows into rollups by ATS tenant and field signature, and by
+application, which are added to the database every
+FILL_REPORT_ROLLUP_INTERVAL seconds. ``flask rebuild-fill-stats`` recomputes
+the rollups from the segments on disk. It replaces every count, so it refuses
+once retention has removed a segment, and every app process must be stopped
+first: their unwritten rollups hold rows that are already in the log.
+"""
+import array
+import atexit
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import click
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+import field_matching
+import fill_plans
+import metrics
+from models import db, Application, FillStat, bump_section_versions, refresh_recent_applications
+
+OUTCOMES = ('filled', 'skipped', 'failed', 'corrected')
+
+# Decompressed size and field count limits for one batch
+MAX_BATCH_BYTES = 1024 * 1024
+MAX_BATCH_FIELDS = 5000
+MAX_IDENTIFIER_LENGTH = 200
+# Rows returned by one /api/fill-stats query
+MAX_STATS_ROWS = 100
+
+DEFAULT_QUEUE_SIZE = 10000  # batches
+DEFAULT_ROLLUP_INTERVAL = 30.0
+DEFAULT_RETENTION_DAYS = 30
+# The writer appends a block once it has this many rows, or after BLOCK_INTERVAL seconds
+BLOCK_ROWS = 4096
+BLOCK_INTERVAL = 1.0
+
+BLOCK_MAGIC = b'FRB1'
+_FRAME = struct.Struct('<4sI')
+
+# (name, array typecode); string columns hold indices into the block's dictionary for that column
+COLUMNS = [('ts', 'I'), ('user', 'I'), ('url', 'I'), ('host', 'I'), ('signature', 'I'), ('key', 'I'),
+           ('outcome', 'B'), ('ms', 'f')]
+STRING_COLUMNS = {'user', 'url', 'host', 'signature', 'key'}
+
+class ReportError(ValueError):
+    """Raised for a batch that cannot be decoded or does not match the expected shape"""
+
+class RebuildError(Exception):
+    """Raised when the log no longer holds every report, so the rollups cannot be recomputed from it"""
+
+def read_batch(request):
+    """Decode a request body, gzipped or not, into the batch's JSON object"""
+    body = request.get_data(cache=False)
+    # sendBeacon cannot set Content-Encoding, so gzip is also recognized by its magic number
+    if request.content_encoding == 'gzip' or body[:2] == b'\x1f\x8b':
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            body = decompressor.decompress(body, MAX_BATCH_BYTES)
+        except zlib.error:
+            raise ReportError('Body is not valid gzip')
+        if decompressor.unconsumed_tail:
+            raise ReportError(f'Batch is larger than {MAX_BATCH_BYTES} bytes uncompressed')
+    elif len(body) > MAX_BATCH_BYTES:
+        raise ReportError(f'Batch is larger than {MAX_BATCH_BYTES} bytes')
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ReportError('Batch is not valid JSON')
+
+def parse_batch(user_id, data):
+    """Rows for a {"reports": [{"url", "fields": [...]}]} batch; raises ReportError if malformed
+
+    Each field is an extractFieldInfo descriptor plus "key" (the profile key it
+    was matched to, or null), "outcome" (one of OUTCOMES) and "ms".
+    """
+    reports = data.get('reports') if isinstance(data, dict) else None
+    if not isinstance(reports, list):
+        raise ReportError('Expected a JSON body with a "reports" list')
+    now = int(time.time())
+    rows = []
+    for report in reports:
+        if not isinstance(report, dict) or not isinstance(report.get('url'), str) or not isinstance(report.get('fields'), list):
+            raise ReportError('Each report needs a "url" and a "fields" list')
+        url = report['url']
+        host = fill_plans.plan_host(url)
+        for field in report['fields']:
+            if not isinstance(field, dict) or field.get('outcome') not in OUTCOMES:
+                raise ReportError(f'Each field needs an "outcome" of {", ".join(OUTCOMES)}')
+            key = field.get('key')
+            ms = field.get('ms', 0)
+            if (key is not None and not isinstance(key, str)) or not isinstance(ms, (int, float)) or isinstance(ms, bool):
+                raise ReportError('Field "key" must be a string or null and "ms" a number')
+            signature = tuple(identifier[:MAX_IDENTIFIER_LENGTH] for identifier in field_matching.field_signature(field))
+            rows.append((now, user_id, url, host, fill_plans.signature_key(signature), key and key[:64],
+                         OUTCOMES.index(field['outcome']), max(0.0, float(ms))))
+        if len(rows) > MAX_BATCH_FIELDS:
+            raise ReportError(f'A batch may hold at most {MAX_BATCH_FIELDS} fields')
+    return rows
+
+def encode_block(rows):
+    """Serialize rows as one compressed, framed columnar block"""
+    header = {'rows': len(rows), 'columns': COLUMNS, 'strings': {}}
+    arrays = []
+    for position, (name, typecode) in enumerate(COLUMNS):
+        values = [row[position] for row in rows]
+        if name in STRING_COLUMNS:
+            # Index 0 is reserved for null
+            strings = {None: 0}
+            values = [strings.setdefault(value, len(strings)) for value in values]
+            header['strings'][name] = list(strings)[1:]
+        column = array.array(typecode, values)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        arrays.append(column.tobytes())
+    payload = zlib.compress(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n' + b''.join(arrays))
+    return _FRAME.pack(BLOCK_MAGIC, len(payload)) + payload
+
+def decode_block(payload):
+    """Rows from one block's compressed payload"""
+    header_text, _, data = zlib.decompress(payload).partition(b'\n')
+    header = json.loads(header_text)
+    count = header['rows']
+    columns = []
+    offset = 0
+    for name, typecode in header['columns']:
+        column = array.array(typecode)
+        size = column.itemsize * count
+        column.frombytes(data[offset:offset + size])
+        offset += size
+        if sys.byteorder == 'big':
+            column.byteswap()
+        if name in STRING_COLUMNS:
+            strings = [None] + header['strings'][name]
+            column = [strings[index] for index in column]
+        columns.append(column)
+    return list(zip(*columns))
+
+def read_segment(path):
+    """Yield the rows of every complete block in a segment, ignoring a torn final block"""
+    with open(path, 'rb') as f:
+        while True:
+            frame = f.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                return
+            magic, length = _FRAME.unpack(frame)
+            payload = f.read(length)
+            if magic != BLOCK_MAGIC or len(payload) < length:
+                return
+            yield from decode_block(payload)
+
+class ColumnarLog:
+    """Append-only segments of columnar blocks, one file per day and process"""
+
+    # Written once retention removes a segment, holding the first day still kept
+    PRUNED_MARKER = 'pruned'
+
+    def __init__(self, folder, retention_days):
+        self.folder = folder
+        self.retention_days = retention_days
+        self._day = None
+        self._file = None
+
+    def segments(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith('.frlog'))
+
+    def append(self, rows):
+        today = date.today()
+        if today != self._day:
+            self._rotate(today)
+        self._file.write(encode_block(rows))
+        self._file.flush()
+
+    def _rotate(self, today):
+        self.close()
+        os.makedirs(self.folder, exist_ok=True)
+        self._day = today
+        self._file = open(os.path.join(self.folder, f'fill-reports-{today:%Y%m%d}-{os.getpid()}.frlog'), 'ab')
+        cutoff = f'fill-reports-{today - timedelta(days=self.retention_days):%Y%m%d}'
+        for path in self.segments():
+            if os.path.basename(path) < cutoff:
+                os.remove(path)
+                with open(os.path.join(self.folder, self.PRUNED_MARKER), 'w') as f:
+                    f.write(cutoff[len('fill-reports-'):])
+
+    def pruned_before(self):
+        """First day still on disk if retention has removed older segments, else None"""
+        try:
+            with open(os.path.join(self.folder, self.PRUNED_MARKER)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._day = None
+
+class Rollup:
+    """Outcome counts folded from rows, by (host, signature, key) and by (user, url)"""
+
+    def __init__(self):
+        # Counts per outcome, then total milliseconds
+        self.signatures = defaultdict(lambda: [0] * (len(OUTCOMES) + 1))
+        self.applications = defaultdict(lambda: [0] * (len(OUTCOMES) + 1))
+        self.reported_at = {}
+
+    def __bool__(self):
+        return bool(self.signatures or self.applications)
+
+    def add(self, rows):
+        for ts, user_id, url, host, signature, key, outcome, ms in rows:
+            for totals in (self.signatures[(host, signature, key or '')], self.applications[(user_id, url)]):
+                totals[outcome] += 1
+                totals[-1] += ms
+            self.reported_at[(user_id, url)] = max(ts, self.reported_at.get((user_id, url), 0))
+
+    def write(self):
+        """Add the counts to fill_stats and the reported applications, in one transaction"""
+        now = datetime.now()
+        for (host, signature, key), totals in self.signatures.items():
+            _add_signature_totals(host, signature, key, totals, now)
+        users = set()
+        for (user_id, url), totals in self.applications.items():
+            updated = Application.query.filter_by(user_id=user_id, url=url).update(
+                dict(_increments(Application, APPLICATION_COLUMNS, totals),
+                     fill_reported_at=datetime.fromtimestamp(self.reported_at[(user_id, url)])),
+                synchronize_session=False)
+            if updated:
+                users.add(user_id)
+        # The recent list on the profile keeps copies of the application entries
+        for user_id in users:
+            refresh_recent_applications(user_id)
+            bump_section_versions(user_id, 'applications')
+        db.session.commit()
+
+APPLICATION_COLUMNS = ['fields_filled', 'fields_skipped', 'fields_failed', 'fields_corrected', 'fill_ms']
+STAT_COLUMNS = ['filled', 'skipped', 'failed', 'corrected', 'total_ms']
+
+def _increments(model, columns, totals):
+    return {getattr(model, column): getattr(model, column) + value for column, value in zip(columns, totals)}
+
+def _add_signature_totals(host, signature, key, totals, now):
+    signature_hash = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+    query = FillStat.query.filter_by(host=host, signature_hash=signature_hash, key=key)
+    values = dict(_increments(FillStat, STAT_COLUMNS, totals), updated_at=now)
+    if query.update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(FillStat(host=host, signature_hash=signature_hash, signature=signature, key=key,
+                                    updated_at=now, **dict(zip(STAT_COLUMNS, totals))))
+    except IntegrityError:
+        # Another worker's rollup created the row first
+        query.update(values, synchronize_session=False)
+
+class FillReportWriter:
+    """Drains queued batches into the columnar log and writes rollups periodically"""
+
+    def __init__(self, app, log, queue_size, rollup_interval):
+        self.app = app
+        self.log = log
+        self.rollup_interval = rollup_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._rollup = Rollup()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='fill-reports', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, rows):
+        """Queue a batch's rows; returns False when the queue is full and the batch was dropped"""
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            metrics.FILL_REPORT_FIELDS.inc(('dropped',), len(rows))
+            return False
+        metrics.FILL_REPORT_FIELDS.inc(('accepted',), len(rows))
+        return True
+
+    def _run(self):
+        next_rollup = time.monotonic() + self.rollup_interval
+        while not self._stopped.is_set():
+            self._append(self._drain(time.monotonic() + BLOCK_INTERVAL))
+            if time.monotonic() >= next_rollup:
+                self.write_rollup()
+                next_rollup = time.monotonic() + self.rollup_interval
+
+    def _drain(self, deadline):
+        rows = []
+        while len(rows) < BLOCK_ROWS:
+            timeout = deadline - time.monotonic()
+            try:
+                rows.extend(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _append(self, rows):
+        if not rows:
+            return
+        try:
+            self.log.append(rows)
+        except OSError:
+            self.app.logger.exception('Failed to append fill reports to the log',
+                                      extra={'fields': {'rows': len(rows)}})
+        self._rollup.add(rows)
+
+    def write_rollup(self):
+        rollup, self._rollup = self._rollup, Rollup()
+        if not rollup:
+            return
+        with self.app.app_context():
+            try:
+                rollup.write()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Failed to write fill report rollups',
+                                          extra={'fields': {'signatures': len(rollup.signatures)}})
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        while True:
+            rows = self._drain(0)
+            if not rows:
+                break
+            self._append(rows)
+        self.write_rollup()
+        self.log.close()
+
+def submit(user_id, data):
+    """Validate a batch and queue it for the writer; returns the field count, or None if it was dropped"""
+    rows = parse_batch(user_id, data)
+    if rows and not current_app.extensions['fill_reports'].submit(rows):
+        return None
+    return len(rows)
+
+def _stat_dict(totals, total_ms):
+    count = sum(totals.values())
+    totals['fill_rate'] = round(totals['filled'] / count, 4) if count else None
+    totals['avg_ms'] = round(total_ms / count, 2) if count else None
+    return totals
+
+def host_stats(host, limit):
+    """Per field signature outcome counts on one ATS tenant, most reported first"""
+    total = sum(getattr(FillStat, column) for column in STAT_COLUMNS[:-1])
+    stats = FillStat.query.filter_by(host=host).order_by(total.desc()).limit(limit).all()
+    return [
+        dict(_stat_dict({outcome: getattr(stat, outcome) for outcome in OUTCOMES}, stat.total_ms),
+             field=dict(zip(field_matching.FIELD_ATTRIBUTES, stat.signature.split('\x1f'))),
+             key=stat.key or None)
+        for stat in stats
+    ]
+
+def top_hosts(limit):
+    """Outcome counts summed per ATS tenant, most reported first"""
+    sums = [db.func.sum(getattr(FillStat, column)) for column in STAT_COLUMNS]
+    rows = (db.session.query(FillStat.host, *sums).group_by(FillStat.host)
+            .order_by(sum(sums[:-1]).desc()).limit(limit).all())
+    return [dict(_stat_dict(dict(zip(OUTCOMES, row[1:-1])), row[-1]), host=row[0]) for row in rows]
+
+def rebuild(log):
+    """Recompute fill_stats and the applications' fill counts from the segments on disk
+
+    Every app process must have stopped its writer first, or rollups it has not
+    written yet are added on top of the rebuilt counts. Raises RebuildError once
+    retention has removed a segment, since the counts it held would be lost.
+    """
+    pruned_before = log.pruned_before()
+    if pruned_before is not None:
+        raise RebuildError(f'Reports before {pruned_before} are no longer in the log')
+    FillStat.query.delete()
+    Application.query.update(dict({column: 0 for column in APPLICATION_COLUMNS}, fill_reported_at=None))
+    rollup = Rollup()
+    for path in log.segments():
+        rollup.add(read_segment(path))
+    rollup.write()
+    return len(rollup.signatures)
+
+def init_app(app):
+    """Start the report writer for this app and register the rebuild-fill-stats CLI command"""
+    log = ColumnarLog(app.config.get('FILL_REPORT_DIR') or os.path.join(app.instance_path, 'fill_reports'),
+                      app.config.get('FILL_REPORT_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+    writer = FillReportWriter(app, log, app.config.get('FILL_REPORT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                              app.config.get('FILL_REPORT_ROLLUP_INTERVAL', DEFAULT_ROLLUP_INTERVAL))
+    app.extensions['fill_reports'] = writer
+
+    @app.cli.command('rebuild-fill-stats')
+    @click.confirmation_option(prompt='Every app process must be stopped first. Rebuild the fill stats?')
+    def rebuild_fill_stats():
+        """Recompute fill outcome rollups from the fill report log"""
+        writer.stop()
+        try:
+            rebuilt = rebuild(log)
+        except RebuildError as e:
+            raise click.ClickException(f'{e}; the rollups were left as they are') from e
+        click.echo(f'Rebuilt {rebuilt} field signature rollups')
+
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
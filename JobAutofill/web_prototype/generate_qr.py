@@ -1,4 +1,3 @@
-import qrcode
 import socket
 import os
 
@@ -17,6 +16,7 @@ def get_local_ip():
 
 def generate_qr_code(url, output_path='qr_code.png'):
     """Generate a QR code for the given URL"""
+    import qrcode
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -0,0 +1,221 @@
+"""Request instrumentation exposed in Prometheus text format at /metrics.
+
+Records per-endpoint latency, session cookie size, Jinja render time per
+template and document upload/download bytes. Everything is kept in process
+memory, so each worker process reports its own numbers.
+
+A stack-sampling profiler can be switched on for a single request with the
+X-Profile: 1 header (or ?_profile=1) when PROFILER_ENABLED is set. It writes
+folded stacks, ready for flamegraph.pl or speedscope, to instance/profiles.
+"""
+from collections import Counter
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+import jinja2
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RENDER_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+# Browsers drop cookies over 4KB, so the top buckets are the ones to watch
+SESSION_BUCKETS = (128, 256, 512, 1024, 2048, 3072, 4096)
+
+DEFAULT_PROFILER_INTERVAL = 0.005
+
+class Histogram:
+    """Cumulative Prometheus histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            label_text = _format_labels(self.label_names, labels)
+            prefix = label_text + ',' if label_text else ''
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+class CounterMetric:
+    """Monotonic Prometheus counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{{_format_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+REQUEST_LATENCY = Histogram('jobautofill_request_duration_seconds', 'Time spent handling a request, including session save',
+                            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+SESSION_SIZE = Histogram('jobautofill_session_cookie_bytes', 'Size of the serialized session cookie per request',
+                         ('endpoint',), SESSION_BUCKETS)
+TEMPLATE_RENDER = Histogram('jobautofill_template_render_seconds', 'Time spent rendering each top-level template',
+                            ('template',), RENDER_BUCKETS)
+UPLOAD_BYTES = CounterMetric('jobautofill_upload_bytes_total', 'Bytes received in multipart uploads', ('endpoint',))
+DOWNLOAD_BYTES = CounterMetric('jobautofill_download_bytes_total', 'Document bytes sent to clients', ('endpoint',))
+PROFILE_PATCHES = CounterMetric('jobautofill_profile_patches_total', 'PATCH /api/profile requests buffered for writing', ())
+PROFILE_PATCH_FLUSHES = CounterMetric('jobautofill_profile_patch_flushes_total',
+                                      'Coalesced profile writes, by what triggered them', ('trigger',))
+FILL_REPORT_FIELDS = CounterMetric('jobautofill_fill_report_fields_total',
+                                   'Field outcomes received in fill reports, by whether they were queued or dropped',
+                                   ('status',))
+PREFETCHED_PAGES = CounterMetric('jobautofill_prefetched_pages_total',
+                                 'Job pages queued for prefetch, by whether they were read, failed or dropped',
+                                 ('status',))
+
+ALL_METRICS = [REQUEST_LATENCY, SESSION_SIZE, TEMPLATE_RENDER, UPLOAD_BYTES, DOWNLOAD_BYTES,
+               PROFILE_PATCHES, PROFILE_PATCH_FLUSHES, FILL_REPORT_FIELDS, PREFETCHED_PAGES]
+
+# Endpoints whose response bodies count as document downloads
+DOWNLOAD_ENDPOINTS = {'download_document'}
+
+class TimedTemplate(jinja2.Template):
+    """Template that records its render time; includes and parents are counted in the top-level template"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER.observe((self.name or '<string>',), time.perf_counter() - start)
+
+class SamplingProfiler:
+    """Periodically samples one thread's Python stack and counts folded stacks"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+def _wants_profile(app):
+    if not app.config.get('PROFILER_ENABLED'):
+        return False
+    return request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+
+def _session_cookie_size(app, response):
+    cookie_name = app.session_cookie_name
+    if response is not None:
+        for header in response.headers.getlist('Set-Cookie'):
+            if header.startswith(cookie_name + '='):
+                return len(header.split(';', 1)[0]) - len(cookie_name) - 1
+    return len(request.cookies.get(cookie_name, ''))
+
+def init_app(app):
+    """Install the request hooks and the Jinja template class on the app"""
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        if _wants_profile(app):
+            g.profiler = SamplingProfiler(threading.get_ident(),
+                                          app.config.get('PROFILER_INTERVAL', DEFAULT_PROFILER_INTERVAL))
+            g.profiler.start()
+
+    @app.after_request
+    def remember_response(response):
+        # The session cookie is written after this hook, so sizes are read at teardown
+        g.metrics_response = response
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        response = g.pop('metrics_response', None)
+        endpoint = request.endpoint or 'unmatched'
+        status = response.status_code if response is not None else 500
+
+        REQUEST_LATENCY.observe((endpoint, request.method, str(status)), elapsed)
+        SESSION_SIZE.observe((endpoint,), _session_cookie_size(app, response))
+        if request.mimetype == 'multipart/form-data' and request.content_length:
+            UPLOAD_BYTES.inc((endpoint,), request.content_length)
+        if (endpoint in DOWNLOAD_ENDPOINTS and response is not None and request.method == 'GET'
+                and response.status_code in (200, 206) and response.content_length):
+            DOWNLOAD_BYTES.inc((endpoint,), response.content_length)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            profile_dir = os.path.join(app.instance_path, 'profiles')
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f'{endpoint}-{int(time.time() * 1000)}.folded')
+            profiler.write(path)
+            app.logger.info('Wrote request profile to %s', path)
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,509 @@
+import base64
+from datetime import datetime, timedelta
+import json
+from urllib.parse import urlparse
+import uuid
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+db = SQLAlchemy()
+
+# Number of applications kept on the profile for the dashboard
+RECENT_APPLICATIONS_LIMIT = 3
+
+# Applications per page of history on the autofill page and the API
+APPLICATIONS_PAGE_SIZE = 20
+MAX_APPLICATIONS_PAGE_SIZE = 100
+
+# Profile versions kept in the change log; older clients get a full snapshot from /api/profile/changes
+CHANGE_LOG_VERSIONS = 200
+
+# Personal info fields saved from the profile form
+PERSONAL_INFO_FIELDS = [
+    'first_name', 'last_name', 'email', 'phone', 'phone_type', 'address',
+    'city', 'state', 'zip', 'linkedin', 'website', 'summary'
+]
+
+class Profile(db.Model):
+    """Personal information for a single user"""
+    __tablename__ = 'profiles'
+
+    user_id = db.Column(db.String(80), primary_key=True)
+    first_name = db.Column(db.String(120))
+    last_name = db.Column(db.String(120))
+    email = db.Column(db.String(255))
+    phone = db.Column(db.String(50))
+    phone_type = db.Column(db.String(20))
+    address = db.Column(db.String(255))
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    zip = db.Column(db.String(20))
+    linkedin = db.Column(db.String(255))
+    website = db.Column(db.String(255))
+    summary = db.Column(db.Text)
+    # Incremented on every profile write so cached API payloads can be invalidated
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Maintained by the write routes so the dashboard never has to scan the user's records
+    employment_count = db.Column(db.Integer, nullable=False, default=0)
+    education_count = db.Column(db.Integer, nullable=False, default=0)
+    resume_count = db.Column(db.Integer, nullable=False, default=0)
+    cover_letter_count = db.Column(db.Integer, nullable=False, default=0)
+    recent_applications = db.Column(db.Text)  # JSON list of the newest applications, newest first
+    # Per-section versions so cached page fragments are only invalidated by edits to their own section
+    employment_version = db.Column(db.Integer, nullable=False, default=0)
+    education_version = db.Column(db.Integer, nullable=False, default=0)
+    documents_version = db.Column(db.Integer, nullable=False, default=0)
+    applications_version = db.Column(db.Integer, nullable=False, default=0)
+    # Change log entries up to this version have been compacted away
+    changes_compacted_version = db.Column(db.Integer, nullable=False, default=0)
+    # Bytes of stored files used by the user's documents, checked against UPLOAD_QUOTA_BYTES
+    upload_bytes = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in PERSONAL_INFO_FIELDS if getattr(self, field) is not None}
+
+    def section_versions(self):
+        return {
+            'profile': self.version,
+            'employment': self.employment_version,
+            'education': self.education_version,
+            'documents': self.documents_version,
+            'applications': self.applications_version
+        }
+
+class Employment(db.Model):
+    """A single job in a user's employment history"""
+    __tablename__ = 'employment'
+    __table_args__ = (db.Index('ix_employment_user_record', 'user_id', 'id', unique=True),)
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    id = db.Column(db.String(32), nullable=False)
+    job_title = db.Column(db.String(255))
+    company = db.Column(db.String(255))
+    start_date = db.Column(db.String(20))
+    end_date = db.Column(db.String(20))
+    current_job = db.Column(db.Boolean, default=False)
+    location = db.Column(db.String(255))
+    responsibilities = db.Column(db.Text)
+
+    def to_dict(self):
+        return {
+            'job_title': self.job_title,
+            'company': self.company,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'current_job': self.current_job,
+            'location': self.location,
+            'responsibilities': self.responsibilities,
+            'id': self.id
+        }
+
+class Education(db.Model):
+    """A single school in a user's education history"""
+    __tablename__ = 'education'
+    __table_args__ = (db.Index('ix_education_user_record', 'user_id', 'id', unique=True),)
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    id = db.Column(db.String(32), nullable=False)
+    degree = db.Column(db.String(255))
+    field_of_study = db.Column(db.String(255))
+    institution = db.Column(db.String(255))
+    start_date = db.Column(db.String(20))
+    end_date = db.Column(db.String(20))
+    current_education = db.Column(db.Boolean, default=False)
+    location = db.Column(db.String(255))
+    gpa = db.Column(db.String(20))
+    achievements = db.Column(db.Text)
+
+    def to_dict(self):
+        return {
+            'degree': self.degree,
+            'field_of_study': self.field_of_study,
+            'institution': self.institution,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'current_education': self.current_education,
+            'location': self.location,
+            'gpa': self.gpa,
+            'achievements': self.achievements,
+            'id': self.id
+        }
+
+class Document(db.Model):
+    """An uploaded resume or cover letter"""
+    __tablename__ = 'documents'
+    __table_args__ = (
+        db.Index('ix_documents_user_type_record', 'user_id', 'doc_type', 'id', unique=True),
+        db.Index('ix_documents_user_filename', 'user_id', 'filename'),
+    )
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    doc_type = db.Column(db.String(20), nullable=False)  # 'resume' or 'cover_letter'
+    id = db.Column(db.String(32), nullable=False)
+    name = db.Column(db.String(255))
+    filename = db.Column(db.String(255), nullable=False)
+    original_filename = db.Column(db.String(255))
+    upload_date = db.Column(db.String(40))
+    sha256 = db.Column(db.String(64), index=True)
+
+class StoredFile(db.Model):
+    """An uploaded file stored once by content hash and shared by every document that uses it"""
+    __tablename__ = 'stored_files'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class StorageSweep(db.Model):
+    """One pass of the upload store sweeper and what it cleaned up"""
+    __tablename__ = 'storage_sweeps'
+
+    pk = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+    finished_at = db.Column(db.DateTime)
+    files_removed = db.Column(db.Integer, nullable=False, default=0)
+    bytes_reclaimed = db.Column(db.Integer, nullable=False, default=0)
+    refs_fixed = db.Column(db.Integer, nullable=False, default=0)
+    documents_migrated = db.Column(db.Integer, nullable=False, default=0)
+    usage_fixed = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+            'files_removed': self.files_removed,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'refs_fixed': self.refs_fixed,
+            'documents_migrated': self.documents_migrated,
+            'usage_fixed': self.usage_fixed
+        }
+
+class Application(db.Model):
+    """A job application the user has autofilled"""
+    __tablename__ = 'applications'
+    __table_args__ = (
+        db.Index('ix_applications_user_record', 'user_id', 'id', unique=True),
+        db.Index('ix_applications_user_created', 'user_id', 'created_at', 'pk'),
+        db.Index('ix_applications_user_host_created', 'user_id', 'host', 'created_at', 'pk'),
+        # Applying to the same posting again updates the existing entry
+        db.Index('ux_applications_user_url', 'user_id', 'url', unique=True),
+    )
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    id = db.Column(db.String(32), nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    host = db.Column(db.String(255))
+    title = db.Column(db.String(255))
+    date = db.Column(db.String(40))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # Field outcomes reported by the extension for this application, rolled up by fill_reports
+    fields_filled = db.Column(db.Integer, nullable=False, default=0)
+    fields_skipped = db.Column(db.Integer, nullable=False, default=0)
+    fields_failed = db.Column(db.Integer, nullable=False, default=0)
+    fields_corrected = db.Column(db.Integer, nullable=False, default=0)
+    fill_ms = db.Column(db.Float, nullable=False, default=0)
+    fill_reported_at = db.Column(db.DateTime)
+    # The job page as read by page_prefetch: status is 'pending', 'done' or 'failed'
+    company = db.Column(db.String(255))
+    prefetch_status = db.Column(db.String(10))
+    prefetch_requested_at = db.Column(db.DateTime)
+    prefetched_at = db.Column(db.DateTime)
+    prefetch_error = db.Column(db.String(255))
+    # JSON field descriptors found on the page, and the /api/match-fields style plan for them
+    form_schema = db.Column(db.Text)
+    form_field_count = db.Column(db.Integer)
+    fill_plan = db.Column(db.Text)
+
+    @property
+    def fill(self):
+        """Summary of the reported field outcomes, or None if the extension has not reported any"""
+        if self.fill_reported_at is None:
+            return None
+        return {
+            'filled': self.fields_filled,
+            'skipped': self.fields_skipped,
+            'failed': self.fields_failed,
+            'corrected': self.fields_corrected,
+            'ms': round(self.fill_ms),
+            'reported_at': self.fill_reported_at.isoformat(timespec='seconds')
+        }
+
+    @property
+    def prefetch(self):
+        """Summary of the page prefetch, or None if the page was never queued"""
+        if self.prefetch_status is None:
+            return None
+        summary = {'status': self.prefetch_status}
+        if self.prefetch_status == 'done':
+            summary['fields'] = self.form_field_count
+        elif self.prefetch_status == 'failed':
+            summary['error'] = self.prefetch_error
+        return summary
+
+    def to_dict(self):
+        entry = {'url': self.url, 'host': self.host, 'date': self.date, 'title': self.title, 'id': self.id}
+        if self.company:
+            entry['company'] = self.company
+        if self.fill is not None:
+            entry['fill'] = self.fill
+        if self.prefetch is not None:
+            entry['prefetch'] = self.prefetch
+        return entry
+
+class ProfileChange(db.Model):
+    """One record added, modified or deleted by a profile write, tagged with the version it produced"""
+    __tablename__ = 'profile_changes'
+    __table_args__ = (db.Index('ix_profile_changes_user_version', 'user_id', 'version'),)
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    section = db.Column(db.String(20), nullable=False)  # 'profile', 'employment' or 'education'
+    record_id = db.Column(db.String(32))  # None for personal info
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+class ParseJob(db.Model):
+    """A background resume parse and the profile entries it proposes"""
+    __tablename__ = 'parse_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False, index=True)
+    document_id = db.Column(db.String(32))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, done, failed, accepted, rejected
+    result = db.Column(db.Text)  # JSON proposals once parsing is done
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'document_id': self.document_id,
+            'status': self.status,
+            'proposals': json.loads(self.result) if self.result else None,
+            'error': self.error
+        }
+
+class FillPlan(db.Model):
+    """Field signature to profile key mapping one user saved for one ATS tenant's form"""
+    __tablename__ = 'fill_plans'
+    __table_args__ = (db.Index('ux_fill_plans_user_host', 'user_id', 'host', unique=True),)
+
+    pk = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(80), nullable=False)
+    host = db.Column(db.String(255), nullable=False)
+    schema_version = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    plan = db.Column(db.Text, nullable=False)  # JSON object of signature key -> profile key
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    last_used = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+
+class FillStat(db.Model):
+    """Fill outcomes reported for one field signature and matched key on one ATS tenant"""
+    __tablename__ = 'fill_stats'
+    __table_args__ = (db.Index('ux_fill_stats_host_signature_key', 'host', 'signature_hash', 'key', unique=True),)
+
+    pk = db.Column(db.Integer, primary_key=True)
+    host = db.Column(db.String(255), nullable=False)
+    signature_hash = db.Column(db.String(40), nullable=False)
+    signature = db.Column(db.Text, nullable=False)  # fill_plans.signature_key of the field
+    key = db.Column(db.String(64), nullable=False, default='')  # '' when no profile key was matched
+    filled = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    corrected = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+def init_db(app):
+    """Bind the database to the app and create any missing tables"""
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+def new_record_id():
+    """Collision-free id for an employment, education, document or application record"""
+    return uuid.uuid4().hex
+
+# Data access helpers, all scoped to a single user
+def get_profile(user_id):
+    """Get the user's profile, creating an empty one on first access"""
+    profile = Profile.query.get(user_id)
+    if profile is None:
+        profile = Profile(user_id=user_id)
+        db.session.add(profile)
+        db.session.commit()
+    return profile
+
+def get_profile_version(user_id):
+    return db.session.query(Profile.version).filter_by(user_id=user_id).scalar()
+
+def bump_profile_version(user_id):
+    """Mark the user's profile as changed; committed with the caller's transaction"""
+    get_profile(user_id)
+    Profile.query.filter_by(user_id=user_id).update({Profile.version: Profile.version + 1})
+
+def log_profile_changes(user_id, changes):
+    """Record (section, record_id, deleted) changes under the profile's current version
+
+    Call after bumping the version; committed with the caller's transaction.
+    Entries more than CHANGE_LOG_VERSIONS versions old are compacted away in
+    batches, so the log stays bounded for users with long histories.
+    """
+    version, compacted = (db.session.query(Profile.version, Profile.changes_compacted_version)
+                          .filter_by(user_id=user_id).one())
+    db.session.add_all(ProfileChange(user_id=user_id, version=version, section=section,
+                                     record_id=record_id, deleted=deleted)
+                       for section, record_id, deleted in changes)
+    if version - compacted > 2 * CHANGE_LOG_VERSIONS:
+        cutoff = version - CHANGE_LOG_VERSIONS
+        ProfileChange.query.filter(ProfileChange.user_id == user_id,
+                                   ProfileChange.version <= cutoff).delete(synchronize_session=False)
+        Profile.query.filter_by(user_id=user_id).update({Profile.changes_compacted_version: cutoff})
+
+def get_profile_changes(user_id, since):
+    """Latest change per record after version since, as {(section, record_id): deleted}"""
+    changes = {}
+    query = (db.session.query(ProfileChange.section, ProfileChange.record_id, ProfileChange.deleted)
+             .filter(ProfileChange.user_id == user_id, ProfileChange.version > since)
+             .order_by(ProfileChange.version, ProfileChange.pk))
+    for section, record_id, deleted in query:
+        changes[section, record_id] = deleted
+    return changes
+
+def adjust_profile_counts(user_id, **deltas):
+    """Add deltas to the profile's record counters or section versions; committed with the caller's transaction"""
+    get_profile(user_id)
+    Profile.query.filter_by(user_id=user_id).update(
+        {getattr(Profile, column): getattr(Profile, column) + delta for column, delta in deltas.items()})
+
+def bump_section_versions(user_id, *sections):
+    """Invalidate cached fragments for the given sections ('employment', 'documents', ...)"""
+    adjust_profile_counts(user_id, **{f'{section}_version': 1 for section in sections})
+
+def get_recent_applications(profile):
+    return json.loads(profile.recent_applications or '[]')
+
+def push_recent_application(user_id, application):
+    """Put a new or resubmitted application at the front of the profile's bounded recent list"""
+    profile = get_profile(user_id)
+    recent = [application.to_dict()] + [entry for entry in get_recent_applications(profile)
+                                         if entry['id'] != application.id]
+    profile.recent_applications = json.dumps(recent[:RECENT_APPLICATIONS_LIMIT])
+
+def refresh_recent_applications(user_id):
+    """Rebuild the recent list from the created_at index after an application is removed"""
+    profile = get_profile(user_id)
+    recent = get_applications(user_id, limit=RECENT_APPLICATIONS_LIMIT)
+    profile.recent_applications = json.dumps([application.to_dict() for application in recent])
+
+def get_employment_history(user_id):
+    return Employment.query.filter_by(user_id=user_id).order_by(Employment.pk).all()
+
+def get_employment(user_id, job_id):
+    return Employment.query.filter_by(user_id=user_id, id=job_id).first()
+
+def get_education_history(user_id):
+    return Education.query.filter_by(user_id=user_id).order_by(Education.pk).all()
+
+def get_education(user_id, edu_id):
+    return Education.query.filter_by(user_id=user_id, id=edu_id).first()
+
+def get_documents(user_id, doc_type):
+    return Document.query.filter_by(user_id=user_id, doc_type=doc_type).order_by(Document.pk).all()
+
+def get_document(user_id, doc_type, doc_id):
+    return Document.query.filter_by(user_id=user_id, doc_type=doc_type, id=doc_id).first()
+
+def get_document_by_filename(user_id, filename):
+    return Document.query.filter_by(user_id=user_id, filename=filename).first()
+
+def get_parse_job(user_id, job_id):
+    return ParseJob.query.filter_by(user_id=user_id, id=job_id).first()
+
+def fail_stale_parse_jobs(user_id, timeout):
+    """Mark jobs queued for more than timeout seconds as failed, e.g. lost to a restart; the caller commits"""
+    cutoff = datetime.now() - timedelta(seconds=timeout)
+    return (ParseJob.query.filter_by(user_id=user_id, status='queued').filter(ParseJob.created_at < cutoff)
+            .update({'status': 'failed', 'error': 'Reading the resume took too long'}, synchronize_session=False))
+
+def get_pending_parse_jobs(user_id):
+    """Parse jobs whose proposals have not been accepted or rejected yet"""
+    return (ParseJob.query.filter_by(user_id=user_id)
+            .filter(ParseJob.status.in_(['queued', 'done', 'failed']))
+            .order_by(ParseJob.created_at).all())
+
+def get_applications(user_id, limit=None):
+    """Get the user's applications, most recent first"""
+    query = Application.query.filter_by(user_id=user_id).order_by(Application.created_at.desc(), Application.pk.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_application(user_id, app_id):
+    return Application.query.filter_by(user_id=user_id, id=app_id).first()
+
+def get_application_by_url(user_id, url):
+    return Application.query.filter_by(user_id=user_id, url=url).first()
+
+def application_host(url):
+    return (urlparse(url).hostname or '').lower()
+
+def record_application(user_id, url):
+    """Add an application, or move an earlier application to the same URL to the top of the history
+
+    Returns the application; committed with the caller's transaction.
+    """
+    now = datetime.now()
+    application = Application.query.filter_by(user_id=user_id, url=url).first()
+    if application is None:
+        host = application_host(url)
+        application = Application(user_id=user_id, id=new_record_id(), url=url, host=host,
+                                  title=f"Job Application at {host or url}")
+        try:
+            with db.session.begin_nested():
+                db.session.add(application)
+        except IntegrityError:
+            # Another request recorded the same URL first
+            application = Application.query.filter_by(user_id=user_id, url=url).one()
+    application.created_at = now
+    application.date = now.strftime('%B %d, %Y')
+    return application
+
+def encode_application_cursor(application):
+    raw = f'{application.created_at.isoformat()}|{application.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_application_cursor(cursor):
+    """Return (created_at, pk) for a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def get_application_page(user_id, cursor=None, limit=APPLICATIONS_PAGE_SIZE, host=None):
+    """Get one page of applications, most recent first, using keyset pagination
+
+    Returns (applications, next_cursor); next_cursor is None on the last page.
+    """
+    query = Application.query.filter_by(user_id=user_id)
+    if host:
+        query = query.filter_by(host=host.lower())
+    position = decode_application_cursor(cursor) if cursor else None
+    if position is not None:
+        created_at, pk = position
+        query = query.filter(or_(Application.created_at < created_at,
+                                 (Application.created_at == created_at) & (Application.pk < pk)))
+    applications = (query.order_by(Application.created_at.desc(), Application.pk.desc())
+                    .limit(limit + 1).all())
+    next_cursor = encode_application_cursor(applications[limit - 1]) if len(applications) > limit else None
+    return applications[:limit], next_cursor
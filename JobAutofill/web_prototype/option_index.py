@@ -0,0 +1,335 @@
+"""Resolve profile values to dropdown options for the Chrome extension.
+
+fillSelectField, findAndClickMatchingStateOption and findAndClickMatchingOption
+in chrome-extension/js/content.js scan every <option> or Workday listbox item
+once per dropdown. Here the canonical values for the dropdowns the extension
+fills (US states, countries, degrees and phone types) are normalized once at
+import into an alias table and a trigram index. Each option list sent by the
+extension is resolved to canonical values once and cached under a hash of its
+contents, so a repeat form costs a dictionary lookup per dropdown and the
+extension can send the hash instead of the options.
+
+Kinds use the profile keys from field_matching, so the output of
+/api/match-fields can be passed straight through.
+"""
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+import hashlib
+import re
+import threading
+
+OPTION_TABLE_CACHE_SIZE = 2048
+MAX_LISTS = 200
+MAX_OPTIONS = 2000
+# Dice coefficient over trigrams below which a fuzzy match is rejected
+MIN_SIMILARITY = 0.6
+# Aliases shorter than this (codes like "CA" or "BS") only ever match exactly
+MIN_FUZZY_LENGTH = 4
+
+# Each entry is the canonical value followed by its aliases
+US_STATES = [
+    ('Alabama', 'AL'), ('Alaska', 'AK'), ('Arizona', 'AZ'), ('Arkansas', 'AR'), ('California', 'CA'),
+    ('Colorado', 'CO'), ('Connecticut', 'CT'), ('Delaware', 'DE'),
+    ('District of Columbia', 'DC', 'Washington DC', 'Washington D.C.'), ('Florida', 'FL'),
+    ('Georgia', 'GA'), ('Hawaii', 'HI'), ('Idaho', 'ID'), ('Illinois', 'IL'), ('Indiana', 'IN'), ('Iowa', 'IA'),
+    ('Kansas', 'KS'), ('Kentucky', 'KY'), ('Louisiana', 'LA'), ('Maine', 'ME'), ('Maryland', 'MD'),
+    ('Massachusetts', 'MA'), ('Michigan', 'MI'), ('Minnesota', 'MN'), ('Mississippi', 'MS'), ('Missouri', 'MO'),
+    ('Montana', 'MT'), ('Nebraska', 'NE'), ('Nevada', 'NV'), ('New Hampshire', 'NH'), ('New Jersey', 'NJ'),
+    ('New Mexico', 'NM'), ('New York', 'NY'), ('North Carolina', 'NC'), ('North Dakota', 'ND'), ('Ohio', 'OH'),
+    ('Oklahoma', 'OK'), ('Oregon', 'OR'), ('Pennsylvania', 'PA'), ('Rhode Island', 'RI'),
+    ('South Carolina', 'SC'), ('South Dakota', 'SD'), ('Tennessee', 'TN'), ('Texas', 'TX'), ('Utah', 'UT'),
+    ('Vermont', 'VT'), ('Virginia', 'VA'), ('Washington', 'WA'), ('West Virginia', 'WV'), ('Wisconsin', 'WI'),
+    ('Wyoming', 'WY'), ('Puerto Rico', 'PR'), ('Guam', 'GU'), ('U.S. Virgin Islands', 'VI', 'Virgin Islands'),
+    ('American Samoa', 'AS'), ('Northern Mariana Islands', 'MP'),
+]
+
+COUNTRIES = [
+    ('United States', 'US', 'USA', 'United States of America', 'America'),
+    ('Canada', 'CA', 'CAN'), ('Mexico', 'MX', 'MEX'),
+    ('United Kingdom', 'GB', 'GBR', 'UK', 'Great Britain', 'Britain', 'England',
+     'United Kingdom of Great Britain and Northern Ireland'),
+    ('Ireland', 'IE', 'IRL'), ('Germany', 'DE', 'DEU'), ('France', 'FR', 'FRA'), ('Spain', 'ES', 'ESP'),
+    ('Portugal', 'PT', 'PRT'), ('Italy', 'IT', 'ITA'), ('Netherlands', 'NL', 'NLD', 'Holland', 'The Netherlands'),
+    ('Belgium', 'BE', 'BEL'), ('Luxembourg', 'LU', 'LUX'), ('Switzerland', 'CH', 'CHE'), ('Austria', 'AT', 'AUT'),
+    ('Denmark', 'DK', 'DNK'), ('Norway', 'NO', 'NOR'), ('Sweden', 'SE', 'SWE'), ('Finland', 'FI', 'FIN'),
+    ('Iceland', 'IS', 'ISL'), ('Poland', 'PL', 'POL'), ('Czechia', 'CZ', 'CZE', 'Czech Republic'),
+    ('Slovakia', 'SK', 'SVK'), ('Hungary', 'HU', 'HUN'), ('Romania', 'RO', 'ROU'), ('Bulgaria', 'BG', 'BGR'),
+    ('Greece', 'GR', 'GRC'), ('Croatia', 'HR', 'HRV'), ('Slovenia', 'SI', 'SVN'), ('Serbia', 'RS', 'SRB'),
+    ('Bosnia and Herzegovina', 'BA', 'BIH'), ('Montenegro', 'ME', 'MNE'), ('North Macedonia', 'MK', 'MKD', 'Macedonia'),
+    ('Albania', 'AL', 'ALB'), ('Kosovo', 'XK'), ('Estonia', 'EE', 'EST'), ('Latvia', 'LV', 'LVA'),
+    ('Lithuania', 'LT', 'LTU'), ('Belarus', 'BY', 'BLR'), ('Ukraine', 'UA', 'UKR'), ('Moldova', 'MD', 'MDA'),
+    ('Russia', 'RU', 'RUS', 'Russian Federation'), ('Malta', 'MT', 'MLT'), ('Cyprus', 'CY', 'CYP'),
+    ('Monaco', 'MC', 'MCO'), ('Andorra', 'AD', 'AND'), ('Liechtenstein', 'LI', 'LIE'), ('San Marino', 'SM', 'SMR'),
+    ('Vatican City', 'VA', 'VAT', 'Holy See'), ('Turkey', 'TR', 'TUR', 'Turkiye'), ('Georgia', 'GE', 'GEO'),
+    ('Armenia', 'AM', 'ARM'), ('Azerbaijan', 'AZ', 'AZE'), ('Kazakhstan', 'KZ', 'KAZ'), ('Uzbekistan', 'UZ', 'UZB'),
+    ('Turkmenistan', 'TM', 'TKM'), ('Kyrgyzstan', 'KG', 'KGZ'), ('Tajikistan', 'TJ', 'TJK'),
+    ('Israel', 'IL', 'ISR'), ('Palestine', 'PS', 'PSE'), ('Lebanon', 'LB', 'LBN'), ('Syria', 'SY', 'SYR'),
+    ('Jordan', 'JO', 'JOR'), ('Iraq', 'IQ', 'IRQ'), ('Iran', 'IR', 'IRN'), ('Saudi Arabia', 'SA', 'SAU'),
+    ('United Arab Emirates', 'AE', 'ARE', 'UAE'), ('Qatar', 'QA', 'QAT'), ('Bahrain', 'BH', 'BHR'),
+    ('Kuwait', 'KW', 'KWT'), ('Oman', 'OM', 'OMN'), ('Yemen', 'YE', 'YEM'), ('Afghanistan', 'AF', 'AFG'),
+    ('Pakistan', 'PK', 'PAK'), ('India', 'IN', 'IND'), ('Bangladesh', 'BD', 'BGD'), ('Sri Lanka', 'LK', 'LKA'),
+    ('Nepal', 'NP', 'NPL'), ('Bhutan', 'BT', 'BTN'), ('Maldives', 'MV', 'MDV'), ('China', 'CN', 'CHN', 'PRC'),
+    ('Hong Kong', 'HK', 'HKG'), ('Macau', 'MO', 'MAC', 'Macao'), ('Taiwan', 'TW', 'TWN'),
+    ('Japan', 'JP', 'JPN'), ('South Korea', 'KR', 'KOR', 'Korea', 'Republic of Korea'),
+    ('North Korea', 'KP', 'PRK'), ('Mongolia', 'MN', 'MNG'), ('Vietnam', 'VN', 'VNM', 'Viet Nam'),
+    ('Thailand', 'TH', 'THA'), ('Cambodia', 'KH', 'KHM'), ('Laos', 'LA', 'LAO'), ('Myanmar', 'MM', 'MMR', 'Burma'),
+    ('Malaysia', 'MY', 'MYS'), ('Singapore', 'SG', 'SGP'), ('Indonesia', 'ID', 'IDN'),
+    ('Philippines', 'PH', 'PHL'), ('Brunei', 'BN', 'BRN'), ('Timor-Leste', 'TL', 'TLS', 'East Timor'),
+    ('Australia', 'AU', 'AUS'), ('New Zealand', 'NZ', 'NZL'), ('Papua New Guinea', 'PG', 'PNG'),
+    ('Fiji', 'FJ', 'FJI'), ('Samoa', 'WS', 'WSM'), ('Tonga', 'TO', 'TON'), ('Vanuatu', 'VU', 'VUT'),
+    ('Solomon Islands', 'SB', 'SLB'), ('Kiribati', 'KI', 'KIR'), ('Micronesia', 'FM', 'FSM'),
+    ('Marshall Islands', 'MH', 'MHL'), ('Palau', 'PW', 'PLW'), ('Nauru', 'NR', 'NRU'), ('Tuvalu', 'TV', 'TUV'),
+    ('Egypt', 'EG', 'EGY'), ('Libya', 'LY', 'LBY'), ('Tunisia', 'TN', 'TUN'), ('Algeria', 'DZ', 'DZA'),
+    ('Morocco', 'MA', 'MAR'), ('Sudan', 'SD', 'SDN'), ('South Sudan', 'SS', 'SSD'), ('Ethiopia', 'ET', 'ETH'),
+    ('Eritrea', 'ER', 'ERI'), ('Djibouti', 'DJ', 'DJI'), ('Somalia', 'SO', 'SOM'), ('Kenya', 'KE', 'KEN'),
+    ('Uganda', 'UG', 'UGA'), ('Tanzania', 'TZ', 'TZA'), ('Rwanda', 'RW', 'RWA'), ('Burundi', 'BI', 'BDI'),
+    ('Democratic Republic of the Congo', 'CD', 'COD', 'DR Congo', 'DRC'),
+    ('Republic of the Congo', 'CG', 'COG', 'Congo'), ('Gabon', 'GA', 'GAB'),
+    ('Equatorial Guinea', 'GQ', 'GNQ'), ('Cameroon', 'CM', 'CMR'), ('Central African Republic', 'CF', 'CAF'),
+    ('Chad', 'TD', 'TCD'), ('Niger', 'NE', 'NER'), ('Nigeria', 'NG', 'NGA'), ('Benin', 'BJ', 'BEN'),
+    ('Togo', 'TG', 'TGO'), ('Ghana', 'GH', 'GHA'), ("Cote d'Ivoire", 'CI', 'CIV', 'Ivory Coast'),
+    ('Burkina Faso', 'BF', 'BFA'), ('Mali', 'ML', 'MLI'), ('Senegal', 'SN', 'SEN'), ('Gambia', 'GM', 'GMB'),
+    ('Guinea-Bissau', 'GW', 'GNB'), ('Guinea', 'GN', 'GIN'), ('Sierra Leone', 'SL', 'SLE'),
+    ('Liberia', 'LR', 'LBR'), ('Mauritania', 'MR', 'MRT'), ('Cabo Verde', 'CV', 'CPV', 'Cape Verde'),
+    ('Sao Tome and Principe', 'ST', 'STP'), ('Angola', 'AO', 'AGO'), ('Zambia', 'ZM', 'ZMB'),
+    ('Malawi', 'MW', 'MWI'), ('Mozambique', 'MZ', 'MOZ'), ('Zimbabwe', 'ZW', 'ZWE'), ('Botswana', 'BW', 'BWA'),
+    ('Namibia', 'NA', 'NAM'), ('South Africa', 'ZA', 'ZAF'), ('Lesotho', 'LS', 'LSO'),
+    ('Eswatini', 'SZ', 'SWZ', 'Swaziland'), ('Madagascar', 'MG', 'MDG'), ('Mauritius', 'MU', 'MUS'),
+    ('Seychelles', 'SC', 'SYC'), ('Comoros', 'KM', 'COM'), ('Guatemala', 'GT', 'GTM'), ('Belize', 'BZ', 'BLZ'),
+    ('Honduras', 'HN', 'HND'), ('El Salvador', 'SV', 'SLV'), ('Nicaragua', 'NI', 'NIC'),
+    ('Costa Rica', 'CR', 'CRI'), ('Panama', 'PA', 'PAN'), ('Cuba', 'CU', 'CUB'), ('Jamaica', 'JM', 'JAM'),
+    ('Haiti', 'HT', 'HTI'), ('Dominican Republic', 'DO', 'DOM'), ('Bahamas', 'BS', 'BHS', 'The Bahamas'),
+    ('Barbados', 'BB', 'BRB'), ('Trinidad and Tobago', 'TT', 'TTO'), ('Dominica', 'DM', 'DMA'),
+    ('Grenada', 'GD', 'GRD'), ('Saint Lucia', 'LC', 'LCA'), ('Saint Vincent and the Grenadines', 'VC', 'VCT'),
+    ('Saint Kitts and Nevis', 'KN', 'KNA'), ('Antigua and Barbuda', 'AG', 'ATG'), ('Colombia', 'CO', 'COL'),
+    ('Venezuela', 'VE', 'VEN'), ('Ecuador', 'EC', 'ECU'), ('Peru', 'PE', 'PER'), ('Bolivia', 'BO', 'BOL'),
+    ('Brazil', 'BR', 'BRA', 'Brasil'), ('Paraguay', 'PY', 'PRY'), ('Uruguay', 'UY', 'URY'),
+    ('Argentina', 'AR', 'ARG'), ('Chile', 'CL', 'CHL'), ('Guyana', 'GY', 'GUY'), ('Suriname', 'SR', 'SUR'),
+]
+
+# Canonical values are the ones the profile form stores
+PHONE_TYPES = [
+    ('Mobile', 'Cell', 'Cellphone', 'Cell Phone', 'Mobile Phone', 'Cellular', 'Mobile Telephone'),
+    ('Telephone', 'Home', 'Home Phone', 'Landline', 'Land Line', 'Residence', 'Home Telephone'),
+    ('Work', 'Business', 'Office', 'Work Phone', 'Business Phone', 'Office Phone', 'Company'),
+    ('Fax', 'Facsimile', 'Fax Number'),
+    ('Pager', 'Beeper'),
+]
+
+DEGREES = [
+    # A GED is listed with the diploma, since most forms offer "High School or equivalent"
+    ('High School Diploma', 'High School', 'HS Diploma', 'High School or Equivalent', 'Secondary School',
+     'Secondary School Diploma', 'GED', 'General Educational Development', 'High School Equivalency'),
+    ("Associate's Degree", 'Associate', 'Associate Degree', 'Associate of Arts', 'Associate of Science',
+     'Associate of Applied Science', 'AA', 'AS', 'AAS'),
+    ("Bachelor's Degree", 'Bachelor', 'Bachelor Degree', 'Bachelor of Science', 'Bachelor of Arts',
+     'Bachelor of Engineering', 'Bachelor of Fine Arts', 'Bachelor of Business Administration',
+     'Undergraduate Degree', 'BA', 'BS', 'BSc', 'BEng', 'BFA', 'BBA', 'AB'),
+    ("Master's Degree", 'Master', 'Master Degree', 'Master of Science', 'Master of Arts', 'Master of Engineering',
+     'Master of Fine Arts', 'Graduate Degree', 'MS', 'MA', 'MSc', 'MEng', 'MFA'),
+    ('MBA', 'Master of Business Administration'),
+    ('Doctorate', 'PhD', 'Ph D', 'Doctor of Philosophy', 'Doctoral Degree', 'DPhil', 'EdD', 'Doctor of Education'),
+    ('Juris Doctor', 'JD', 'Law Degree'),
+    ('Doctor of Medicine', 'MD', 'Medical Degree'),
+    ('Certificate', 'Certification', 'Professional Certificate'),
+]
+
+_PLACEHOLDER_RE = re.compile(r'^(?:|none|n a|select|choose|pick|please select|please choose|(?:select|choose|pick) .*)$')
+_PUNCTUATION_RE = re.compile(r"[.'’]")
+_NON_WORD_RE = re.compile(r'[^0-9a-z]+')
+# Option texts often combine a code and a name, e.g. "CA - California" or "United States (+1)"
+_PART_SEPARATORS_RE = re.compile(r'\s+-\s+|[(),/|:]|\s+in\s+', re.IGNORECASE)
+
+def normalize_option(text):
+    if not text:
+        return ''
+    text = _PUNCTUATION_RE.sub('', str(text).lower().replace('&', ' and '))
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class CanonicalIndex:
+    """Alias table and trigram index over one kind's canonical values"""
+
+    def __init__(self, entries):
+        self.values = [entry[0] for entry in entries]
+        self._aliases = {}
+        self._alias_entries = []
+        self._alias_trigram_counts = []
+        self._postings = defaultdict(list)
+        for entry_id, entry in enumerate(entries):
+            for alias in entry:
+                alias = normalize_option(alias)
+                # The first entry to claim an alias keeps it
+                self._aliases.setdefault(alias, entry_id)
+                if len(alias) < MIN_FUZZY_LENGTH:
+                    continue
+                alias_id = len(self._alias_entries)
+                self._alias_entries.append(entry_id)
+                trigrams = _trigrams(alias)
+                self._alias_trigram_counts.append(len(trigrams))
+                for trigram in trigrams:
+                    self._postings[trigram].append(alias_id)
+
+    def lookup(self, text):
+        """Entry id for an option text or profile value, or None if nothing is close enough"""
+        normalized = normalize_option(text)
+        if not normalized:
+            return None
+        entry_id = self._aliases.get(normalized)
+        if entry_id is not None:
+            return entry_id
+        for part in _PART_SEPARATORS_RE.split(str(text)):
+            entry_id = self._aliases.get(normalize_option(part))
+            if entry_id is not None:
+                return entry_id
+        return self._fuzzy_lookup(normalized)
+
+    def _fuzzy_lookup(self, normalized):
+        if len(normalized) < MIN_FUZZY_LENGTH:
+            return None
+        trigrams = _trigrams(normalized)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for alias_id in self._postings.get(trigram, ()):
+                shared[alias_id] += 1
+        best_id, best_score = None, MIN_SIMILARITY
+        for alias_id, count in shared.items():
+            score = 2 * count / (len(trigrams) + self._alias_trigram_counts[alias_id])
+            if score >= best_score:
+                best_id, best_score = alias_id, score
+        return None if best_id is None else self._alias_entries[best_id]
+
+# Built once at startup
+INDEXES = {
+    'state': CanonicalIndex(US_STATES),
+    'country': CanonicalIndex(COUNTRIES),
+    'phoneType': CanonicalIndex(PHONE_TYPES),
+    'education.degree': CanonicalIndex(DEGREES),
+}
+
+def _similarity(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+class OptionTable:
+    """One option list resolved to canonical values, for picking options in O(1)"""
+
+    def __init__(self, kind, options):
+        index = INDEXES.get(kind)
+        self.normalized = [normalize_option(option) for option in options]
+        self.by_text = {}
+        self.by_entry = {}
+        # Placeholders such as "Select One..." are never picked
+        self.selectable = []
+        for position, text in enumerate(self.normalized):
+            if _PLACEHOLDER_RE.match(text):
+                continue
+            self.selectable.append(position)
+            self.by_text.setdefault(text, position)
+            entry_id = index.lookup(options[position]) if index is not None else None
+            if entry_id is not None:
+                self.by_entry.setdefault(entry_id, position)
+        self._trigrams = None
+
+    def best_match(self, kind, value):
+        """Return (option index, how it matched) for a profile value; (None, None) if nothing fits"""
+        normalized = normalize_option(value)
+        if not normalized:
+            return None, None
+        position = self.by_text.get(normalized)
+        if position is not None:
+            return position, 'exact'
+        entry_id = _lookup_value(kind, value)
+        position = self.by_entry.get(entry_id) if entry_id is not None else None
+        if position is not None:
+            return position, 'canonical'
+        return self._fuzzy_match(normalized)
+
+    def _fuzzy_match(self, normalized):
+        if len(normalized) < MIN_FUZZY_LENGTH:
+            return None, None
+        if self._trigrams is None:
+            self._trigrams = [(position, _trigrams(self.normalized[position])) for position in self.selectable]
+        value_trigrams = _trigrams(normalized)
+        best_position, best_score = None, MIN_SIMILARITY
+        for position, trigrams in self._trigrams:
+            score = _similarity(value_trigrams, trigrams)
+            if score > best_score:
+                best_position, best_score = position, score
+        return (best_position, 'fuzzy') if best_position is not None else (None, None)
+
+@lru_cache(maxsize=4096)
+def _lookup_value(kind, value):
+    index = INDEXES.get(kind)
+    return index.lookup(value) if index is not None else None
+
+def options_hash(kind, options):
+    """Stable hash identifying an option list; the extension may send it in place of the options"""
+    digest = hashlib.sha1((kind or '').encode('utf-8'))
+    for option in options:
+        digest.update(b'\x1e')
+        digest.update(option.encode('utf-8'))
+    return digest.hexdigest()
+
+class OptionTableCache:
+    """Bounded LRU of resolved option lists keyed by options_hash"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return table
+
+    def put(self, key, table):
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+    def __len__(self):
+        return len(self._tables)
+
+_tables = OptionTableCache(OPTION_TABLE_CACHE_SIZE)
+
+def resolve(kind, value, options=None, list_hash=None):
+    """Pick the option for a value from a list, or from a list already seen under list_hash
+
+    Returns a result dict; 'missing' is set when list_hash is unknown and the options must be resent.
+    """
+    if options is not None:
+        list_hash = options_hash(kind, options)
+    table = _tables.get(list_hash)
+    if table is None:
+        if options is None:
+            return {'hash': list_hash, 'index': None, 'missing': True}
+        table = _tables.put(list_hash, OptionTable(kind, options))
+    position, how = table.best_match(kind, value)
+    return {'hash': list_hash, 'index': position, 'match': how}
+
+def canonical_value(kind, value):
+    """The canonical form of a profile value, e.g. 'CA' -> 'California', or None if unknown"""
+    entry_id = _lookup_value(kind, value)
+    return None if entry_id is None else INDEXES[kind].values[entry_id]
+
+def cache_info():
+    return {'tables': len(_tables), 'hits': _tables.hits, 'misses': _tables.misses,
+            'values': _lookup_value.cache_info()._asdict()}
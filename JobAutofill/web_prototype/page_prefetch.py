@@ -0,0 +1,452 @@
+"""Background prefetch of the job pages added to the application history.
+
+When a job URL is recorded its page is queued for a pool of PREFETCH_WORKERS
+threads sharing one pooled requests.Session, so a user pasting dozens of URLs
+reuses keep-alive connections and never has more than PREFETCH_PER_HOST
+requests open to one host. Each page is read with the standard library HTML
+parser for the job title, company and form fields, and the fields are matched
+to profile keys (through the host's fill plan when there is one) and stored on
+the application, so perform_autofill has the plan ready when the user opens it.
+
+Only public addresses are fetched unless PREFETCH_ALLOW_PRIVATE is set (for
+testing against a local server): every connection is opened to an address
+checked when it was resolved, and redirects are followed by hand so every hop
+goes through the same check.
+"""
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+import json
+import queue
+import re
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from flask import current_app
+
+import fill_plans
+import metrics
+from models import db, Application, bump_section_versions, refresh_recent_applications
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 2
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_TIMEOUT = 10
+# A page read less than this long ago is not fetched again when its URL is resubmitted
+DEFAULT_MAX_AGE = 24 * 60 * 60
+# A page still pending after this long was lost (e.g. by a restart) and is queued again
+STALE_PENDING = timedelta(minutes=10)
+
+# Most URLs accepted from one paste
+MAX_URLS = 100
+MAX_REDIRECTS = 5
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+MAX_FORM_FIELDS = 200
+MAX_OPTIONS = 500
+CHUNK_SIZE = 64 * 1024
+
+USER_AGENT = 'JobAutofill/1.0 (+prefetch)'
+
+SKIPPED_INPUT_TYPES = frozenset({'hidden', 'submit', 'button', 'image', 'reset'})
+
+_WHITESPACE = re.compile(r'\s+')
+_CHARSET_RE = re.compile(rb'charset=["\']?([\w.:-]+)', re.I)
+# "Job Application for Engineer at Acme", "Engineer at Acme"
+_TITLE_AT_RE = re.compile(r'^(?:job application for\s+)?(.+?)\s+at\s+(.+)$', re.I)
+# "Engineer - Acme", "Engineer | Acme Careers"
+_TITLE_SEPARATOR_RE = re.compile(r'\s+[|\-–—·]\s+')
+
+class FetchError(Exception):
+    """A job page could not be fetched, or is not an HTML page"""
+
+def _text(value):
+    return _WHITESPACE.sub(' ', value).strip() if isinstance(value, str) else ''
+
+class PageParser(HTMLParser):
+    """Collects the page title, meta tags, JSON-LD blocks and form field descriptors in one pass"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.heading = ''
+        self.meta = {}
+        self.json_ld = []
+        self.fields = []
+        self._labels_for = {}
+        self._label = None
+        self._select = None
+        # (tag, text parts) being captured; parts is None when the text is thrown away
+        self._capture = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        if self._capture is not None:
+            return
+        if tag == 'title' and not self.title:
+            self._capture = (tag, [])
+        elif tag == 'h1' and not self.heading:
+            self._capture = (tag, [])
+        elif tag == 'meta':
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key and attrs.get('content'):
+                self.meta.setdefault(key, _text(attrs['content']))
+        elif tag in ('script', 'style'):
+            keep = tag == 'script' and attrs.get('type', '').lower() == 'application/ld+json'
+            self._capture = (tag, [] if keep else None)
+        elif tag == 'label':
+            self._label = (attrs.get('for'), [], [])
+        elif tag == 'input':
+            field_type = attrs.get('type', 'text').lower() or 'text'
+            if field_type not in SKIPPED_INPUT_TYPES:
+                self._add_field(tag, field_type, attrs)
+        elif tag == 'textarea':
+            self._add_field(tag, 'textarea', attrs)
+            self._capture = (tag, None)
+        elif tag == 'select':
+            self._select = self._add_field(tag, 'select-multiple' if 'multiple' in attrs else 'select', attrs)
+        elif tag == 'option' and self._select is not None:
+            self._capture = (tag, [])
+        elif tag == 'button' and attrs.get('aria-haspopup') == 'listbox':
+            self._add_field(tag, 'dropdown', attrs)
+
+    def _add_field(self, tag, field_type, attrs):
+        if len(self.fields) >= MAX_FORM_FIELDS:
+            return None
+        field = {
+            'tag': tag,
+            'type': field_type,
+            'id': attrs.get('id', ''),
+            'name': attrs.get('name', ''),
+            'label': '',
+            'placeholder': _text(attrs.get('placeholder')),
+            'ariaLabel': _text(attrs.get('aria-label')),
+            'automationId': attrs.get('data-automation-id', ''),
+            'required': 'required' in attrs or attrs.get('aria-required') == 'true'
+        }
+        if tag == 'select':
+            field['options'] = []
+        if self._label is not None:
+            self._label[2].append(field)
+        self.fields.append(field)
+        return field
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            if self._capture[1] is not None:
+                self._capture[1].append(data)
+        elif self._label is not None:
+            self._label[1].append(data)
+
+    def handle_endtag(self, tag):
+        if self._capture is not None:
+            if tag != self._capture[0]:
+                return
+            captured, parts = self._capture
+            self._capture = None
+            if parts is None:
+                return
+            if captured == 'title':
+                self.title = _text(''.join(parts))
+            elif captured == 'h1':
+                self.heading = _text(''.join(parts))
+            elif captured == 'script':
+                self.json_ld.append(''.join(parts))
+            elif captured == 'option' and len(self._select['options']) < MAX_OPTIONS:
+                self._select['options'].append(_text(''.join(parts)))
+        elif tag == 'label' and self._label is not None:
+            target, parts, fields = self._label
+            self._label = None
+            text = _text(''.join(parts))
+            if target:
+                self._labels_for.setdefault(target, text)
+            for field in fields:
+                field['label'] = field['label'] or text
+        elif tag == 'select':
+            self._select = None
+
+    def form_fields(self):
+        """Field descriptors with labels attached through label[for] resolved"""
+        for field in self.fields:
+            if not field['label'] and field['id']:
+                field['label'] = self._labels_for.get(field['id'], '')
+        return self.fields
+
+def _job_posting(blocks):
+    """The first schema.org JobPosting in the page's JSON-LD blocks, or None"""
+    for block in blocks:
+        try:
+            pending = [json.loads(block)]
+        except ValueError:
+            continue
+        while pending:
+            item = pending.pop()
+            if isinstance(item, list):
+                pending.extend(item)
+            elif isinstance(item, dict):
+                types = item.get('@type')
+                if types == 'JobPosting' or (isinstance(types, list) and 'JobPosting' in types):
+                    return item
+                graph = item.get('@graph')
+                if isinstance(graph, list):
+                    pending.extend(graph)
+    return None
+
+def split_page_title(text):
+    """Guess (job title, company) from a page title like "Engineer at Acme" or "Engineer - Acme" """
+    parts = _TITLE_SEPARATOR_RE.split(text)
+    match = _TITLE_AT_RE.match(parts[0])
+    if match:
+        return match.group(1), match.group(2)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+def job_details(parser):
+    """(title, company) from a JobPosting block, falling back to Open Graph tags and the page title"""
+    title = company = ''
+    posting = _job_posting(parser.json_ld)
+    if posting is not None:
+        title = _text(posting.get('title'))
+        organization = posting.get('hiringOrganization')
+        company = _text(organization.get('name') if isinstance(organization, dict) else organization)
+    page_title = parser.meta.get('og:title') or parser.title or parser.heading
+    if page_title and not (title and company):
+        guessed_title, guessed_company = split_page_title(page_title)
+        title = title or guessed_title
+        company = company or parser.meta.get('og:site_name') or guessed_company
+    return title[:255] or None, company[:255] or None
+
+def read_page(html):
+    """Job title, company and form field descriptors of a job page"""
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    title, company = job_details(parser)
+    return {'title': title, 'company': company, 'fields': parser.form_fields()}
+
+def create_session(workers, per_host, allow_private=False):
+    """One requests.Session whose pools keep connections alive and block past per_host connections a host
+
+    Unless allow_private is set, connections are only opened to public addresses (see public_http).
+    """
+    # Deferred so workers that never prefetch skip importing requests
+    import requests
+    import public_http
+    session = requests.Session()
+    adapter_class = requests.adapters.HTTPAdapter if allow_private else public_http.PublicOnlyAdapter
+    adapter = adapter_class(pool_connections=max(workers, 10), pool_maxsize=per_host, pool_block=True)
+    if not allow_private:
+        # A proxy from the environment would be connected to instead of the checked address
+        session.trust_env = False
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT, 'Accept': 'text/html,application/xhtml+xml'})
+    return session
+
+def _read_body(response):
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        # Forms sit well within the first couple of megabytes; the rest is not worth reading
+        if size >= MAX_PAGE_BYTES:
+            break
+    return b''.join(chunks)[:MAX_PAGE_BYTES]
+
+def _decode(body, content_type):
+    # Not response.encoding: requests assumes ISO-8859-1 for text/html without a charset
+    match = _CHARSET_RE.search(content_type.encode('latin-1', 'replace')) or _CHARSET_RE.search(body[:2048])
+    try:
+        return body.decode(match.group(1).decode() if match else 'utf-8', errors='replace')
+    except LookupError:
+        return body.decode('utf-8', errors='replace')
+
+def fetch_page(session, url, timeout=DEFAULT_TIMEOUT):
+    """Fetch an HTML page, checking every redirect hop; returns (final url, text)"""
+    import requests
+    import public_http
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError('Only http and https URLs can be prefetched')
+        try:
+            with session.get(url, timeout=timeout, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['Location'])
+                    continue
+                if response.status_code != 200:
+                    raise FetchError(f'The page returned HTTP {response.status_code}')
+                content_type = response.headers.get('Content-Type', 'text/html')
+                if 'html' not in content_type:
+                    raise FetchError('Not an HTML page')
+                return url, _decode(_read_body(response), content_type)
+        except public_http.NonPublicAddress as e:
+            raise FetchError(str(e)) from e
+        except requests.RequestException as e:
+            raise FetchError(f'Could not fetch the page ({type(e).__name__})') from e
+    raise FetchError('Too many redirects')
+
+def store_page(application, page, host):
+    """Record a read page and its fill plan on the application; the caller commits"""
+    fields = page['fields']
+    is_workday = 'myworkdayjobs' in host or any(field['automationId'] for field in fields)
+    application.title = page['title'] or application.title
+    application.company = page['company']
+    application.form_schema = json.dumps(fields, separators=(',', ':'))
+    application.form_field_count = len(fields)
+    # Precomputing is not a use of the plan: no hit is counted and nothing is written before the caller commits
+    payload = fill_plans.match_payload(application.user_id, host, fields, is_workday, record_hit=False)
+    application.fill_plan = json.dumps(payload, separators=(',', ':'))
+    application.prefetch_status = 'done'
+    application.prefetch_error = None
+    application.prefetched_at = datetime.now()
+
+class Prefetcher:
+    """Bounded queue of applications whose pages are fetched by a pool of worker threads"""
+
+    def __init__(self, app, workers, per_host, queue_size):
+        self.app = app
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = app.config.get('PREFETCH_TIMEOUT', DEFAULT_TIMEOUT)
+        self.allow_private = app.config.get('PREFETCH_ALLOW_PRIVATE', False)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._session = None
+
+    def submit(self, application_pk):
+        """Queue an application; returns False when the queue is full and it was dropped"""
+        with self._lock:
+            if application_pk in self._queued:
+                return True
+            try:
+                self.queue.put_nowait(application_pk)
+            except queue.Full:
+                # The application stays pending and is queued again once it goes stale
+                metrics.PREFETCHED_PAGES.inc(('dropped',))
+                return False
+            self._queued.add(application_pk)
+            self._start()
+        return True
+
+    def _start(self):
+        # The session and threads are only created once the first page is queued
+        if self._threads:
+            return
+        self._session = create_session(self.workers, self.per_host, self.allow_private)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'page-prefetch-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        """Block until every queued page has been read or has failed"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            application_pk = self.queue.get()
+            try:
+                self.prefetch(application_pk)
+            except Exception:
+                self.app.logger.exception('Page prefetch failed', extra={'fields': {'application': application_pk}})
+            finally:
+                with self._lock:
+                    self._queued.discard(application_pk)
+                self.queue.task_done()
+
+    def prefetch(self, application_pk):
+        with self.app.app_context():
+            application = Application.query.get(application_pk)
+            if application is None or application.prefetch_status != 'pending':
+                return
+            url = application.url
+
+        # No database connection is held while the page downloads
+        started = time.perf_counter()
+        try:
+            final_url, html = fetch_page(self._session, url, self.timeout)
+            page = read_page(html)
+            error = None
+        except FetchError as e:
+            page, error = None, str(e)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self.app.app_context():
+            application = Application.query.get(application_pk)
+            if application is None:
+                return
+            if page is None:
+                application.prefetch_status = 'failed'
+                application.prefetch_error = error[:255]
+                application.prefetched_at = datetime.now()
+            else:
+                store_page(application, page, fill_plans.plan_host(final_url))
+            refresh_recent_applications(application.user_id)
+            bump_section_versions(application.user_id, 'applications')
+            db.session.commit()
+            metrics.PREFETCHED_PAGES.inc((application.prefetch_status,))
+            # Failures are worth seeing in the log; successes of a large paste are not
+            log = self.app.logger.info if error else self.app.logger.debug
+            log('Prefetched job page', extra={'fields': {
+                'host': application.host, 'status': application.prefetch_status, 'error': error,
+                'fields': application.form_field_count, 'ms': round(elapsed_ms, 1)}})
+
+def request_prefetch(application, now=None):
+    """Mark an application's page for prefetching unless it is fresh or already on its way
+
+    Returns whether the application should be passed to submit() once the
+    caller has committed.
+    """
+    if 'page_prefetch' not in current_app.extensions:
+        return False
+    now = now or datetime.now()
+    status = application.prefetch_status
+    if status == 'pending' and application.prefetch_requested_at > now - STALE_PENDING:
+        return False
+    max_age = timedelta(seconds=current_app.config.get('PREFETCH_MAX_AGE', DEFAULT_MAX_AGE))
+    if status == 'done' and application.prefetched_at > now - max_age:
+        return False
+    application.prefetch_status = 'pending'
+    application.prefetch_requested_at = now
+    return True
+
+def submit(applications):
+    """Queue committed applications marked by request_prefetch; returns how many were queued"""
+    prefetcher = current_app.extensions['page_prefetch']
+    return sum(prefetcher.submit(application.pk) for application in applications)
+
+def parse_urls(text):
+    """Distinct http(s) URLs in pasted text, in order, and the number of entries that were not URLs"""
+    urls = {}
+    rejected = 0
+    for entry in text.split():
+        entry = entry.strip('<>"\',;')
+        parts = urlsplit(entry)
+        if parts.scheme in ('http', 'https') and parts.hostname:
+            urls.setdefault(entry, None)
+        elif entry:
+            rejected += 1
+    return list(urls), rejected
+
+def plan_for(application):
+    """The prefetched form of an application: its field descriptors paired with their matched profile keys"""
+    if application.prefetch_status != 'done':
+        return None
+    fields = json.loads(application.form_schema or '[]')
+    plan = json.loads(application.fill_plan or '{}')
+    return {
+        'fields': [dict(field, key=match['key']) for field, match in zip(fields, plan.get('matches', []))],
+        'plan': plan.get('plan')
+    }
+
+def init_app(app):
+    """Set up the prefetcher for this app (unless PREFETCH_WORKERS is 0); its threads start on first use"""
+    workers = app.config.get('PREFETCH_WORKERS', DEFAULT_WORKERS)
+    if not workers:
+        return None
+    prefetcher = Prefetcher(app, workers, app.config.get('PREFETCH_PER_HOST', DEFAULT_PER_HOST),
+                            app.config.get('PREFETCH_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+    app.extensions['page_prefetch'] = prefetcher
+    return prefetcher
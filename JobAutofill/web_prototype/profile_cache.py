@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+DEFAULT_MAX_ENTRIES = 256
+
+# Serialized profile payloads, keyed by user ID: (profile version, body bytes, ETag, {variant: encoded}),
+# least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+_max_entries = DEFAULT_MAX_ENTRIES
+
+def serialize_payload(data):
+    """Encode an API payload to compact JSON bytes"""
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def compute_etag(body):
+    """Strong ETag derived from the exact response bytes"""
+    return hashlib.sha1(body).hexdigest()
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+        return entry
+
+def get_payload(key, version):
+    """Return the cached (body, etag) for this profile version, or None on a miss"""
+    entry = _get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1], entry[2]
+    return None
+
+def store_payload(key, version, data):
+    """Serialize and cache a payload for this profile version, returning (body, etag)"""
+    body = serialize_payload(data)
+    etag = compute_etag(body)
+    with _lock:
+        current = _cache.get(key)
+        # Never overwrite a newer version written by a concurrent request
+        if current is None or current[0] <= version:
+            _cache[key] = (version, body, etag, {})
+            _cache.move_to_end(key)
+            while len(_cache) > _max_entries:
+                _cache.popitem(last=False)
+    return body, etag
+
+def has_variant(key, version, variant):
+    entry = _get(key)
+    return entry is not None and entry[0] == version and variant in entry[3]
+
+def get_variant(key, version, variant, build):
+    """Return an encoded form of the cached payload for this version, calling build() on first use"""
+    entry = _get(key)
+    variants = entry[3] if entry is not None and entry[0] == version else None
+    if variants is not None:
+        encoded = variants.get(variant)
+        if encoded is not None:
+            return encoded
+    encoded = build()
+    if variants is not None:
+        variants[variant] = encoded
+    return encoded
+
+def invalidate(key):
+    with _lock:
+        _cache.pop(key, None)
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+def init_app(app):
+    """Bound the cache to PROFILE_CACHE_ENTRIES payloads, evicting the least recently used"""
+    global _max_entries
+    with _lock:
+        _max_entries = app.config.get('PROFILE_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)
+        while len(_cache) > _max_entries:
+            _cache.popitem(last=False)
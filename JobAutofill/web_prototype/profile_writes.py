@@ -0,0 +1,179 @@
+"""Write-behind buffer that coalesces PATCH /api/profile autosaves.
+
+Field changes are merged per user in memory and written in one transaction
+once the user pauses for PATCH_FLUSH_DELAY seconds, and never later than
+PATCH_MAX_FLUSH_DELAY after the first buffered change. An autosave storm
+becomes one write every few seconds instead of one per keystroke.
+
+Any other request from the same user flushes their pending changes first, so
+pages and API reads always see them. Buffers are per process: with several
+workers, a read on a different worker can lag by up to PATCH_MAX_FLUSH_DELAY.
+
+A batch that fails to write goes back into the buffer, under any changes made
+since, and is retried up to MAX_WRITE_ATTEMPTS times before it is dropped;
+reads in the meantime see the last committed profile.
+"""
+import atexit
+import threading
+import time
+
+from flask import has_app_context, request
+from flask_login import current_user
+
+import metrics
+from models import db
+
+DEFAULT_FLUSH_DELAY = 1.0
+DEFAULT_MAX_FLUSH_DELAY = 5.0
+MAX_WRITE_ATTEMPTS = 5
+
+# Endpoints that only add to the buffer, so they never force a flush
+BUFFERING_ENDPOINTS = {'patch_profile_api', 'static'}
+
+class _Pending:
+    __slots__ = ('first', 'last', 'changes', 'attempts')
+
+    def __init__(self, now):
+        self.first = now
+        self.last = now
+        # (section, record_id) -> {field: value}; personal info is ('profile', None)
+        self.changes = {}
+        # Failed writes of these changes so far
+        self.attempts = 0
+
+class WriteBehindBuffer:
+    """Coalesces field-level profile changes per user and flushes them from a background thread"""
+
+    def __init__(self, app, apply_changes, flush_delay, max_flush_delay):
+        self.app = app
+        self.apply_changes = apply_changes
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        self._pending = {}
+        self._flushing = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Serializes flushes so a read never overtakes a flush already in progress for its user
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='profile-writes', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, user_id, changes):
+        """Merge {(section, record_id): {field: value}} into the user's pending changes"""
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = self._pending[user_id] = _Pending(now)
+            pending.last = now
+            for key, fields in changes.items():
+                pending.changes.setdefault(key, {}).update(fields)
+            self._wakeup.notify()
+        metrics.PROFILE_PATCHES.inc(())
+
+    def has_pending(self, user_id):
+        return user_id in self._pending or user_id in self._flushing
+
+    def flush_user(self, user_id, trigger='read'):
+        """Write the user's pending changes now; returns False if they failed and were put back for a retry"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending.pop(user_id, None)
+            if pending is None:
+                return True
+            return self._write(user_id, pending, trigger)
+
+    def flush_all(self, trigger='shutdown'):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            for user_id, pending in batch.items():
+                self._write(user_id, pending, trigger)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        self.flush_all()
+
+    def _due_at(self, pending):
+        return min(pending.last + self.flush_delay, pending.first + self.max_flush_delay)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = [user_id for user_id, pending in self._pending.items() if self._due_at(pending) <= now]
+                    if due:
+                        break
+                    next_due = min((self._due_at(pending) for pending in self._pending.values()), default=None)
+                    self._wakeup.wait(None if next_due is None else next_due - now)
+                if self._stopped:
+                    return
+                # Mark the users before releasing the lock so has_pending stays true until they are written
+                self._flushing.update(due)
+            with self._flush_lock:
+                for user_id in due:
+                    with self._lock:
+                        pending = self._pending.pop(user_id, None)
+                    if pending is not None:
+                        self._write(user_id, pending, 'timer')
+                    with self._lock:
+                        self._flushing.discard(user_id)
+
+    def _write(self, user_id, pending, trigger):
+        # Flushes triggered by a request share its app context and database session
+        if not has_app_context():
+            with self.app.app_context():
+                return self._write(user_id, pending, trigger)
+        try:
+            self.apply_changes(user_id, pending.changes)
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Failed to write buffered profile changes', extra={'fields': {
+                'user_id': user_id, 'records': len(pending.changes), 'attempts': pending.attempts + 1}})
+            self._requeue(user_id, pending)
+            return False
+        metrics.PROFILE_PATCH_FLUSHES.inc((trigger,))
+        return True
+
+    def _requeue(self, user_id, pending):
+        """Put a failed batch back for the timer to retry; changes buffered since it was taken win"""
+        pending.attempts += 1
+        with self._lock:
+            if self._stopped or pending.attempts >= MAX_WRITE_ATTEMPTS:
+                self.app.logger.error('Dropped buffered profile changes', extra={'fields': {
+                    'user_id': user_id, 'records': len(pending.changes), 'attempts': pending.attempts}})
+                return
+            newer = self._pending.get(user_id)
+            if newer is not None:
+                for key, fields in newer.changes.items():
+                    pending.changes.setdefault(key, {}).update(fields)
+                pending.attempts = max(pending.attempts, newer.attempts)
+            # Retried once the flush delay has passed again
+            pending.first = pending.last = time.monotonic()
+            self._pending[user_id] = pending
+            self._wakeup.notify()
+
+def init_app(app, apply_changes):
+    """Start the buffer for this app; apply_changes(user_id, changes) writes and commits one user's batch"""
+    buffer = WriteBehindBuffer(app, apply_changes,
+                               app.config.get('PATCH_FLUSH_DELAY', DEFAULT_FLUSH_DELAY),
+                               app.config.get('PATCH_MAX_FLUSH_DELAY', DEFAULT_MAX_FLUSH_DELAY))
+    app.extensions['profile_writes'] = buffer
+
+    @app.before_request
+    def flush_pending_profile_writes():
+        if request.endpoint in BUFFERING_ENDPOINTS or not current_user.is_authenticated:
+            return
+        user_id = current_user.get_id()
+        if buffer.has_pending(user_id):
+            buffer.flush_user(user_id)
+
+    buffer.start()
+    atexit.register(buffer.stop)
+    return buffer
@@ -0,0 +1,82 @@
+"""requests transport that only opens connections to public addresses.
+
+Each new connection resolves its host once, refuses it if any address is
+loopback, private or otherwise non-public, and then connects to one of those
+same addresses. A DNS answer that changes between the check and the connect
+(DNS rebinding) therefore cannot point a request at an internal service. The
+Host header, SNI and certificate checks still use the hostname, and pooled
+keep-alive connections stay pinned to the address they were checked against.
+
+Imported on first use by page_prefetch, so processes that never prefetch skip
+loading requests.
+"""
+import ipaddress
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util import connection
+
+class NonPublicAddress(Exception):
+    """The host resolved to an address that must not be fetched
+
+    Not an OSError, so urllib3 neither wraps nor retries it and requests lets it through to the caller.
+    """
+
+def public_addresses(host, port):
+    """getaddrinfo results for a host, refusing loopback, private or otherwise non-public ones"""
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0]).is_global:
+            raise NonPublicAddress(f'{host} is not a public address')
+    return addresses
+
+class PublicConnectionMixin:
+    """urllib3 connection whose socket is opened to a checked address of its host"""
+
+    def _new_conn(self):
+        extra_kw = {}
+        if self.source_address:
+            extra_kw['source_address'] = self.source_address
+        if self.socket_options:
+            extra_kw['socket_options'] = self.socket_options
+        try:
+            addresses = public_addresses(self._dns_host, self.port)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, f'Failed to resolve {self.host}: {e}')
+
+        error = None
+        for address in addresses:
+            try:
+                # An address literal, so create_connection does not resolve the name again
+                return connection.create_connection(address[4][:2], self.timeout, **extra_kw)
+            except socket.timeout:
+                raise ConnectTimeoutError(
+                    self, f'Connection to {self.host} timed out. (connect timeout={self.timeout})')
+            except OSError as e:
+                error = e
+        raise NewConnectionError(self, f'Failed to establish a new connection: {error}')
+
+class PublicHTTPConnection(PublicConnectionMixin, HTTPConnection):
+    pass
+
+class PublicHTTPSConnection(PublicConnectionMixin, HTTPSConnection):
+    pass
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+class PublicOnlyAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools only connect to the public addresses their host resolves to"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': PublicHTTPConnectionPool,
+            'https': PublicHTTPSConnectionPool,
+        }
@@ -0,0 +1,362 @@
+"""Background resume parsing that proposes profile, employment and education entries.
+
+Uploaded resumes are queued to a process pool so text extraction and parsing
+never block the request thread and bulk uploads spread across cores. Each
+upload gets a ParseJob row; the user accepts or rejects its proposals later.
+
+PDF text extraction needs the optional ``pypdf`` package. DOCX and TXT are
+handled with the standard library.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+import zipfile
+from xml.etree import ElementTree
+
+from flask import current_app
+
+from models import db, ParseJob, Profile, Employment, Education, PERSONAL_INFO_FIELDS, get_profile, adjust_profile_counts, new_record_id
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF parsing is optional
+    PdfReader = None
+
+PARSEABLE_EXTENSIONS = {'.pdf', '.docx', '.txt'}
+
+# A resume's document.xml is well under a megabyte; larger ones are refused rather than parsed
+MAX_DOCX_XML_BYTES = 10 * 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Text extraction and parsing; these run in worker processes
+_WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def extract_text(path, extension):
+    if extension == '.txt':
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+    if extension == '.docx':
+        with zipfile.ZipFile(path) as docx:
+            if docx.getinfo('word/document.xml').file_size > MAX_DOCX_XML_BYTES:
+                raise ValueError('The document is too large to parse')
+            with docx.open('word/document.xml') as f:
+                # The declared size can lie, so the read is bounded too
+                xml = f.read(MAX_DOCX_XML_BYTES + 1)
+            if len(xml) > MAX_DOCX_XML_BYTES:
+                raise ValueError('The document is too large to parse')
+            root = ElementTree.fromstring(xml)
+        paragraphs = []
+        for paragraph in root.iter(f'{_WORD_NAMESPACE}p'):
+            paragraphs.append(''.join(node.text or '' for node in paragraph.iter(f'{_WORD_NAMESPACE}t')))
+        return '\n'.join(paragraphs)
+    if extension == '.pdf':
+        if PdfReader is None:
+            raise RuntimeError('PDF parsing requires the pypdf package')
+        return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    raise ValueError(f'Unsupported resume format: {extension}')
+
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_RE = re.compile(r'(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}')
+LINKEDIN_RE = re.compile(r'(?:https?://)?(?:www\.)?linkedin\.com/in/[\w-]+/?', re.IGNORECASE)
+URL_RE = re.compile(r'(?:https?://|www\.)[^\s,;]+', re.IGNORECASE)
+GPA_RE = re.compile(r'GPA[:\s]*([0-4]\.\d{1,2})', re.IGNORECASE)
+
+_MONTHS = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+_DATE = rf'(?:{_MONTHS}\s+\d{{4}}|\d{{1,2}}/\d{{4}}|\d{{4}}-\d{{2}}|\d{{4}})'
+DATE_RANGE_RE = re.compile(rf'({_DATE})\s*(?:-|–|—|to)\s*({_DATE}|present|current|now)', re.IGNORECASE)
+_MONTH_NUMBERS = {name: index for index, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+SECTION_HEADINGS = {
+    'employment': ['experience', 'work experience', 'professional experience', 'employment',
+                   'employment history', 'work history'],
+    'education': ['education', 'academic background', 'education and training'],
+    'other': ['skills', 'projects', 'certifications', 'awards', 'publications', 'interests',
+              'summary', 'profile', 'objective', 'references', 'volunteer experience'],
+}
+DEGREE_RE = re.compile(
+    r'\b(?:bachelor|master|doctor|ph\.?d|associate|b\.?s\.?|b\.?a\.?|m\.?s\.?|m\.?a\.?|mba|high school diploma)\b',
+    re.IGNORECASE)
+INSTITUTION_RE = re.compile(r'\b(?:university|college|institute|school|academy)\b', re.IGNORECASE)
+US_STATES = {
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS',
+    'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC',
+    'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
+}
+CITY_STATE_ZIP_RE = re.compile(r'([A-Za-z .]+),\s*([A-Z]{2})\s+(\d{5})(?:-\d{4})?')
+
+def _to_month(value):
+    """Normalize a resume date to the YYYY-MM format used by the employment and education forms"""
+    value = value.strip().lower()
+    if value in ('present', 'current', 'now'):
+        return 'Present'
+    match = re.match(rf'({_MONTHS})\s+(\d{{4}})', value)
+    if match:
+        return f"{match.group(2)}-{_MONTH_NUMBERS[match.group(1)[:3]]:02d}"
+    match = re.match(r'(\d{1,2})/(\d{4})', value)
+    if match:
+        return f"{match.group(2)}-{int(match.group(1)):02d}"
+    match = re.match(r'(\d{4})-(\d{2})', value)
+    if match:
+        return value
+    return f"{value}-01"
+
+def _split_sections(lines):
+    sections = {'header': []}
+    current = 'header'
+    for line in lines:
+        heading = line.strip().strip(':').lower()
+        matched = next((name for name, headings in SECTION_HEADINGS.items() if heading in headings), None)
+        if matched:
+            current = matched
+            sections.setdefault(current, [])
+        else:
+            sections[current].append(line)
+    return sections
+
+def _split_entries(lines):
+    """Group section lines into entries separated by blank lines or new date ranges"""
+    entries = []
+    current = []
+    for line in lines:
+        if not line.strip():
+            if current:
+                entries.append(current)
+                current = []
+            continue
+        if current and DATE_RANGE_RE.search(line) and any(DATE_RANGE_RE.search(item) for item in current):
+            entries.append(current)
+            current = []
+        current.append(line.strip())
+    if current:
+        entries.append(current)
+    return entries
+
+def _parse_personal_info(header_lines, text):
+    info = {}
+    non_empty = [line.strip() for line in header_lines if line.strip()]
+    if non_empty:
+        name_parts = non_empty[0].split()
+        if 2 <= len(name_parts) <= 4 and not EMAIL_RE.search(non_empty[0]) and not any(c.isdigit() for c in non_empty[0]):
+            info['first_name'] = name_parts[0]
+            info['last_name'] = name_parts[-1]
+
+    email = EMAIL_RE.search(text)
+    if email:
+        info['email'] = email.group(0)
+    phone = PHONE_RE.search(text)
+    if phone:
+        info['phone'] = phone.group(0)
+    linkedin = LINKEDIN_RE.search(text)
+    if linkedin:
+        info['linkedin'] = linkedin.group(0)
+    for url in URL_RE.findall('\n'.join(header_lines)):
+        if 'linkedin.com' not in url.lower():
+            info['website'] = url
+            break
+    location = CITY_STATE_ZIP_RE.search('\n'.join(header_lines))
+    if location and location.group(2) in US_STATES:
+        info['city'] = location.group(1).strip()
+        info['zip'] = location.group(3)
+    return info
+
+def _parse_employment(lines):
+    jobs = []
+    for entry in _split_entries(lines):
+        dates = None
+        details = []
+        heading = []
+        for line in entry:
+            match = DATE_RANGE_RE.search(line)
+            if match and dates is None:
+                dates = match
+                remainder = DATE_RANGE_RE.sub('', line).strip(' |,-–—')
+                if remainder:
+                    heading.append(remainder)
+            elif line.lstrip().startswith(('-', '•', '*', '·')) or (heading and len(heading) >= 2):
+                details.append(line)
+            else:
+                heading.append(line)
+        if not heading:
+            continue
+
+        title, company = heading[0], heading[1] if len(heading) > 1 else ''
+        for separator in (' at ', ' @ ', ' | ', ', ', ' - '):
+            if not company and separator in title:
+                title, company = [part.strip() for part in title.split(separator, 1)]
+        end_date = _to_month(dates.group(2)) if dates else ''
+        jobs.append({
+            'job_title': title,
+            'company': company,
+            'start_date': _to_month(dates.group(1)) if dates else '',
+            'end_date': end_date,
+            'current_job': end_date == 'Present',
+            'location': heading[2] if len(heading) > 2 else '',
+            'responsibilities': '\n'.join(details)
+        })
+    return jobs
+
+def _parse_education(lines):
+    schools = []
+    for entry in _split_entries(lines):
+        joined = '\n'.join(entry)
+        institution = next((line for line in entry if INSTITUTION_RE.search(line)), '')
+        degree_line = next((line for line in entry if DEGREE_RE.search(line)), '')
+        if not institution and not degree_line:
+            continue
+
+        degree, field_of_study = degree_line, ''
+        for separator in (' in ', ' of ', ', '):
+            if separator in degree_line and DEGREE_RE.search(degree_line.split(separator, 1)[0]):
+                degree, field_of_study = [part.strip() for part in degree_line.split(separator, 1)]
+                break
+        dates = DATE_RANGE_RE.search(joined)
+        gpa = GPA_RE.search(joined)
+        end_date = _to_month(dates.group(2)) if dates else ''
+        schools.append({
+            'degree': DATE_RANGE_RE.sub('', degree).strip(' |,-–—'),
+            'field_of_study': DATE_RANGE_RE.sub('', field_of_study).strip(' |,-–—'),
+            'institution': DATE_RANGE_RE.sub('', institution).strip(' |,-–—'),
+            'start_date': _to_month(dates.group(1)) if dates else '',
+            'end_date': end_date,
+            'current_education': end_date == 'Present',
+            'location': '',
+            'gpa': gpa.group(1) if gpa else '',
+            'achievements': '\n'.join(line for line in entry if line.lstrip().startswith(('-', '•', '*', '·')))
+        })
+    return schools
+
+def parse_resume_text(text):
+    """Propose personal info, employment and education entries from resume text"""
+    lines = text.replace('\r\n', '\n').split('\n')
+    sections = _split_sections(lines)
+    return {
+        'personal_info': _parse_personal_info(sections.get('header', []), text),
+        'employment_history': _parse_employment(sections.get('employment', [])),
+        'education': _parse_education(sections.get('education', []))
+    }
+
+def parse_resume_file(path, extension):
+    """Worker entry point: extract and parse one resume file"""
+    return parse_resume_text(extract_text(path, extension))
+
+# Job queue; these run in the web process
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = app.config.get('RESUME_PARSER_WORKERS') or os.cpu_count() or 1
+            # Forking a threaded web process can copy held locks and open connections into the workers
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _discard_executor(executor):
+    """Drop a broken pool so the next job starts a fresh one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def _finish_job(app, job_id, future):
+    with app.app_context():
+        job = ParseJob.query.get(job_id)
+        # Jobs dismissed or timed out while parsing keep their status
+        if job is None or job.status != 'queued':
+            return
+        error = future.exception()
+        if error is None:
+            job.status = 'done'
+            job.result = json.dumps(future.result())
+        else:
+            job.status = 'failed'
+            job.error = str(error)
+        db.session.commit()
+
+def resume_extension(document):
+    return os.path.splitext(document.original_filename or '')[1].lower()
+
+def create_job(user_id, document):
+    """Record a ParseJob for an uploaded resume, or return None for unsupported formats
+
+    The caller commits the session and then calls start_job.
+    """
+    if resume_extension(document) not in PARSEABLE_EXTENSIONS:
+        return None
+
+    job = ParseJob(id=uuid.uuid4().hex, user_id=user_id, document_id=document.id, status='queued')
+    db.session.add(job)
+    return job
+
+def start_job(job, path, extension):
+    """Hand a committed ParseJob to the worker pool"""
+    app = current_app._get_current_object()
+    job_id = job.id
+    if app.config.get('RESUME_PARSER_WORKERS') == 0:
+        # Parse inline, e.g. for single-process deployments
+        future = Future()
+        try:
+            future.set_result(parse_resume_file(path, extension))
+        except Exception as e:
+            future.set_exception(e)
+        _finish_job(app, job_id, future)
+        return
+
+    executor = _get_executor(app)
+    try:
+        future = executor.submit(parse_resume_file, path, extension)
+    except (BrokenProcessPool, RuntimeError) as e:
+        # A worker died (or the pool was shut down); fail this job and start over with the next one
+        _discard_executor(executor)
+        future = Future()
+        future.set_exception(e)
+        _finish_job(app, job_id, future)
+        return
+
+    def finished(done):
+        if isinstance(done.exception(), BrokenProcessPool):
+            _discard_executor(executor)
+        _finish_job(app, job_id, done)
+    future.add_done_callback(finished)
+
+def _fit_columns(model, values):
+    """Values truncated to the lengths of the model's string columns"""
+    columns = model.__table__.columns
+    return {
+        field: value[:columns[field].type.length]
+        if isinstance(value, str) and getattr(columns[field].type, 'length', None) else value
+        for field, value in values.items()
+    }
+
+def apply_proposals(job):
+    """Merge a finished job's proposals into the user's profile
+
+    Personal info only fills fields that are still empty; employment and
+    education proposals are added as new entries. The caller commits.
+    Returns the new (employment, education) records.
+    """
+    proposals = json.loads(job.result or '{}')
+
+    personal_info = get_profile(job.user_id)
+    for field, value in proposals.get('personal_info', {}).items():
+        if field in PERSONAL_INFO_FIELDS and value and not getattr(personal_info, field):
+            setattr(personal_info, field, _fit_columns(Profile, {field: value})[field])
+
+    employment_history = proposals.get('employment_history', [])
+    education = proposals.get('education', [])
+    jobs = [Employment(user_id=job.user_id, id=new_record_id(), **_fit_columns(Employment, entry))
+            for entry in employment_history]
+    schools = [Education(user_id=job.user_id, id=new_record_id(), **_fit_columns(Education, entry))
+               for entry in education]
+    db.session.add_all(jobs + schools)
+    adjust_profile_counts(job.user_id, employment_count=len(jobs), education_count=len(schools))
+
+    job.status = 'accepted'
+    return jobs, schools
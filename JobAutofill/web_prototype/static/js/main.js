@@ -15,6 +15,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Add animation to dashboard cards
     initDashboardCards();
+    
+    // Save profile forms as the user types
+    initAutosave();
 });
 
 // Initialize Bootstrap tooltips
@@ -83,6 +86,58 @@ function initCurrentStatusCheckboxes() {
     }
 }
 
+// Send field changes from forms marked with data-autosave-section to PATCH /api/profile.
+// The server coalesces them, so a short debounce is enough.
+function initAutosave() {
+    document.querySelectorAll('form[data-autosave-section]').forEach(function(form) {
+        const section = form.dataset.autosaveSection;
+        const recordId = form.dataset.autosaveRecord;
+        let pending = {};
+        let timer = null;
+        
+        function send() {
+            const fields = pending;
+            pending = {};
+            const body = {};
+            if (recordId) {
+                body[section] = {};
+                body[section][recordId] = fields;
+            } else {
+                body[section] = fields;
+            }
+            fetch('/api/profile', {
+                method: 'PATCH',
+                credentials: 'same-origin',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(body)
+            }).catch(function() {
+                // The regular submit button still saves everything
+            });
+        }
+        
+        function queue(event) {
+            const field = event.target;
+            if (!field.name || field.type === 'submit') {
+                return;
+            }
+            pending[field.name] = field.type === 'checkbox' ? field.checked : field.value;
+            // The server saves current entries with an end date of 'Present'; unchecking must replace it
+            if ((field.name === 'current_job' || field.name === 'current_education') && !field.checked &&
+                    form.elements.end_date) {
+                pending.end_date = form.elements.end_date.value;
+            }
+            clearTimeout(timer);
+            timer = setTimeout(send, 500);
+        }
+        
+        form.addEventListener('input', queue);
+        form.addEventListener('change', queue);
+        form.addEventListener('submit', function() {
+            clearTimeout(timer);
+        });
+    });
+}
+
 // Add animation to dashboard cards
 function initDashboardCards() {
     document.querySelectorAll('.card').forEach(function(card) {
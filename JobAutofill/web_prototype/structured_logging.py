@@ -0,0 +1,165 @@
+"""Structured, non-blocking application logging.
+
+Request threads only filter a record and put it on an in-memory queue. A
+QueueListener thread does the formatting, PII redaction and I/O, writing one
+JSON object per line.
+
+Handlers log structured data with extra={'fields': {...}}. Profile fields are
+redacted wherever they appear in those fields. Levels and sample rates can be
+set per Flask endpoint with LOG_ENDPOINT_LEVELS and LOG_SAMPLE_RATES.
+"""
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import random
+import sys
+
+from flask import has_request_context, request
+from flask.logging import default_handler
+from flask_login import current_user
+
+from models import PERSONAL_INFO_FIELDS
+
+# Hot endpoints log at most this often unless configured otherwise
+DEFAULT_ENDPOINT_LEVELS = {}
+DEFAULT_SAMPLE_RATES = {
+    'get_profile_api': 0.1,
+    'get_profile_api_public': 0.01,
+}
+
+# Keys whose values never reach the log, in both the form (snake_case) and extension (camelCase) spellings
+PII_KEYS = frozenset(PERSONAL_INFO_FIELDS) | {
+    'firstName', 'lastName', 'phoneType', 'fullName', 'middleName',
+    'responsibilities', 'achievements', 'gpa', 'location',
+}
+
+def _camel_to_snake(key):
+    return ''.join('_' + char.lower() if char.isupper() else char for char in key)
+
+def redact(value):
+    """Copy of value with every PII key's value replaced by a placeholder"""
+    if isinstance(value, dict):
+        return {key: _redact_value(key, item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+def _redact_value(key, value):
+    if isinstance(key, str) and (key in PII_KEYS or _camel_to_snake(key) in PII_KEYS):
+        if value in (None, ''):
+            return value
+        return f'[redacted {len(str(value))} chars]'
+    return redact(value)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with redacted structured fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for attribute in ('endpoint', 'method', 'path', 'user_id'):
+            value = getattr(record, attribute, None)
+            if value is not None:
+                entry[attribute] = value
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry['fields'] = redact(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class EndpointFilter(logging.Filter):
+    """Applies per-endpoint levels and sampling, and tags records with request context
+
+    Runs on the request thread, so it stays cheap: a dict lookup, a random
+    draw and a few attribute copies.
+    """
+
+    def __init__(self, levels, sample_rates):
+        super().__init__()
+        self.levels = {endpoint: level if isinstance(level, int) else logging.getLevelName(level.upper())
+                       for endpoint, level in levels.items()}
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        endpoint = request.endpoint
+        if record.levelno < self.levels.get(endpoint, logging.NOTSET):
+            return False
+        # Warnings and errors are always kept
+        rate = self.sample_rates.get(endpoint)
+        if rate is not None and record.levelno < logging.WARNING and random.random() >= rate:
+            return False
+
+        record.endpoint = endpoint
+        record.method = request.method
+        record.path = request.path
+        if current_user.is_authenticated:
+            record.user_id = current_user.get_id()
+        return True
+
+class InProcessQueueHandler(QueueHandler):
+    """Enqueue the record untouched; message formatting happens on the listener thread
+
+    The stock QueueHandler formats on the calling thread so records can be
+    pickled across processes. Our queue never leaves the process.
+    """
+
+    def __init__(self, log_queue, listener):
+        super().__init__(log_queue)
+        self.listener = listener
+
+    def prepare(self, record):
+        return record
+
+    def close(self):
+        # Drains the queue and closes the output, both when the handler is replaced and from
+        # logging.shutdown at exit, which runs after every other atexit hook has logged
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        super().close()
+
+def _remove_queue_handlers(logger):
+    for handler in list(logger.handlers):
+        if isinstance(handler, InProcessQueueHandler):
+            logger.removeHandler(handler)
+            handler.close()
+
+def init_app(app):
+    """Route app.logger through a background queue listener writing JSON lines
+
+    app.logger is one logger per process, so an app created later (tests,
+    benchmarks, the ASGI entry point) replaces the handler and listener of
+    the one before it instead of adding a second copy of every line.
+    """
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    levels = dict(DEFAULT_ENDPOINT_LEVELS, **app.config.get('LOG_ENDPOINT_LEVELS', {}))
+    sample_rates = dict(DEFAULT_SAMPLE_RATES, **app.config.get('LOG_SAMPLE_RATES', {}))
+
+    log_file = app.config.get('LOG_FILE')
+    output = logging.FileHandler(log_file) if log_file else logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    queue_handler = InProcessQueueHandler(log_queue, listener)
+    queue_handler.addFilter(EndpointFilter(levels, sample_rates))
+
+    _remove_queue_handlers(app.logger)
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(level)
+    app.logger.propagate = False
+
+    listener.start()
+    return listener
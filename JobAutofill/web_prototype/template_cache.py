@@ -0,0 +1,122 @@
+"""Jinja bytecode cache and fragment caching for the profile pages.
+
+Compiled templates are kept in instance/jinja_cache so a new process skips the
+parse and compile step.
+
+Templates cache per-section fragments with
+    {% cache 'employment', current_user.get_id(), section_versions.employment %}...{% endcache %}
+Section versions are bumped by the write routes, so an edit only invalidates
+the fragments for the section it touched. Lists passed to cached fragments
+should be wrapped in LazySequence, so the query only runs on a cache miss.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+import os
+import threading
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+DEFAULT_FRAGMENT_CACHE_SIZE = 2048
+NL2BR_CACHE_SIZE = 4096
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache key, ... %}...{% endcache %}; disabled when fragment_cache_enabled is False"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache(DEFAULT_FRAGMENT_CACHE_SIZE),
+                           fragment_cache_enabled=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        # The template name keeps identical keys in different templates apart
+        key_parts.insert(0, nodes.Const(parser.name))
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(key_parts)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+        key = tuple(key_parts)
+        fragment = self.environment.fragment_cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            self.environment.fragment_cache.set(key, fragment)
+        return fragment
+
+class LazySequence:
+    """List that is only loaded when a template actually uses it"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._items = None
+
+    def _load(self):
+        if self._items is None:
+            self._items = list(self._loader())
+        return self._items
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+@lru_cache(maxsize=NL2BR_CACHE_SIZE)
+def nl2br(text):
+    """Cached newline to <br> conversion for long responsibilities and achievements text"""
+    return Markup(text.replace('\n', '<br>'))
+
+def init_app(app):
+    """Attach the bytecode cache and fragment cache extension to the app's Jinja environment"""
+    cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = FragmentCache(app.config.get('FRAGMENT_CACHE_SIZE', DEFAULT_FRAGMENT_CACHE_SIZE))
+    app.jinja_env.fragment_cache_enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
@@ -0,0 +1,257 @@
+"""Background reconciliation of the upload store against document records.
+
+Each sweep works in batches of UPLOAD_SWEEP_BATCH_SIZE, committing after
+every batch:
+
+- files uploaded before content-addressed storage, which still sit directly
+  in UPLOAD_FOLDER, are moved into the store if a document uses them;
+- stored_files reference counts that drifted from the documents using them
+  are corrected, and rows no document uses are deleted with their blobs;
+- blobs and flat files that no row refers to, and abandoned temp uploads,
+  are deleted;
+- every profile's upload_bytes counter is recomputed in a single statement,
+  counting each distinct stored file a user's documents use once.
+
+Files and rows younger than UPLOAD_SWEEP_GRACE seconds are left alone, so an
+upload whose transaction has not committed yet is never taken for an orphan.
+Each sweep is recorded in storage_sweeps and summarized by GET
+/api/storage/stats.
+"""
+from datetime import datetime
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+
+import click
+from sqlalchemy import func, select
+
+import document_store
+from models import db, Document, Profile, StorageSweep, StoredFile
+
+DEFAULT_INTERVAL = 60 * 60
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_GRACE = 60 * 60
+
+# Only files named the way uploads used to be saved are ever removed from the top of UPLOAD_FOLDER
+LEGACY_FILENAME_RE = re.compile(r'^(?:resume|cover_letter)_')
+SHARD_RE = re.compile(r'^[0-9a-f]{2}$')
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(document_store.CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _remove(path):
+    """Delete a file, returning the bytes freed (0 if it was already gone)"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+class Sweep:
+    """One pass over the upload store; the counters end up in a StorageSweep row"""
+
+    def __init__(self, upload_folder, batch_size, grace):
+        self.upload_folder = upload_folder
+        self.batch_size = batch_size
+        self.cutoff = time.time() - grace
+        self.record = StorageSweep(started_at=datetime.now(), files_removed=0, bytes_reclaimed=0,
+                                   refs_fixed=0, documents_migrated=0, usage_fixed=0)
+
+    def run(self):
+        self.migrate_legacy_files()
+        self.reconcile_stored_files()
+        self.remove_orphaned_files()
+        self.record.usage_fixed = recompute_usage()
+        db.session.commit()
+        self.record.finished_at = datetime.now()
+        db.session.add(self.record)
+        db.session.commit()
+        return self.record
+
+    def _reclaimed(self, size):
+        self.record.files_removed += 1
+        self.record.bytes_reclaimed += size
+
+    def migrate_legacy_files(self):
+        last_pk = 0
+        while True:
+            documents = (Document.query.filter(Document.sha256.is_(None), Document.pk > last_pk)
+                         .order_by(Document.pk).limit(self.batch_size).all())
+            if not documents:
+                return
+            migrated = []
+            for document in documents:
+                path = os.path.join(self.upload_folder, document.filename)
+                if os.path.isfile(path):
+                    self._migrate(document, path)
+                    migrated.append(path)
+            last_pk = documents[-1].pk
+            db.session.commit()
+            # Originals go only once the documents point at their copies
+            for path in migrated:
+                _remove(path)
+
+    def _migrate(self, document, path):
+        sha256 = _hash_file(path)
+        stored = StoredFile.query.get(sha256)
+        if stored is None:
+            stored = StoredFile(sha256=sha256, size=os.path.getsize(path), ref_count=0)
+            db.session.add(stored)
+        target = document_store.blob_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target + '.migrating')
+            os.replace(target + '.migrating', target)
+        stored.ref_count += 1
+        document.sha256 = sha256
+        self.record.documents_migrated += 1
+
+    def reconcile_stored_files(self):
+        cutoff = datetime.fromtimestamp(self.cutoff)
+        references = (select(func.count(Document.pk)).where(Document.sha256 == StoredFile.sha256)
+                      .scalar_subquery())
+        last_sha256 = ''
+        while True:
+            rows = (db.session.query(StoredFile, references).filter(StoredFile.sha256 > last_sha256)
+                    .order_by(StoredFile.sha256).limit(self.batch_size).all())
+            if not rows:
+                return
+            for stored, count in rows:
+                if count == stored.ref_count:
+                    continue
+                # Conditional on the count read, so an upload or delete committed meanwhile wins
+                current = StoredFile.query.filter_by(sha256=stored.sha256, ref_count=stored.ref_count)
+                if count:
+                    self.record.refs_fixed += current.update({StoredFile.ref_count: count},
+                                                             synchronize_session=False)
+                elif stored.created_at < cutoff and self._is_stale(document_store.blob_path(stored.sha256)):
+                    if current.delete(synchronize_session=False):
+                        self._reclaimed(_remove(document_store.blob_path(stored.sha256)))
+            last_sha256 = rows[-1][0].sha256
+            db.session.commit()
+
+    def _is_stale(self, path):
+        # store_upload refreshes a blob's mtime whenever it is uploaded again
+        try:
+            return os.path.getmtime(path) < self.cutoff
+        except FileNotFoundError:
+            return True
+
+    def remove_orphaned_files(self):
+        if not os.path.isdir(self.upload_folder):
+            return
+        flat_files = []
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and LEGACY_FILENAME_RE.match(entry.name):
+                    flat_files.append(entry)
+                elif entry.is_dir() and entry.name == 'tmp':
+                    self._remove_stale_temp_files(entry.path)
+                elif entry.is_dir() and SHARD_RE.match(entry.name):
+                    self._remove_orphaned_blobs(entry.path)
+        # A flat file is still needed only by a document that has not been migrated
+        self._in_batches(flat_files, lambda names: {
+            filename for (filename,) in db.session.query(Document.filename)
+            .filter(Document.filename.in_(names), Document.sha256.is_(None))})
+
+    def _remove_stale_temp_files(self, folder):
+        # Temp files belong to uploads still in flight, or to requests that died mid-upload
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < self.cutoff:
+                    self._reclaimed(_remove(entry.path))
+
+    def _remove_orphaned_blobs(self, shard):
+        for root, _, _ in os.walk(shard):
+            self._in_batches([entry for entry in os.scandir(root) if entry.is_file()], lambda names: {
+                sha256 for (sha256,) in db.session.query(StoredFile.sha256).filter(StoredFile.sha256.in_(names))})
+
+    def _in_batches(self, entries, known_names):
+        """Delete old files among entries whose names known_names(batch of names) does not return"""
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            known = known_names([entry.name for entry in batch])
+            for entry in batch:
+                if entry.name not in known and entry.stat().st_mtime < self.cutoff:
+                    self._reclaimed(_remove(entry.path))
+
+def recompute_usage():
+    """Set every drifted upload_bytes counter from the stored files its documents use; returns the count fixed"""
+    # A file used by several of a user's documents is counted once, as store_upload charges it
+    user_files = select(Document.sha256).where(Document.user_id == Profile.user_id).correlate(Profile)
+    usage = (select(func.coalesce(func.sum(StoredFile.size), 0))
+             .where(StoredFile.sha256.in_(user_files)).scalar_subquery())
+    return Profile.query.filter(Profile.upload_bytes != usage).update(
+        {Profile.upload_bytes: usage}, synchronize_session=False)
+
+def sweep(app):
+    """Run one sweep over the app's upload folder and return its StorageSweep row"""
+    return Sweep(app.config['UPLOAD_FOLDER'],
+                 app.config.get('UPLOAD_SWEEP_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                 app.config.get('UPLOAD_SWEEP_GRACE', DEFAULT_GRACE)).run()
+
+def stats():
+    """The latest sweep and the totals over every recorded sweep"""
+    latest = StorageSweep.query.order_by(StorageSweep.started_at.desc()).first()
+    sweeps, files_removed, bytes_reclaimed = db.session.query(
+        func.count(StorageSweep.pk), func.coalesce(func.sum(StorageSweep.files_removed), 0),
+        func.coalesce(func.sum(StorageSweep.bytes_reclaimed), 0)).one()
+    return {
+        'latest': latest.to_dict() if latest is not None else None,
+        'sweeps': sweeps,
+        'files_removed': files_removed,
+        'bytes_reclaimed': bytes_reclaimed
+    }
+
+class UploadSweeper:
+    """Runs a sweep every interval seconds on a daemon thread"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='upload-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        # The first sweep waits a full interval so it never competes with startup
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    record = sweep(self.app)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Upload sweep failed')
+                    continue
+                self.app.logger.info('Upload sweep finished', extra={'fields': record.to_dict()})
+
+def init_app(app):
+    """Start the periodic sweeper (unless UPLOAD_SWEEP_INTERVAL is 0) and register the sweep-uploads CLI command"""
+
+    @app.cli.command('sweep-uploads')
+    def sweep_uploads():
+        """Reconcile the upload store with document records and delete orphaned files"""
+        record = sweep(app)
+        click.echo(f'Removed {record.files_removed} files ({record.bytes_reclaimed} bytes), '
+                   f'fixed {record.refs_fixed} reference counts and {record.usage_fixed} usage counters, '
+                   f'migrated {record.documents_migrated} documents')
+
+    interval = app.config.get('UPLOAD_SWEEP_INTERVAL', DEFAULT_INTERVAL)
+    if not interval:
+        return None
+    sweeper = app.extensions['upload_sweeper'] = UploadSweeper(app, interval)
+    sweeper.start()
+    return sweeper
@@ -0,0 +1,198 @@
+"""Content negotiation and compression for the profile API and static assets.
+
+Profile payloads can be sent as JSON, MessagePack (application/msgpack) or
+CBOR (application/cbor), chosen with the Accept header, and compressed with
+gzip or brotli according to Accept-Encoding. Every variant is built once per
+profile version and kept next to the JSON body in profile_cache.
+
+Static assets are compressed on first request (or ahead of time with
+``flask precompress-static``) into instance/static_compressed and served in
+place of the originals to clients that accept them.
+
+MessagePack, CBOR and brotli need the optional ``msgpack``, ``cbor2`` and
+``brotli`` packages; without them those formats are simply not offered.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import threading
+
+import click
+from flask import current_app, request, send_file
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from werkzeug.security import safe_join
+
+import profile_cache
+
+try:
+    import brotli
+except ImportError:  # brotli compression is optional
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # CBOR responses are optional
+    cbor2 = None
+
+# Bodies smaller than this gain nothing from compression
+COMPRESS_MIN_SIZE = 256
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+STATIC_BROTLI_QUALITY = 11
+COMPRESSIBLE_STATIC_TYPES = {'text/css', 'text/javascript', 'application/javascript', 'image/svg+xml',
+                             'application/json', 'text/html', 'text/plain'}
+
+JSON = 'application/json'
+MEDIA_TYPES = [JSON]
+if msgpack is not None:
+    MEDIA_TYPES.append('application/msgpack')
+if cbor2 is not None:
+    MEDIA_TYPES.append('application/cbor')
+
+CONTENT_CODINGS = (['br'] if brotli is not None else []) + ['gzip']
+
+# Identity variant: the cached JSON body as is
+IDENTITY = (JSON, None)
+
+def negotiate(accept, accept_encoding):
+    """Pick (media type, content coding or None) from Accept and Accept-Encoding header values"""
+    media_type = JSON
+    if accept:
+        # JSON is listed first, so it wins ties and */*
+        media_type = parse_accept_header(accept, MIMEAccept).best_match(MEDIA_TYPES) or JSON
+    return media_type, negotiate_coding(accept_encoding)
+
+def negotiate_coding(accept_encoding):
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(CONTENT_CODINGS)
+
+def compress(body, coding, brotli_quality=BROTLI_QUALITY):
+    if coding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    # mtime=0 keeps the output, and so its ETag, stable across processes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def encode_variant(json_body, etag, variant):
+    """Re-encode a serialized JSON payload and its ETag for a negotiated (media type, coding)
+
+    Returns (body, etag, coding); coding is None when the body was too small to compress.
+    """
+    media_type, coding = variant
+    if media_type == 'application/msgpack':
+        body = msgpack.packb(json.loads(json_body), use_bin_type=True)
+    elif media_type == 'application/cbor':
+        body = cbor2.dumps(json.loads(json_body))
+    else:
+        body = json_body
+    if len(body) < COMPRESS_MIN_SIZE:
+        coding = None
+    elif coding is not None:
+        body = compress(body, coding)
+    # Each representation of the same payload gets its own strong ETag
+    suffix = '' if media_type == JSON else '-' + media_type.rsplit('/', 1)[1]
+    if coding is not None:
+        suffix += '-' + coding
+    return body, etag + suffix, coding
+
+def represent(cache_key, version, cached, accept, accept_encoding):
+    """Negotiate a representation of a profile_cache payload; returns (body, etag, headers)
+
+    Encoded and compressed bodies are cached alongside the JSON for this version.
+    """
+    variant = negotiate(accept, accept_encoding)
+    body, etag = cached
+    coding = None
+    if variant != IDENTITY:
+        body, etag, coding = profile_cache.get_variant(cache_key, version, variant,
+                                                       lambda: encode_variant(body, etag, variant))
+    headers = [('Content-Type', variant[0]), ('Vary', 'Accept, Accept-Encoding')]
+    if coding is not None:
+        headers.append(('Content-Encoding', coding))
+    return body, etag, headers
+
+class StaticCompressor:
+    """Compressed copies of static files, kept up to date with the originals' mtimes"""
+
+    def __init__(self, static_folder, cache_dir):
+        self.static_folder = static_folder
+        self.cache_dir = cache_dir
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def compressed_path(self, filename, coding):
+        """Path of the compressed copy, or None if the file is missing, small or not compressible"""
+        source = safe_join(self.static_folder, filename)
+        if source is None:
+            return None
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        if stat.st_size < COMPRESS_MIN_SIZE or _guess_type(filename) not in COMPRESSIBLE_STATIC_TYPES:
+            return None
+
+        key = (filename, coding)
+        cached = self._paths.get(key)
+        if cached is not None and cached[0] == stat.st_mtime:
+            return cached[1]
+        target = os.path.join(self.cache_dir, filename + ('.br' if coding == 'br' else '.gz'))
+        with self._lock:
+            if not os.path.exists(target) or os.path.getmtime(target) < stat.st_mtime:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(source, 'rb') as f:
+                    data = compress(f.read(), coding, STATIC_BROTLI_QUALITY)
+                # Write then rename so concurrent workers never serve a partial file
+                temporary = f'{target}.{os.getpid()}.tmp'
+                with open(temporary, 'wb') as f:
+                    f.write(data)
+                os.replace(temporary, target)
+            self._paths[key] = (stat.st_mtime, target)
+        return target
+
+    def precompress_all(self):
+        count = 0
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                filename = os.path.relpath(os.path.join(root, name), self.static_folder)
+                for coding in CONTENT_CODINGS:
+                    if self.compressed_path(filename, coding) is not None:
+                        count += 1
+        return count
+
+def _guess_type(filename):
+    return mimetypes.guess_type(filename)[0]
+
+def init_app(app):
+    """Serve static files precompressed and register the precompress-static CLI command"""
+    compressor = StaticCompressor(app.static_folder,
+                                  app.config.get('STATIC_COMPRESSED_DIR') or
+                                  os.path.join(app.instance_path, 'static_compressed'))
+    app.extensions['static_compressor'] = compressor
+    serve_uncompressed = app.view_functions['static']
+
+    def static(filename):
+        coding = negotiate_coding(request.headers.get('Accept-Encoding'))
+        path = compressor.compressed_path(filename, coding) if coding else None
+        if path is None:
+            response = serve_uncompressed(filename=filename)
+        else:
+            response = send_file(path, mimetype=_guess_type(filename), conditional=True,
+                                 max_age=current_app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = coding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.cli.command('precompress-static')
+    def precompress_static():
+        """Write gzip (and brotli) copies of every compressible static file"""
+        click.echo(f'Compressed {compressor.precompress_all()} static file variants')